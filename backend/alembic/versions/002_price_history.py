@@ -0,0 +1,44 @@
+"""price history
+
+Revision ID: 002
+Revises: 001
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '002_price_history'
+down_revision: Union[str, None] = '001_initial'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _has_table(name: str) -> bool:
+    # Databases that predate migrations got their tables from create_all
+    return not context.is_offline_mode() and sa.inspect(op.get_bind()).has_table(name)
+
+
+def upgrade() -> None:
+    if _has_table('price_history'):
+        return
+    # Daily closes per symbol and provider
+    op.create_table(
+        'price_history',
+        sa.Column('id', sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column('symbol', sa.String(20), nullable=False),
+        sa.Column('source', sa.String(20), nullable=False),
+        sa.Column('date', sa.Date(), nullable=False),
+        sa.Column('close', sa.Numeric(precision=18, scale=8), nullable=False),
+        sa.UniqueConstraint('symbol', 'source', 'date', name='uq_price_history_symbol_source_date'),
+    )
+    op.create_index('ix_price_history_symbol_date', 'price_history', ['symbol', 'date'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_price_history_symbol_date', table_name='price_history')
+    op.drop_table('price_history')
@@ -0,0 +1,43 @@
+"""portfolio snapshots
+
+Revision ID: 003
+Revises: 002
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '003_portfolio_snapshots'
+down_revision: Union[str, None] = '002_price_history'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _has_table(name: str) -> bool:
+    # Databases that predate migrations got their tables from create_all
+    return not context.is_offline_mode() and sa.inspect(op.get_bind()).has_table(name)
+
+
+def upgrade() -> None:
+    if _has_table('portfolio_snapshots'):
+        return
+    # Daily portfolio valuations
+    op.create_table(
+        'portfolio_snapshots',
+        sa.Column('id', sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column('portfolio_id', sa.Integer(), sa.ForeignKey('portfolios.id'), nullable=False),
+        sa.Column('date', sa.Date(), nullable=False),
+        sa.Column('invested', sa.Numeric(precision=18, scale=8), nullable=False),
+        sa.Column('market_value', sa.Numeric(precision=18, scale=8), nullable=False),
+        sa.Column('holdings', sa.JSON(), nullable=False),
+        sa.UniqueConstraint('portfolio_id', 'date', name='uq_portfolio_snapshots_portfolio_date'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('portfolio_snapshots')
@@ -0,0 +1,240 @@
+"""tax lots and realized gains
+
+Revision ID: 004
+Revises: 003
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '004_tax_lots'
+down_revision: Union[str, None] = '003_portfolio_snapshots'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+cost_basis_method = sa.Enum('fifo', 'lifo', 'average', name='costbasismethod')
+
+# Tables as of this revision, for the data step
+portfolios = sa.table('portfolios', sa.column('id'), sa.column('cost_basis_method'))
+portfolio_entries = sa.table(
+    'portfolio_entries', sa.column('id'), sa.column('portfolio_id'), sa.column('purchase_price'), sa.column('realized_pl')
+)
+transactions = sa.table(
+    'transactions', sa.column('id'), sa.column('portfolio_entry_id'), sa.column('type'),
+    sa.column('quantity'), sa.column('price'), sa.column('date')
+)
+tax_lots = sa.table(
+    'tax_lots', sa.column('portfolio_entry_id'), sa.column('transaction_id'), sa.column('acquired_at'),
+    sa.column('quantity'), sa.column('remaining'), sa.column('cost_per_unit')
+)
+realized_gains = sa.table(
+    'realized_gains', sa.column('portfolio_entry_id'), sa.column('transaction_id'), sa.column('date'),
+    sa.column('quantity'), sa.column('proceeds'), sa.column('cost_basis'), sa.column('realized_pl')
+)
+
+
+def _inspector():
+    # Databases that predate migrations may have some of this from create_all
+    return None if context.is_offline_mode() else sa.inspect(op.get_bind())
+
+
+def _least(a, b):
+    return sa.case((a < b, a), else_=b)
+
+
+def _greatest(a, b):
+    return sa.case((a > b, a), else_=b)
+
+
+def _running(side: str, name: str):
+    """
+    Buys or sells of FIFO entries with their position on the entry's
+    running total of that side: [start, end) in date order
+    """
+    quantity = sa.func.coalesce(transactions.c.quantity, 0)
+    end = sa.func.sum(quantity).over(
+        partition_by=transactions.c.portfolio_entry_id,
+        order_by=(transactions.c.date, transactions.c.id),
+    )
+    return (
+        sa.select(
+            transactions.c.id,
+            transactions.c.portfolio_entry_id,
+            sa.func.coalesce(transactions.c.date, sa.func.current_timestamp()).label('date'),
+            quantity.label('quantity'),
+            sa.func.coalesce(transactions.c.price, 0).label('price'),
+            (end - quantity).label('start'),
+            end.label('end'),
+        )
+        .select_from(
+            transactions
+            .join(portfolio_entries, portfolio_entries.c.id == transactions.c.portfolio_entry_id)
+            .join(portfolios, portfolios.c.id == portfolio_entries.c.portfolio_id)
+        )
+        .where(
+            transactions.c.type == sa.literal_column(f"'{side}'"),
+            portfolios.c.cost_basis_method == sa.literal_column("'fifo'"),
+        )
+        .subquery(name)
+    )
+
+
+def backfill_statements() -> list:
+    """
+    Lots, realized rows and realized totals for transactions recorded before
+    this revision, as plain INSERT ... SELECT / UPDATE statements (so they
+    also work with --sql). Every portfolio is FIFO when the column is added,
+    and in FIFO order a sell that its earlier buys cover takes exactly the
+    buys' running-total range [sold before, sold after): lots and cost
+    basis are overlaps of those ranges. Transactions that already have a
+    lot / realized row are skipped.
+    """
+    buys = _running('buy', 'buys')
+    sold = (
+        sa.select(
+            transactions.c.portfolio_entry_id,
+            sa.func.sum(sa.func.coalesce(transactions.c.quantity, 0)).label('quantity'),
+        )
+        .where(transactions.c.type == sa.literal_column("'sell'"))
+        .group_by(transactions.c.portfolio_entry_id)
+        .subquery('sold')
+    )
+    sold_quantity = sa.func.coalesce(sold.c.quantity, 0)
+    lots = (
+        sa.select(
+            buys.c.portfolio_entry_id,
+            buys.c.id,
+            buys.c.date,
+            buys.c.quantity,
+            buys.c.end - _greatest(buys.c.start, _least(buys.c.end, sold_quantity)),
+            buys.c.price,
+        )
+        .select_from(buys.outerjoin(sold, sold.c.portfolio_entry_id == buys.c.portfolio_entry_id))
+        .where(~sa.exists().where(tax_lots.c.transaction_id == buys.c.id))
+    )
+
+    matched_buys, matched_sells = _running('buy', 'matched_buys'), _running('sell', 'matched_sells')
+    overlap = (
+        _least(matched_buys.c.end, matched_sells.c.end) - _greatest(matched_buys.c.start, matched_sells.c.start)
+    )
+    matched = (
+        sa.select(
+            matched_sells.c.id,
+            sa.func.sum(overlap).label('covered'),
+            sa.func.sum(overlap * matched_buys.c.price).label('cost'),
+        )
+        .select_from(matched_sells.join(matched_buys, sa.and_(
+            matched_buys.c.portfolio_entry_id == matched_sells.c.portfolio_entry_id,
+            matched_buys.c.start < matched_sells.c.end,
+            matched_buys.c.end > matched_sells.c.start,
+        )))
+        .group_by(matched_sells.c.id)
+        .subquery('matched')
+    )
+    sells = _running('sell', 'sells')
+    proceeds = sells.c.quantity * sells.c.price
+    # Quantity without lots (shouldn't happen) is costed at the entry's average
+    cost_basis = (
+        sa.func.coalesce(matched.c.cost, 0)
+        + (sells.c.quantity - sa.func.coalesce(matched.c.covered, 0)) * portfolio_entries.c.purchase_price
+    )
+    gains = (
+        sa.select(
+            sells.c.portfolio_entry_id,
+            sells.c.id,
+            sells.c.date,
+            sells.c.quantity,
+            proceeds,
+            cost_basis,
+            proceeds - cost_basis,
+        )
+        .select_from(
+            sells
+            .join(portfolio_entries, portfolio_entries.c.id == sells.c.portfolio_entry_id)
+            .outerjoin(matched, matched.c.id == sells.c.id)
+        )
+        .where(~sa.exists().where(realized_gains.c.transaction_id == sells.c.id))
+    )
+
+    entry_gains = realized_gains.c.portfolio_entry_id == portfolio_entries.c.id
+    return [
+        tax_lots.insert().from_select(
+            ['portfolio_entry_id', 'transaction_id', 'acquired_at', 'quantity', 'remaining', 'cost_per_unit'], lots
+        ),
+        realized_gains.insert().from_select(
+            ['portfolio_entry_id', 'transaction_id', 'date', 'quantity', 'proceeds', 'cost_basis', 'realized_pl'],
+            gains
+        ),
+        portfolio_entries.update()
+        .values(realized_pl=sa.select(sa.func.sum(realized_gains.c.realized_pl)).where(entry_gains).scalar_subquery())
+        .where(sa.exists().where(entry_gains)),
+    ]
+
+
+def upgrade() -> None:
+    inspector = _inspector()
+    tables = set(inspector.get_table_names()) if inspector else set()
+
+    def has_column(table: str, column: str) -> bool:
+        return inspector is not None and column in {c['name'] for c in inspector.get_columns(table)}
+
+    cost_basis_method.create(op.get_bind(), checkfirst=inspector is not None)
+    if not has_column('portfolios', 'cost_basis_method'):
+        op.add_column('portfolios', sa.Column(
+            'cost_basis_method', cost_basis_method, nullable=False, server_default='fifo'
+        ))
+    if not has_column('portfolio_entries', 'realized_pl'):
+        op.add_column('portfolio_entries', sa.Column(
+            'realized_pl', sa.Numeric(precision=18, scale=8), nullable=True, server_default='0'
+        ))
+
+    if 'tax_lots' not in tables:
+        _create_tables()
+
+    # Lots and realized rows for the transactions recorded so far
+    for statement in backfill_statements():
+        op.execute(statement)
+
+
+def _create_tables() -> None:
+    # Open lots per buy transaction
+    op.create_table(
+        'tax_lots',
+        sa.Column('id', sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column('portfolio_entry_id', sa.Integer(), sa.ForeignKey('portfolio_entries.id'), nullable=False),
+        sa.Column('transaction_id', sa.String(36), sa.ForeignKey('transactions.id'), nullable=False),
+        sa.Column('acquired_at', sa.DateTime(), nullable=False),
+        sa.Column('quantity', sa.Numeric(precision=18, scale=8), nullable=False),
+        sa.Column('remaining', sa.Numeric(precision=18, scale=8), nullable=False),
+        sa.Column('cost_per_unit', sa.Numeric(precision=18, scale=8), nullable=False),
+    )
+    op.create_index('ix_tax_lots_entry_acquired', 'tax_lots', ['portfolio_entry_id', 'acquired_at'])
+
+    # Realized P&L per sell transaction
+    op.create_table(
+        'realized_gains',
+        sa.Column('id', sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column('portfolio_entry_id', sa.Integer(), sa.ForeignKey('portfolio_entries.id'), nullable=False),
+        sa.Column('transaction_id', sa.String(36), sa.ForeignKey('transactions.id'), nullable=False),
+        sa.Column('date', sa.DateTime(), nullable=False),
+        sa.Column('quantity', sa.Numeric(precision=18, scale=8), nullable=False),
+        sa.Column('proceeds', sa.Numeric(precision=18, scale=8), nullable=False),
+        sa.Column('cost_basis', sa.Numeric(precision=18, scale=8), nullable=False),
+        sa.Column('realized_pl', sa.Numeric(precision=18, scale=8), nullable=False),
+    )
+    op.create_index('ix_realized_gains_entry_date', 'realized_gains', ['portfolio_entry_id', 'date'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_realized_gains_entry_date', 'realized_gains')
+    op.drop_table('realized_gains')
+    op.drop_index('ix_tax_lots_entry_acquired', 'tax_lots')
+    op.drop_table('tax_lots')
+    op.drop_column('portfolio_entries', 'realized_pl')
+    op.drop_column('portfolios', 'cost_basis_method')
+    cost_basis_method.drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,47 @@
+"""export jobs
+
+Revision ID: 005
+Revises: 004
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '005_export_jobs'
+down_revision: Union[str, None] = '004_tax_lots'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _has_table(name: str) -> bool:
+    # Databases that predate migrations got their tables from create_all
+    return not context.is_offline_mode() and sa.inspect(op.get_bind()).has_table(name)
+
+
+def upgrade() -> None:
+    if _has_table('export_jobs'):
+        return
+    # Background full-account export archives
+    op.create_table(
+        'export_jobs',
+        sa.Column('id', sa.String(36), primary_key=True),
+        sa.Column('user_id', sa.String(36), sa.ForeignKey('users.id'), nullable=False),
+        sa.Column('status', sa.Enum('queued', 'running', 'done', 'failed', 'expired', name='exportstatus'), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('started_at', sa.DateTime(), nullable=True),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+        sa.Column('size_bytes', sa.Integer(), nullable=True),
+        sa.Column('error', sa.Text(), nullable=True),
+    )
+    op.create_index('ix_export_jobs_user_status', 'export_jobs', ['user_id', 'status'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_export_jobs_user_status', 'export_jobs')
+    op.drop_table('export_jobs')
+    sa.Enum(name='exportstatus').drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,46 @@
+"""indexes for the hot query paths
+
+Revision ID: 006
+Revises: 005
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '006_query_indexes'
+down_revision: Union[str, None] = '005_export_jobs'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _create_index(name: str, table: str, columns: list) -> None:
+    # Databases that predate migrations may have it from create_all
+    if not context.is_offline_mode():
+        if name in {index['name'] for index in sa.inspect(op.get_bind()).get_indexes(table)}:
+            return
+    op.create_index(name, table, columns)
+
+
+def upgrade() -> None:
+    # A user's portfolios in creation order (list, dashboard)
+    _create_index('ix_portfolios_user_created', 'portfolios', ['user_id', 'created_at', 'id'])
+    # A portfolio's entries in id order (entries, summary, exports)
+    _create_index('ix_portfolio_entries_portfolio', 'portfolio_entries', ['portfolio_id', 'id'])
+    # An entry's transactions by date (history, lots, first-transaction lookups)
+    _create_index('ix_transactions_entry_date', 'transactions', ['portfolio_entry_id', 'date'])
+    _create_index('ix_budget_categories_user', 'budget_categories', ['user_id'])
+    # A user's budget transactions newest first / since a period start
+    _create_index('ix_budget_transactions_user_date', 'budget_transactions', ['user_id', 'date'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_budget_transactions_user_date', 'budget_transactions')
+    op.drop_index('ix_budget_categories_user', 'budget_categories')
+    op.drop_index('ix_transactions_entry_date', 'transactions')
+    op.drop_index('ix_portfolio_entries_portfolio', 'portfolio_entries')
+    op.drop_index('ix_portfolios_user_created', 'portfolios')
@@ -1,32 +1,113 @@
+import os
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
+from sqlalchemy import and_
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from app.db import get_db
-from app.models import User
+from app.models import User, Portfolio
 from app.auth import SECRET_KEY, ALGORITHM
+from app.user_cache import Principal, user_cache
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/login")
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)) -> User:
-    credentials_exception = HTTPException(
+# Comma-separated emails allowed to use /admin endpoints
+ADMIN_EMAILS = {
+    email.strip().lower()
+    for email in os.getenv("ADMIN_EMAILS", "").split(",")
+    if email.strip()
+}
+
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Invalid authentication",
         headers={"WWW-Authenticate": "Bearer"},
     )
 
+
+def token_subject(token: str) -> str:
+    """User id (JWT `sub`) of a valid access token"""
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id = payload.get("sub")
-        if user_id is None:
-            raise credentials_exception
     except JWTError:
-        raise credentials_exception
+        raise _credentials_exception()
+    user_id = payload.get("sub")
+    if user_id is None:
+        raise _credentials_exception()
+    return user_id
+
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)) -> User:
+    """The full User row (routes that only need the id should use get_principal)"""
+    user_id = token_subject(token)
 
     result = await db.execute(select(User).where(User.id == user_id))
     user = result.scalars().first()
     if user is None:
-        raise credentials_exception
+        raise _credentials_exception()
+
+    await user_cache.set(Principal(user.id, user.email))
+    return user
+
+
+async def get_principal(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)) -> Principal:
+    """
+    Id and email of the token's user, from the user cache when possible
+    (no database round trip on a hit).
+    """
+    user_id = token_subject(token)
+    principal = await user_cache.get(user_id)
+    if principal is not None:
+        return principal
+
+    row = (await db.execute(select(User.id, User.email).where(User.id == user_id))).first()
+    if row is None:
+        raise _credentials_exception()
+
+    principal = Principal(row.id, row.email)
+    await user_cache.set(principal)
+    return principal
+
+
+async def get_user_portfolio(
+    portfolio_id: int,
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_db)
+) -> Portfolio:
+    """
+    The path's portfolio if it belongs to the token's user.
+
+    One query either way: the portfolio alone when the user is in the user
+    cache, otherwise user and portfolio together (users LEFT JOIN
+    portfolios), which also fills the cache. FastAPI caches the result per
+    request, so other dependencies can depend on it without re-querying.
+    401 for an unknown user, 404 for a missing or foreign portfolio.
+    """
+    user_id = token_subject(token)
+    principal = await user_cache.get(user_id)
+    if principal is not None:
+        portfolio = (await db.execute(
+            select(Portfolio).where(Portfolio.id == portfolio_id, Portfolio.user_id == principal.id)
+        )).scalars().first()
+    else:
+        row = (await db.execute(
+            select(User.id, User.email, Portfolio)
+            .outerjoin(Portfolio, and_(Portfolio.user_id == User.id, Portfolio.id == portfolio_id))
+            .where(User.id == user_id)
+        )).first()
+        if row is None:
+            raise _credentials_exception()
+        await user_cache.set(Principal(row.id, row.email))
+        portfolio = row.Portfolio
+    if portfolio is None:
+        raise HTTPException(status_code=404, detail="Portfolio not found")
+
+    return portfolio
+
 
+async def get_admin_user(user: Principal = Depends(get_principal)) -> Principal:
+    if user.email.lower() not in ADMIN_EMAILS:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
     return user
@@ -0,0 +1,259 @@
+"""
+Background full-account export jobs (export_jobs table).
+
+POST /exports stores a queued job; a small in-process worker pool builds a
+zip archive on local disk with one CSV per portfolio plus the whole budget
+history, and GET /exports/{id} reports the state from the database.
+
+- archives are streamed to disk: every CSV chunk from app.exports goes
+  straight into the zip member (compressed in a thread), nothing is
+  buffered per file; the archive appears under its final name only when
+  complete
+- EXPORT_WORKERS bounds how many archives are built at once, and so how
+  many pooled DB connections exports can hold; each user can have
+  EXPORT_MAX_ACTIVE_PER_USER jobs queued or running (counted and inserted
+  in one conditional statement), and the queue is capped at EXPORT_QUEUE_MAX
+- a job is claimed with a conditional UPDATE, so queued jobs re-enqueued
+  after a restart run once even with several uvicorn workers
+- finished archives are deleted after EXPORT_TTL_HOURS
+
+Started and stopped from the app lifespan (see main.py).
+"""
+import asyncio
+import logging
+import os
+import re
+import tempfile
+import uuid
+import zipfile
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+
+from sqlalchemy import func, insert, literal, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db import AsyncSessionLocal
+from app.models import ExportJob, ExportStatus, Portfolio, User
+from app import exports
+from app.user_cache import Principal
+
+logger = logging.getLogger(__name__)
+
+EXPORT_DIR = os.getenv("EXPORT_DIR", os.path.join(tempfile.gettempdir(), "dilfwallet-exports"))
+EXPORT_WORKERS = int(os.getenv("EXPORT_WORKERS", "1"))
+EXPORT_QUEUE_MAX = int(os.getenv("EXPORT_QUEUE_MAX", "100"))
+EXPORT_MAX_ACTIVE_PER_USER = int(os.getenv("EXPORT_MAX_ACTIVE_PER_USER", "1"))
+EXPORT_TTL_HOURS = float(os.getenv("EXPORT_TTL_HOURS", "24"))
+# A job 'running' for longer than this was cut off by a restart
+EXPORT_STALE_MINUTES = 30
+
+ACTIVE_STATUSES = (ExportStatus.queued, ExportStatus.running)
+
+_queue: Optional[asyncio.Queue] = None
+_workers: list[asyncio.Task] = []
+
+
+def archive_path(job_id: uuid.UUID) -> str:
+    return os.path.join(EXPORT_DIR, f"{job_id}.zip")
+
+
+def enqueue(job_id: uuid.UUID) -> bool:
+    """
+    Hand a stored job to the local workers. Returns False when no workers
+    run here or the queue is full; the job stays queued in the database and
+    is picked up on the next start().
+    """
+    if _queue is None:
+        return False
+    try:
+        _queue.put_nowait(job_id)
+        return True
+    except asyncio.QueueFull:
+        return False
+
+
+def queue_full() -> bool:
+    return _queue is not None and _queue.full()
+
+
+async def create_job(db: AsyncSession, user_id: uuid.UUID) -> Optional[ExportJob]:
+    """
+    Store a queued job for the user, or return None when they already have
+    EXPORT_MAX_ACTIVE_PER_USER active ones. The count and the insert are one
+    INSERT ... SELECT, run under a lock on the user's row (FOR UPDATE on
+    PostgreSQL), so concurrent requests can't both pass the limit.
+    """
+    await db.execute(select(User.id).where(User.id == user_id).with_for_update())
+    active = select(func.count()).select_from(ExportJob).where(
+        ExportJob.user_id == user_id,
+        ExportJob.status.in_(ACTIVE_STATUSES)
+    ).scalar_subquery()
+    job_id = uuid.uuid4()
+    columns = ExportJob.__table__.c
+    row = select(
+        literal(job_id, columns.id.type),
+        literal(user_id, columns.user_id.type),
+        literal(ExportStatus.queued, columns.status.type),
+        literal(datetime.utcnow(), columns.created_at.type),
+    ).where(active < EXPORT_MAX_ACTIVE_PER_USER)
+    inserted = await db.execute(
+        insert(ExportJob).from_select(["id", "user_id", "status", "created_at"], row)
+    )
+    await db.commit()
+    if inserted.rowcount != 1:
+        return None
+    return await db.get(ExportJob, job_id)
+
+
+def _member_name(portfolio: Portfolio) -> str:
+    safe = re.sub(r"[^\w.-]+", "_", portfolio.name).strip("_") or "portfolio"
+    return f"portfolios/{portfolio.id}_{safe}.csv"
+
+
+async def _write_member(archive: zipfile.ZipFile, name: str, body) -> None:
+    """Stream text chunks into one zip member"""
+    with archive.open(name, "w", force_zip64=True) as member:
+        async for chunk in body:
+            await asyncio.to_thread(member.write, chunk.encode("utf-8"))
+
+
+async def _build(db: AsyncSession, job: ExportJob) -> int:
+    """Write the job's archive, returns its size in bytes"""
+    # Imported here: the route modules pull in the whole API
+    from app.routes_budget import budget_csv_parts
+    from app.routes_portfolio import portfolio_csv_parts
+
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    path = archive_path(job.id)
+    partial = path + ".part"
+    now = datetime.utcnow()
+
+    user = await db.get(User, job.user_id)
+    principal = Principal(user.id, user.email)
+    portfolios = (await db.execute(
+        select(Portfolio).where(Portfolio.user_id == job.user_id).order_by(Portfolio.id)
+    )).scalars().all()
+
+    try:
+        with zipfile.ZipFile(partial, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+            for portfolio in portfolios:
+                body = exports.csv_stream(db, portfolio_csv_parts(portfolio, now))
+                await _write_member(archive, _member_name(portfolio), body)
+            await _write_member(archive, "budget.csv", exports.csv_stream(db, budget_csv_parts(principal, "all", now)))
+        os.replace(partial, path)
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+    return os.path.getsize(path)
+
+
+async def run_job(job_id: uuid.UUID, session_factory: Callable[[], AsyncSession] = AsyncSessionLocal) -> None:
+    """Claim a queued job and build its archive (no-op if another worker got it first)"""
+    async with session_factory() as db:
+        claimed = await db.execute(
+            update(ExportJob)
+            .where(ExportJob.id == job_id, ExportJob.status == ExportStatus.queued)
+            .values(status=ExportStatus.running, started_at=datetime.utcnow())
+        )
+        await db.commit()
+        if claimed.rowcount != 1:
+            return
+
+        job = await db.get(ExportJob, job_id)
+        try:
+            size = await _build(db, job)
+        except Exception as e:
+            logger.error(f"❌ Export job {job_id} failed: {e}")
+            await db.rollback()
+            job = await db.get(ExportJob, job_id)
+            job.status = ExportStatus.failed
+            job.error = str(e)[:500]
+        else:
+            job.status = ExportStatus.done
+            job.size_bytes = size
+            logger.info(f"📦 Export job {job_id} done ({size} bytes)")
+        job.finished_at = datetime.utcnow()
+        await db.commit()
+
+
+async def cleanup(db: AsyncSession) -> int:
+    """Expire archives past EXPORT_TTL_HOURS and fail jobs cut off mid-run, returns jobs changed"""
+    now = datetime.utcnow()
+    expired = (await db.execute(
+        select(ExportJob).where(
+            ExportJob.status == ExportStatus.done,
+            ExportJob.finished_at < now - timedelta(hours=EXPORT_TTL_HOURS),
+        )
+    )).scalars().all()
+    for job in expired:
+        if os.path.exists(archive_path(job.id)):
+            os.remove(archive_path(job.id))
+        job.status = ExportStatus.expired
+
+    stale = await db.execute(
+        update(ExportJob)
+        .where(
+            ExportJob.status == ExportStatus.running,
+            ExportJob.started_at < now - timedelta(minutes=EXPORT_STALE_MINUTES),
+        )
+        .values(status=ExportStatus.failed, error="Interrupted", finished_at=now)
+    )
+    await db.commit()
+    return len(expired) + stale.rowcount
+
+
+async def _worker() -> None:
+    while True:
+        job_id = await _queue.get()
+        try:
+            await run_job(job_id)
+            async with AsyncSessionLocal() as db:
+                await cleanup(db)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Export worker error: {e}")
+        finally:
+            _queue.task_done()
+
+
+async def _resume() -> None:
+    """Re-enqueue jobs left queued by a previous process"""
+    try:
+        async with AsyncSessionLocal() as db:
+            await cleanup(db)
+            queued = (await db.execute(
+                select(ExportJob.id)
+                .where(ExportJob.status == ExportStatus.queued)
+                .order_by(ExportJob.created_at)
+            )).scalars().all()
+        for job_id in queued:
+            if not enqueue(job_id):
+                break
+    except Exception as e:
+        logger.error(f"Export job resume failed: {e}")
+
+
+def start() -> None:
+    """Start the worker pool (called from the app lifespan)"""
+    global _queue
+    if EXPORT_WORKERS <= 0 or _workers:
+        return
+    _queue = asyncio.Queue(maxsize=EXPORT_QUEUE_MAX)
+    _workers.extend(asyncio.create_task(_worker()) for _ in range(EXPORT_WORKERS))
+    _workers.append(asyncio.create_task(_resume()))
+    logger.info(f"✅ Export workers started ({EXPORT_WORKERS})")
+
+
+async def stop() -> None:
+    """Cancel the workers; unfinished jobs are retried or failed on the next start"""
+    global _queue
+    for task in _workers:
+        task.cancel()
+    for task in _workers:
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+    _workers.clear()
+    _queue = None
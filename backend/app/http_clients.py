@@ -0,0 +1,119 @@
+"""
+Shared, long-lived HTTP clients for upstream price providers.
+
+One client per provider is created in the app lifespan (see main.py) and
+reused by every lookup, so requests keep their TCP/TLS connections alive
+instead of reconnecting each time.
+
+- coingecko: httpx.AsyncClient (keep-alive, HTTP/2 when `h2` is installed)
+- yahoo: requests.Session handed to yfinance (runs in the thread pool)
+"""
+import logging
+from typing import Dict
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+
+def _http2_available() -> bool:
+    """HTTP/2 needs the optional `h2` package (httpx[http2])"""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+# Per-provider connection settings
+PROVIDER_SETTINGS = {
+    "coingecko": {
+        "timeout": httpx.Timeout(10.0, connect=5.0),
+        "limits": httpx.Limits(
+            max_connections=20,
+            max_keepalive_connections=10,
+            keepalive_expiry=60.0,
+        ),
+        "http2": True,
+    },
+    "yahoo": {
+        # yfinance passes its own request timeout; only the pool is configured here.
+        # Pool size matches the price_service thread pool.
+        "pool_connections": 4,
+        "pool_maxsize": 5,
+    },
+}
+
+_async_clients: Dict[str, httpx.AsyncClient] = {}
+_sync_sessions: Dict[str, requests.Session] = {}
+
+
+def create_client(provider: str) -> httpx.AsyncClient:
+    """Build a new async client with the provider's limits and timeouts"""
+    settings = PROVIDER_SETTINGS[provider]
+    return httpx.AsyncClient(
+        timeout=settings["timeout"],
+        limits=settings["limits"],
+        http2=settings.get("http2", False) and _http2_available(),
+        headers={"Accept": "application/json"},
+    )
+
+
+def create_session(provider: str) -> requests.Session:
+    """Build a pooled requests.Session for providers used through sync libraries"""
+    settings = PROVIDER_SETTINGS[provider]
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=settings["pool_connections"],
+        pool_maxsize=settings["pool_maxsize"],
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_client(provider: str) -> httpx.AsyncClient:
+    """
+    Get the shared async client for a provider.
+
+    Created lazily if the lifespan has not started it (scripts, tests).
+    """
+    client = _async_clients.get(provider)
+    if client is None or client.is_closed:
+        client = create_client(provider)
+        _async_clients[provider] = client
+    return client
+
+
+def get_session(provider: str) -> requests.Session:
+    """Get the shared sync session for a provider (created lazily)"""
+    session = _sync_sessions.get(provider)
+    if session is None:
+        session = create_session(provider)
+        _sync_sessions[provider] = session
+    return session
+
+
+async def startup() -> None:
+    """Open provider clients (called from the app lifespan)"""
+    get_client("coingecko")
+    get_session("yahoo")
+    logger.info(
+        f"✅ HTTP clients ready (HTTP/2: {'on' if _http2_available() else 'off'})"
+    )
+
+
+async def shutdown() -> None:
+    """Close all provider clients (called from the app lifespan)"""
+    for provider, client in list(_async_clients.items()):
+        try:
+            await client.aclose()
+        except Exception as e:
+            logger.warning(f"⚠️ Error closing {provider} HTTP client: {e}")
+    _async_clients.clear()
+
+    for session in _sync_sessions.values():
+        session.close()
+    _sync_sessions.clear()
@@ -1,5 +1,156 @@
-"""Shared rate limiter instance — used by main.py and route modules"""
-from slowapi import Limiter
-from slowapi.util import get_remote_address
+"""
+Per-user, cost-weighted rate limiting for the API.
 
-limiter = Limiter(key_func=get_remote_address)
+Every authenticated user (JWT sub, no database lookup) has
+RATE_LIMIT_POINTS points per RATE_LIMIT_WINDOW seconds. Routes declare
+what a call costs:
+
+    @router.get("/summary", dependencies=[Depends(rate_limit(COST_PRICED))])
+
+so reloading a live-priced summary or exporting in a loop runs out of
+budget long before listing endpoints would.
+
+Sliding window counter: counts are kept per fixed window and the previous
+window is weighted by how much of it still overlaps the sliding window,
+so there is no burst at window boundaries. Counters live in Redis (one
+EVAL per request, shared by all workers) when the price cache has a
+connection; without Redis, or while it fails, each worker counts locally.
+
+A rejected call costs nothing and gets 429 with Retry-After.
+"""
+import logging
+import math
+import os
+import threading
+import time
+from typing import Callable, Optional
+
+from fastapi import Depends, HTTPException, status
+
+from app.dependencies import oauth2_scheme, token_subject
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_POINTS = int(os.getenv("RATE_LIMIT_POINTS", "300"))
+RATE_LIMIT_WINDOW = float(os.getenv("RATE_LIMIT_WINDOW", "60"))
+
+# Route costs (points per call)
+COST_READ = 1       # lists and single rows
+COST_WRITE = 2      # creates / deletes
+COST_PRICED = 10    # live quotes for every holding (summary, dashboard)
+COST_BULK = 30      # full-history exports and imports
+
+# Returns {allowed, previous count, current count, seconds into the window}
+_HIT_SCRIPT = """
+local window = tonumber(ARGV[1])
+local limit = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local t = redis.call('time')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local index = math.floor(now / window)
+local elapsed = now - index * window
+local key = KEYS[1] .. ':' .. index
+local previous = tonumber(redis.call('get', KEYS[1] .. ':' .. (index - 1)) or '0')
+local current = tonumber(redis.call('get', key) or '0')
+if previous * (1 - elapsed / window) + current + cost > limit then
+    return {0, tostring(previous), tostring(current), tostring(elapsed)}
+end
+redis.call('incrbyfloat', key, cost)
+redis.call('expire', key, math.ceil(window * 2))
+return {1, tostring(previous), tostring(current + cost), tostring(elapsed)}
+"""
+
+
+def retry_after(previous: float, current: float, elapsed: float, cost: float, limit: float, window: float) -> float:
+    """Seconds until `cost` more points fit in the sliding window"""
+    carried = previous * (1 - elapsed / window)
+    excess = carried + current + cost - limit
+    if excess <= 0:
+        return 0.0
+    if excess <= carried:
+        # The previous window's share decays linearly
+        return excess / previous * window
+    # Wait for the current window to become the previous one, then for it to decay
+    if cost > limit:
+        return window * 2
+    decay = 0.0 if current + cost <= limit else (1 - (limit - cost) / current) * window
+    return window - elapsed + decay
+
+
+class SlidingWindowLimiter:
+    def __init__(self, points: int, window: float, redis_getter: Callable[[], object] = lambda: None):
+        self.points = points
+        self.window = window
+        self.enabled = True
+        self._redis_getter = redis_getter
+        # key -> [window index, previous count, current count]
+        self._local: dict[str, list] = {}
+        self._lock = threading.Lock()
+        self.rejected = 0
+
+    async def hit(self, key: str, cost: float) -> Optional[float]:
+        """Charge `cost` points to `key`: None if allowed, else seconds to wait"""
+        allowed, previous, current, elapsed = await self._count(key, cost)
+        if allowed:
+            return None
+        self.rejected += 1
+        return retry_after(previous, current, elapsed, cost, self.points, self.window)
+
+    async def _count(self, key: str, cost: float) -> tuple[bool, float, float, float]:
+        redis = self._redis_getter()
+        if redis is not None:
+            try:
+                allowed, previous, current, elapsed = await redis.eval(
+                    _HIT_SCRIPT, 1, f"rl:{key}", self.window, self.points, cost
+                )
+                return bool(int(allowed)), float(previous), float(current), float(elapsed)
+            except Exception as e:
+                logger.debug(f"Shared rate limit unavailable, counting locally: {e}")
+        return self._count_local(key, cost)
+
+    def _count_local(self, key: str, cost: float) -> tuple[bool, float, float, float]:
+        now = time.time()
+        index = math.floor(now / self.window)
+        elapsed = now - index * self.window
+        with self._lock:
+            if len(self._local) > 10_000:
+                self._local = {k: v for k, v in self._local.items() if v[0] >= index - 1}
+            state = self._local.get(key)
+            if state is None or state[0] < index - 1:
+                state = [index, 0.0, 0.0]
+            elif state[0] == index - 1:
+                state = [index, state[2], 0.0]
+            self._local[key] = state
+            _, previous, current = state
+            if previous * (1 - elapsed / self.window) + current + cost > self.points:
+                return False, previous, current, elapsed
+            state[2] = current + cost
+            return True, previous, state[2], elapsed
+
+    def reset(self) -> None:
+        with self._lock:
+            self._local.clear()
+
+
+def _redis():
+    # Shares the price cache's connection (one Redis client per process)
+    from app.price_service import cache
+    return cache._redis
+
+
+limiter = SlidingWindowLimiter(RATE_LIMIT_POINTS, RATE_LIMIT_WINDOW, _redis)
+
+
+def rate_limit(cost: float) -> Callable:
+    """Route dependency charging `cost` points to the token's user"""
+    async def charge(token: str = Depends(oauth2_scheme)) -> None:
+        if not limiter.enabled:
+            return
+        wait = await limiter.hit(token_subject(token), cost)
+        if wait is not None:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Rate limit exceeded",
+                headers={"Retry-After": str(max(1, math.ceil(wait)))},
+            )
+    return charge
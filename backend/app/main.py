@@ -13,10 +13,12 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from app.routes_auth import router as auth_router
 from app.routes_portfolio import router as portfolio_router
 from app.routes_budget import router as budget_router
-from app.models import Base
-from app.db import engine, get_db
+from app.routes_admin import router as admin_router
+from app.routes_exports import router as exports_router
+from app.db import get_db, AsyncSessionLocal
 from app.logging_config import setup_logging
 from app.middleware import register_error_handlers
+from app import export_jobs, http_clients, price_refresher, portfolio_snapshots, schema
 
 # Initialize structured logging (INFO level — safe for async)
 setup_logging()
@@ -27,15 +29,14 @@ logger = logging.getLogger(__name__)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    """Create database tables on startup with retry logic"""
+    """Migrate the database and create upstream HTTP clients on startup"""
     max_retries = 5
     retry_delay = 3
 
     for attempt in range(max_retries):
         try:
-            async with engine.begin() as conn:
-                await conn.run_sync(Base.metadata.create_all)
-            logger.info("✅ Database tables created successfully")
+            await schema.upgrade()
+            logger.info("✅ Database schema up to date")
             break
         except Exception as e:
             if attempt < max_retries - 1:
@@ -45,8 +46,22 @@ async def lifespan(app: FastAPI):
             else:
                 logger.error(f"❌ Failed to connect to database after {max_retries} attempts: {e}")
 
+    # Long-lived pooled clients for price providers
+    await http_clients.startup()
+    # Keep held symbols warm in the price cache
+    price_refresher.start()
+    # Daily portfolio valuations for /portfolios/{id}/history
+    portfolio_snapshots.start()
+    # Background full-account export archives
+    export_jobs.start()
+
     yield
 
+    await export_jobs.stop()
+    await portfolio_snapshots.stop()
+    await price_refresher.stop()
+    await http_clients.shutdown()
+
 
 app = FastAPI(
     title="DILFwallet API",
@@ -96,6 +111,8 @@ app.add_middleware(
 app.include_router(auth_router)
 app.include_router(portfolio_router)
 app.include_router(budget_router)
+app.include_router(admin_router)
+app.include_router(exports_router)
 
 
 # ========== Root ==========
@@ -129,3 +146,4 @@ async def health_check(db: AsyncSession = Depends(get_db)):
         "version": "2.2.0",
         "timestamp": datetime.now(timezone.utc).isoformat(),
     }
+
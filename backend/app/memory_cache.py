@@ -0,0 +1,143 @@
+"""
+Bounded in-process cache with LRU + TTL eviction.
+
+Used as the in-memory tier of the price cache. Expiry is based on
+time.monotonic (immune to wall-clock jumps, no datetime math per lookup)
+and every operation takes a lock, so the same instance can be shared by
+the event loop and executor threads.
+"""
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, NamedTuple, Optional, Tuple
+
+# How many expired entries to drop from the LRU head on each write
+_SWEEP_PER_SET = 8
+
+
+class _Entry(NamedTuple):
+    value: Any
+    expires_at: float   # clock() deadline
+    size: int           # approximate bytes (key + value)
+
+
+def _sizeof(obj: Any) -> int:
+    """Approximate footprint of small values (scalars, strings, flat tuples)"""
+    size = sys.getsizeof(obj)
+    if isinstance(obj, (tuple, list)):
+        size += sum(sys.getsizeof(item) for item in obj)
+    return size
+
+
+class BoundedTTLCache:
+    """
+    Thread-safe LRU cache bounded by entry count and approximate bytes.
+
+    Entries expire after their TTL (checked on read and swept from the
+    LRU end on write); when a budget is exceeded the least recently used
+    entries are evicted.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 10_000,
+        max_bytes: int = 16 * 1024 * 1024,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._clock = clock
+        self._data: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0      # dropped to stay within budget
+        self.expirations = 0    # dropped because their TTL passed
+
+    def now(self) -> float:
+        """Current reading of the cache clock (monotonic seconds)"""
+        return self._clock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry.expires_at <= self._clock():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry.value
+
+    def set(self, key: Hashable, value: Any, ttl_seconds: float) -> None:
+        size = _sizeof(key) + _sizeof(value)
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = _Entry(value, self._clock() + ttl_seconds, size)
+            self._bytes += size
+            self._sweep_expired()
+            while self._data and (len(self._data) > self.max_entries or self._bytes > self.max_bytes):
+                oldest = next(iter(self._data))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            entry = self._data.get(key)
+            return entry is not None and entry.expires_at > self._clock()
+
+    def items(self) -> List[Tuple[Hashable, Any]]:
+        """Snapshot of the unexpired (key, value) pairs, least recently used first (no LRU/counter updates)"""
+        with self._lock:
+            now = self._clock()
+            return [(key, entry.value) for key, entry in self._data.items() if entry.expires_at > now]
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "entries": len(self._data),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+            }
+
+    # Callers hold self._lock
+
+    def _remove(self, key: Hashable) -> None:
+        entry = self._data.pop(key)
+        self._bytes -= entry.size
+
+    def _sweep_expired(self) -> None:
+        now = self._clock()
+        for _ in range(_SWEEP_PER_SET):
+            if not self._data:
+                return
+            key, entry = next(iter(self._data.items()))
+            if entry.expires_at > now:
+                return
+            self._remove(key)
+            self.expirations += 1
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, DateTime, ForeignKey, Numeric, Enum, Integer, Float, TypeDecorator, Text
+from sqlalchemy import Column, String, Date, DateTime, ForeignKey, Numeric, Enum, Integer, Float, TypeDecorator, Text, Index, UniqueConstraint, JSON
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -40,6 +40,18 @@ class PortfolioType(enum.Enum):
     etf = "etf"
     metals = "metals"
 
+class CostBasisMethod(enum.Enum):
+    fifo = "fifo"
+    lifo = "lifo"
+    average = "average"
+
+class ExportStatus(enum.Enum):
+    queued = "queued"
+    running = "running"
+    done = "done"
+    failed = "failed"
+    expired = "expired"
+
 class BudgetType(enum.Enum):
     income = "income"
     expense = "expense"
@@ -64,34 +76,50 @@ class User(Base):
 class Portfolio(Base):
     """User's portfolio (can have multiple)"""
     __tablename__ = "portfolios"
+    __table_args__ = (
+        Index("ix_portfolios_user_created", "user_id", "created_at", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(GUID(), ForeignKey("users.id"), nullable=False)
     name = Column(String(100), nullable=False)
     type = Column(Enum(PortfolioType), nullable=False, default=PortfolioType.crypto)
+    # Which lots a sell closes (tax_lots); fixed once the portfolio has sells
+    cost_basis_method = Column(Enum(CostBasisMethod), nullable=False, default=CostBasisMethod.fifo)
     created_at = Column(DateTime, default=datetime.utcnow)
     
     owner = relationship("User", back_populates="portfolios")
     entries = relationship("PortfolioEntry", back_populates="portfolio", cascade="all, delete-orphan")
+    snapshots = relationship("PortfolioSnapshot", back_populates="portfolio", cascade="all, delete-orphan")
 
 
 class PortfolioEntry(Base):
     """Asset entry within a portfolio"""
     __tablename__ = "portfolio_entries"
+    __table_args__ = (
+        Index("ix_portfolio_entries_portfolio", "portfolio_id", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     portfolio_id = Column(Integer, ForeignKey("portfolios.id"), nullable=False)
     symbol = Column(String(20), index=True, nullable=False)
     amount = Column(Numeric(precision=18, scale=8), default=0)
     purchase_price = Column(Numeric(precision=18, scale=8), default=0)
+    # Running total of realized_gains.realized_pl
+    realized_pl = Column(Numeric(precision=18, scale=8), default=0)
 
     portfolio = relationship("Portfolio", back_populates="entries")
     transactions = relationship("Transaction", back_populates="portfolio_entry", cascade="all, delete-orphan")
+    tax_lots = relationship("TaxLot", back_populates="portfolio_entry", cascade="all, delete-orphan")
+    realized_gains = relationship("RealizedGain", back_populates="portfolio_entry", cascade="all, delete-orphan")
 
 
 class Transaction(Base):
     """Buy/Sell transaction for portfolio entry"""
     __tablename__ = "transactions"
+    __table_args__ = (
+        Index("ix_transactions_entry_date", "portfolio_entry_id", "date"),
+    )
     
     id = Column(GUID(), primary_key=True, default=uuid.uuid4)
     portfolio_entry_id = Column(Integer, ForeignKey("portfolio_entries.id"), nullable=False)
@@ -104,11 +132,89 @@ class Transaction(Base):
     portfolio_entry = relationship("PortfolioEntry", back_populates="transactions")
 
 
+class PortfolioSnapshot(Base):
+    """End-of-day valuation of a portfolio (one row per portfolio and day)"""
+    __tablename__ = "portfolio_snapshots"
+    __table_args__ = (
+        UniqueConstraint("portfolio_id", "date", name="uq_portfolio_snapshots_portfolio_date"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    portfolio_id = Column(Integer, ForeignKey("portfolios.id"), nullable=False)
+    date = Column(Date, nullable=False)
+    invested = Column(Numeric(precision=18, scale=8), nullable=False)
+    market_value = Column(Numeric(precision=18, scale=8), nullable=False)
+    # {symbol: {"quantity": ..., "cost": ..., "value": ...}} — also the
+    # starting state for the next day's incremental fill
+    holdings = Column(JSON, nullable=False, default=dict)
+
+    portfolio = relationship("Portfolio", back_populates="snapshots")
+
+
+class TaxLot(Base):
+    """Quantity bought by one buy transaction and how much of it is still held"""
+    __tablename__ = "tax_lots"
+    __table_args__ = (
+        Index("ix_tax_lots_entry_acquired", "portfolio_entry_id", "acquired_at"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    portfolio_entry_id = Column(Integer, ForeignKey("portfolio_entries.id"), nullable=False)
+    transaction_id = Column(GUID(), ForeignKey("transactions.id"), nullable=False)
+    acquired_at = Column(DateTime, nullable=False)
+    quantity = Column(Numeric(precision=18, scale=8), nullable=False)
+    remaining = Column(Numeric(precision=18, scale=8), nullable=False)
+    cost_per_unit = Column(Numeric(precision=18, scale=8), nullable=False)
+
+    portfolio_entry = relationship("PortfolioEntry", back_populates="tax_lots")
+    transaction = relationship("Transaction")
+
+
+class RealizedGain(Base):
+    """Realized P&L of one sell transaction (cost basis from the lots it closed)"""
+    __tablename__ = "realized_gains"
+    __table_args__ = (
+        Index("ix_realized_gains_entry_date", "portfolio_entry_id", "date"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    portfolio_entry_id = Column(Integer, ForeignKey("portfolio_entries.id"), nullable=False)
+    transaction_id = Column(GUID(), ForeignKey("transactions.id"), nullable=False)
+    date = Column(DateTime, nullable=False)
+    quantity = Column(Numeric(precision=18, scale=8), nullable=False)
+    proceeds = Column(Numeric(precision=18, scale=8), nullable=False)
+    cost_basis = Column(Numeric(precision=18, scale=8), nullable=False)
+    realized_pl = Column(Numeric(precision=18, scale=8), nullable=False)
+
+    portfolio_entry = relationship("PortfolioEntry", back_populates="realized_gains")
+    transaction = relationship("Transaction")
+
+
+# ========== Price History ==========
+
+class PriceHistory(Base):
+    """Daily close of a symbol from one provider (used for historical valuation)"""
+    __tablename__ = "price_history"
+    __table_args__ = (
+        UniqueConstraint("symbol", "source", "date", name="uq_price_history_symbol_source_date"),
+        Index("ix_price_history_symbol_date", "symbol", "date"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    symbol = Column(String(20), nullable=False)
+    source = Column(String(20), nullable=False)  # 'coingecko' | 'yahoo'
+    date = Column(Date, nullable=False)
+    close = Column(Numeric(precision=18, scale=8), nullable=False)
+
+
 # ========== Budget System ==========
 
 class BudgetCategory(Base):
     """Category for budget (income or expense)"""
     __tablename__ = "budget_categories"
+    __table_args__ = (
+        Index("ix_budget_categories_user", "user_id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(GUID(), ForeignKey("users.id"), nullable=False)
@@ -123,6 +229,9 @@ class BudgetCategory(Base):
 class BudgetTransaction(Base):
     """Income or expense transaction"""
     __tablename__ = "budget_transactions"
+    __table_args__ = (
+        Index("ix_budget_transactions_user_date", "user_id", "date"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(GUID(), ForeignKey("users.id"), nullable=False)
@@ -135,6 +244,25 @@ class BudgetTransaction(Base):
     category = relationship("BudgetCategory", back_populates="transactions")
 
 
+# ========== Export Jobs ==========
+
+class ExportJob(Base):
+    """Full-account export archive built in the background"""
+    __tablename__ = "export_jobs"
+    __table_args__ = (
+        Index("ix_export_jobs_user_status", "user_id", "status"),
+    )
+
+    id = Column(GUID(), primary_key=True, default=uuid.uuid4)
+    user_id = Column(GUID(), ForeignKey("users.id"), nullable=False)
+    status = Column(Enum(ExportStatus), nullable=False, default=ExportStatus.queued)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    size_bytes = Column(Integer, nullable=True)
+    error = Column(Text, nullable=True)
+
+
 # ========== Default Categories ==========
 
 DEFAULT_BUDGET_CATEGORIES = [
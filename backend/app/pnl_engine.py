@@ -0,0 +1,198 @@
+"""
+Vectorized P&L engine.
+
+Transactions are loaded column-wise into NumPy arrays (quantity, price,
+side, entry index) and every per-transaction and per-entry figure is
+computed with array operations and grouped reductions (np.bincount)
+instead of a Python loop over Decimal/float values.
+
+Used by the summary and dashboard endpoints:
+- per transaction: invested = quantity × price; buys get current value and
+  P&L against the current price, sells don't
+- per entry: running weighted average cost like the write path keeps on
+  PortfolioEntry (sells don't change it), holding = bought − sold,
+  invested = holding × average cost
+
+See benchmarks/bench_pnl.py for timings against the per-row loop.
+"""
+import math
+from typing import Iterable, NamedTuple, Optional, Sequence
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import PortfolioEntry, Transaction, TransactionType
+
+
+class TransactionArrays(NamedTuple):
+    """Transactions of a set of entries, one array per column"""
+    quantity: np.ndarray      # float64
+    price: np.ndarray         # float64
+    is_buy: np.ndarray        # bool
+    entry_index: np.ndarray   # int64, position of the entry in entry_ids
+    entry_ids: np.ndarray     # int64, entry id per entry index
+
+
+class TransactionPnL(NamedTuple):
+    """Per-transaction results (aligned with TransactionArrays)"""
+    invested: np.ndarray
+    current_price: np.ndarray     # NaN when unknown
+    current_value: np.ndarray     # NaN for sells / unknown price
+    profit_loss: np.ndarray
+    profit_loss_percentage: np.ndarray
+
+
+class EntryPnL(NamedTuple):
+    """Per-entry results (aligned with entry_ids)"""
+    bought: np.ndarray
+    sold: np.ndarray
+    amount: np.ndarray
+    avg_price: np.ndarray
+    invested: np.ndarray
+    current_value: np.ndarray     # falls back to invested without a price
+    profit_loss: np.ndarray       # NaN without a price
+    profit_loss_percentage: np.ndarray
+
+
+def from_rows(
+    rows: Iterable[tuple],
+    entry_ids: Sequence[int],
+) -> TransactionArrays:
+    """
+    Build arrays from (entry_id, quantity, price, TransactionType) rows.
+
+    Any order works for transaction_pnl; entry_pnl needs each entry's rows
+    oldest first (rows of different entries may interleave).
+    """
+    ids = np.asarray(entry_ids, dtype=np.int64)
+    position = {entry_id: i for i, entry_id in enumerate(ids.tolist())}
+    entry_col, qty_col, price_col, buy_col = [], [], [], []
+    for entry_id, quantity, price, tx_type in rows:
+        entry_col.append(position[entry_id])
+        qty_col.append(quantity or 0)
+        price_col.append(price or 0)
+        buy_col.append(tx_type == TransactionType.buy)
+    return TransactionArrays(
+        quantity=np.asarray(qty_col, dtype=np.float64),
+        price=np.asarray(price_col, dtype=np.float64),
+        is_buy=np.asarray(buy_col, dtype=bool),
+        entry_index=np.asarray(entry_col, dtype=np.int64),
+        entry_ids=ids,
+    )
+
+
+async def load_transactions(
+    db: AsyncSession,
+    portfolio_ids: Sequence[int],
+    entry_ids: Sequence[int],
+) -> TransactionArrays:
+    """
+    All transactions of the portfolios as arrays (one query, no ORM objects);
+    entry_ids lists the portfolios' entries, in the order results are wanted
+    """
+    result = await db.execute(
+        select(Transaction.portfolio_entry_id, Transaction.quantity, Transaction.price, Transaction.type)
+        .join(PortfolioEntry, PortfolioEntry.id == Transaction.portfolio_entry_id)
+        .where(PortfolioEntry.portfolio_id.in_(portfolio_ids))
+        .order_by(Transaction.date)
+    )
+    return from_rows(result.all(), entry_ids)
+
+
+def _pct(numerator: np.ndarray, denominator: np.ndarray) -> np.ndarray:
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(denominator > 0, numerator / denominator * 100, np.nan)
+
+
+def transaction_pnl(tx: TransactionArrays, entry_prices: np.ndarray) -> TransactionPnL:
+    """P&L of every transaction; entry_prices holds the current price per entry (NaN if unknown)"""
+    invested = tx.quantity * tx.price
+    current_price = entry_prices[tx.entry_index] if len(tx.entry_index) else np.empty(0)
+    valued = tx.is_buy & ~np.isnan(current_price)
+    current_value = np.where(valued, tx.quantity * current_price, np.nan)
+    profit_loss = current_value - invested
+    pct = np.where(valued, np.nan_to_num(_pct(profit_loss, invested)), np.nan)
+    return TransactionPnL(invested, current_price, current_value, profit_loss, pct)
+
+
+def _grouped_cumsum(values: np.ndarray, group: np.ndarray, n_groups: int) -> np.ndarray:
+    """Running sum restarting at every group (values sorted by group)"""
+    totals = np.bincount(group, weights=values, minlength=n_groups)
+    starts = np.concatenate(([0.0], np.cumsum(totals)[:-1]))
+    return np.cumsum(values) - starts[group]
+
+
+def entry_pnl(tx: TransactionArrays, entry_prices: np.ndarray) -> EntryPnL:
+    """
+    Per-entry position and P&L from grouped reductions over the transactions.
+
+    Cost basis follows the write path: buys add quantity × price, a sell
+    keeps the average price and so scales the remaining cost by
+    (1 − sold / held). That recurrence is solved per entry with grouped
+    cumulative sums of log factors instead of a loop; each entry's
+    transactions must be oldest first.
+    """
+    n = len(tx.entry_ids)
+    order = np.argsort(tx.entry_index, kind="stable")
+    group = tx.entry_index[order]
+    quantity, price, is_buy = tx.quantity[order], tx.price[order], tx.is_buy[order]
+
+    signed = np.where(is_buy, quantity, -quantity)
+    held_before = _grouped_cumsum(signed, group, n) - signed
+    with np.errstate(divide="ignore", invalid="ignore"):
+        keep = np.where(is_buy, 1.0, np.clip(1 - quantity / held_before, 0.0, 1.0))
+    keep = np.nan_to_num(keep, nan=1.0)
+
+    # A sell of the whole position resets the cost; only later buys count
+    reset = keep == 0
+    segment = _grouped_cumsum(reset.astype(np.float64), group, n)
+    last_segment = np.zeros(n)
+    np.maximum.at(last_segment, group, segment)
+    live = segment == last_segment[group]
+
+    log_keep = np.log(np.where(reset, 1.0, keep))
+    log_after = _grouped_cumsum(log_keep, group, n)
+    log_total = np.bincount(group, weights=log_keep, minlength=n)
+    added = np.where(is_buy & live, quantity * price, 0.0)
+    cost = np.bincount(group, weights=added * np.exp(log_total[group] - log_after), minlength=n)
+
+    buys = quantity * is_buy
+    bought = np.bincount(group, weights=buys, minlength=n)
+    sold = np.bincount(group, weights=quantity - buys, minlength=n)
+    amount = np.clip(bought - sold, 0.0, None)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        avg_price = np.where(amount > 0, cost / amount, 0.0)
+    invested = amount * avg_price
+
+    has_price = ~np.isnan(entry_prices)
+    current_value = np.where(has_price, amount * entry_prices, invested)
+    profit_loss = np.where(has_price, current_value - invested, np.nan)
+    return EntryPnL(
+        bought=bought,
+        sold=sold,
+        amount=amount,
+        avg_price=avg_price,
+        invested=invested,
+        current_value=current_value,
+        profit_loss=profit_loss,
+        profit_loss_percentage=_pct(profit_loss, invested),
+    )
+
+
+def group_totals(group: np.ndarray, n_groups: int, *values: np.ndarray) -> list:
+    """Sum each array per group (e.g. entries -> portfolio index)"""
+    return [np.bincount(group, weights=v, minlength=n_groups) for v in values]
+
+
+def prices_for_entries(entry_symbols: Sequence[str], prices: dict) -> np.ndarray:
+    """Current price per entry from {symbol: price or None} (NaN when unknown)"""
+    return np.asarray(
+        [prices.get(symbol) if prices.get(symbol) else np.nan for symbol in entry_symbols],
+        dtype=np.float64,
+    )
+
+
+def none_if_nan(value: float) -> Optional[float]:
+    """Array scalar or float -> float or None, for API responses"""
+    return None if math.isnan(value) else float(value)
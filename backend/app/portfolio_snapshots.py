@@ -0,0 +1,243 @@
+"""
+Daily portfolio valuation snapshots (portfolio_snapshots table).
+
+One row per portfolio and day with invested amount, market value and
+per-symbol holdings. Holdings are replayed from Transaction rows (average
+cost basis, like the summary) and valued at the day's close from
+app.price_history.
+
+Filling is incremental: it starts from the newest stored snapshot and only
+reads the transactions and closes of the days after it. A scheduled job
+(started from the app lifespan, like the price refresher) keeps every
+portfolio filled up to the last complete day; reads fill any gap first.
+"""
+import asyncio
+import logging
+import os
+import uuid
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Optional
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db import AsyncSessionLocal
+from app.models import Portfolio, PortfolioEntry, PortfolioSnapshot, Transaction, TransactionType
+from app import price_history, price_service
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOTS_ENABLED = os.getenv("PORTFOLIO_SNAPSHOTS_ENABLED", "true").lower() == "true"
+SNAPSHOT_INTERVAL_SECONDS = float(os.getenv("PORTFOLIO_SNAPSHOT_INTERVAL", "3600"))
+LEASE_NAME = "portfolio_snapshots"
+LEASE_TTL_MS = int(SNAPSHOT_INTERVAL_SECONDS * 2 * 1000)
+
+_worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+_task: Optional[asyncio.Task] = None
+
+
+async def _last_snapshot(db: AsyncSession, portfolio_id: int) -> Optional[PortfolioSnapshot]:
+    result = await db.execute(
+        select(PortfolioSnapshot)
+        .where(PortfolioSnapshot.portfolio_id == portfolio_id)
+        .order_by(PortfolioSnapshot.date.desc())
+        .limit(1)
+    )
+    return result.scalars().first()
+
+
+async def _first_transaction_day(db: AsyncSession, portfolio_id: int) -> Optional[date]:
+    first = await db.scalar(
+        select(func.min(Transaction.date))
+        .join(PortfolioEntry, PortfolioEntry.id == Transaction.portfolio_entry_id)
+        .where(PortfolioEntry.portfolio_id == portfolio_id)
+    )
+    return first.date() if first else None
+
+
+def _apply(holdings: Dict[str, Dict[str, float]], symbol: str, tx_type: TransactionType,
+           quantity: float, price: float) -> None:
+    """Apply one fill to {symbol: {quantity, cost}} with average-cost accounting"""
+    position = holdings.setdefault(symbol, {"quantity": 0.0, "cost": 0.0})
+    if tx_type == TransactionType.sell:
+        if position["quantity"] > 0:
+            avg_cost = position["cost"] / position["quantity"]
+            sold = min(quantity, position["quantity"])
+            position["cost"] -= sold * avg_cost
+            position["quantity"] -= sold
+    else:
+        position["quantity"] += quantity
+        position["cost"] += quantity * price
+    if position["quantity"] <= 1e-12:
+        del holdings[symbol]
+
+
+async def fill_snapshots(db: AsyncSession, portfolio: Portfolio, until: Optional[date] = None) -> int:
+    """
+    Store the missing daily snapshots of a portfolio up to `until`
+    (default: the last complete day). Returns the number of rows written.
+    """
+    end = min(until or price_history.last_complete_day(), price_history.last_complete_day())
+
+    last = await _last_snapshot(db, portfolio.id)
+    if last:
+        start = last.date + timedelta(days=1)
+        holdings = {
+            symbol: {"quantity": float(p["quantity"]), "cost": float(p["cost"])}
+            for symbol, p in last.holdings.items()
+        }
+    else:
+        start = await _first_transaction_day(db, portfolio.id)
+        holdings = {}
+    if start is None or start > end:
+        return 0
+
+    # Fills of the new days only, oldest first
+    result = await db.execute(
+        select(PortfolioEntry.symbol, Transaction.type, Transaction.quantity, Transaction.price, Transaction.date)
+        .join(PortfolioEntry, PortfolioEntry.id == Transaction.portfolio_entry_id)
+        .where(
+            PortfolioEntry.portfolio_id == portfolio.id,
+            Transaction.date >= datetime.combine(start, time.min),
+            Transaction.date < datetime.combine(end + timedelta(days=1), time.min),
+        )
+        .order_by(Transaction.date)
+    )
+    fills_by_day = defaultdict(list)
+    for symbol, tx_type, quantity, price, tx_date in result.all():
+        fills_by_day[tx_date.date()].append((symbol, tx_type, float(quantity or 0), float(price or 0)))
+
+    symbols = set(holdings) | {fill[0] for fills in fills_by_day.values() for fill in fills}
+    closes = await price_history.get_closes(db, sorted(symbols), portfolio.type.value, start, end) if symbols else {}
+
+    rows = []
+    day = start
+    while day <= end:
+        for symbol, tx_type, quantity, price in fills_by_day.get(day, []):
+            _apply(holdings, symbol, tx_type, quantity, price)
+
+        snapshot_holdings = {}
+        invested = market_value = 0.0
+        for symbol, position in holdings.items():
+            close = closes.get(symbol, {}).get(day)
+            # No close yet (e.g. listing day): value at cost, like the summary
+            value = position["quantity"] * close if close else position["cost"]
+            snapshot_holdings[symbol] = {**position, "value": value}
+            invested += position["cost"]
+            market_value += value
+
+        rows.append({
+            "portfolio_id": portfolio.id,
+            "date": day,
+            "invested": invested,
+            "market_value": market_value,
+            "holdings": snapshot_holdings,
+        })
+        day += timedelta(days=1)
+
+    try:
+        await db.execute(insert(PortfolioSnapshot), rows)
+        await db.commit()
+    except IntegrityError:
+        # Another request or the job filled the same days first
+        await db.rollback()
+        return 0
+    return len(rows)
+
+
+async def invalidate_snapshots(db: AsyncSession, portfolio_id: int, since: date) -> None:
+    """Drop snapshots from `since` on, e.g. after a back-dated transaction"""
+    await db.execute(
+        delete(PortfolioSnapshot).where(
+            PortfolioSnapshot.portfolio_id == portfolio_id,
+            PortfolioSnapshot.date >= since,
+        )
+    )
+
+
+async def get_history(
+    db: AsyncSession,
+    portfolio: Portfolio,
+    start: Optional[date],
+    end: Optional[date],
+    granularity: str = "day",
+) -> list[PortfolioSnapshot]:
+    """
+    Snapshots in [start, end] after filling any missing days.
+
+    granularity 'week' / 'month' keeps the last snapshot of each period.
+    """
+    await fill_snapshots(db, portfolio)
+
+    query = select(PortfolioSnapshot).where(PortfolioSnapshot.portfolio_id == portfolio.id)
+    if start:
+        query = query.where(PortfolioSnapshot.date >= start)
+    if end:
+        query = query.where(PortfolioSnapshot.date <= end)
+    snapshots = (await db.execute(query.order_by(PortfolioSnapshot.date))).scalars().all()
+
+    if granularity == "day":
+        return list(snapshots)
+
+    def period(day: date):
+        return day.isocalendar()[:2] if granularity == "week" else (day.year, day.month)
+
+    by_period: Dict[tuple, PortfolioSnapshot] = {}
+    for snapshot in snapshots:
+        by_period[period(snapshot.date)] = snapshot
+    return list(by_period.values())
+
+
+async def snapshot_all(db: AsyncSession) -> int:
+    """Fill snapshots for every portfolio with transactions, returns rows written"""
+    result = await db.execute(
+        select(Portfolio)
+        .where(Portfolio.id.in_(select(PortfolioEntry.portfolio_id).join(Transaction)))
+    )
+    written = 0
+    for portfolio in result.scalars().all():
+        try:
+            written += await fill_snapshots(db, portfolio)
+        except Exception as e:
+            await db.rollback()
+            logger.error(f"Snapshot fill failed for portfolio {portfolio.id}: {e}")
+    return written
+
+
+async def _run():
+    while True:
+        try:
+            if await price_service.cache.acquire_lease(LEASE_NAME, _worker_id, LEASE_TTL_MS):
+                async with AsyncSessionLocal() as db:
+                    written = await snapshot_all(db)
+                if written:
+                    logger.info(f"📸 Stored {written} portfolio snapshots")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Portfolio snapshot job error: {e}")
+        await asyncio.sleep(SNAPSHOT_INTERVAL_SECONDS)
+
+
+def start() -> None:
+    """Start the snapshot job (called from the app lifespan)"""
+    global _task
+    if not SNAPSHOTS_ENABLED or (_task and not _task.done()):
+        return
+    _task = asyncio.create_task(_run())
+    logger.info("✅ Portfolio snapshot job started")
+
+
+async def stop() -> None:
+    """Stop the job and release its lease"""
+    global _task
+    if _task:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
+    await price_service.cache.release_lease(LEASE_NAME, _worker_id)
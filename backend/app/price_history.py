@@ -0,0 +1,151 @@
+"""
+Persistent daily close history (price_history table).
+
+Historical lookups are served from the database. Days that are not stored
+yet are backfilled with one bulk range request per symbol
+(CoinGecko /market_chart/range, yfinance history(start, end)) and written
+back, so every (symbol, day) is fetched upstream at most once.
+
+Non-trading days (weekends, holidays) carry the previous close forward,
+which is what a valuation on that day needs and keeps them from being
+refetched as gaps.
+"""
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Iterable
+
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import PriceHistory
+from app import price_service
+
+logger = logging.getLogger(__name__)
+
+# Fetched in front of a gap so its first days can carry an earlier close
+HISTORY_LOOKBACK_DAYS = 7
+
+
+def last_complete_day() -> date:
+    """Most recent UTC day whose close is final"""
+    return datetime.now(timezone.utc).date() - timedelta(days=1)
+
+
+def _days(start: date, end: date) -> list[date]:
+    return [start + timedelta(days=i) for i in range((end - start).days + 1)]
+
+
+def _forward_fill(closes: Dict[date, float], days: Iterable[date]) -> Dict[date, float]:
+    """Close for each requested day, carrying the latest earlier close over gaps"""
+    filled: Dict[date, float] = {}
+    ordered = sorted(closes.items())
+    i, last = 0, None
+    for day in sorted(days):
+        while i < len(ordered) and ordered[i][0] <= day:
+            last = ordered[i][1]
+            i += 1
+        if last is not None:
+            filled[day] = last
+    return filled
+
+
+def _insert_ignore(db: AsyncSession):
+    """INSERT that skips rows another request has already stored"""
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        return insert(PriceHistory)
+    return dialect_insert(PriceHistory).on_conflict_do_nothing(
+        index_elements=["symbol", "source", "date"]
+    )
+
+
+async def _load(
+    db: AsyncSession, symbols: list[str], source: str, start: date, end: date
+) -> Dict[str, Dict[date, float]]:
+    """Stored closes for the symbols in [start, end] (one query)"""
+    result = await db.execute(
+        select(PriceHistory.symbol, PriceHistory.date, PriceHistory.close)
+        .where(
+            PriceHistory.symbol.in_(symbols),
+            PriceHistory.source == source,
+            PriceHistory.date >= start,
+            PriceHistory.date <= end,
+        )
+    )
+    stored: Dict[str, Dict[date, float]] = defaultdict(dict)
+    for symbol, day, close in result.all():
+        stored[symbol][day] = float(close)
+    return stored
+
+
+async def _fill_gaps(
+    db: AsyncSession, missing: Dict[str, list[date]], portfolio_type: str, source: str
+) -> Dict[str, Dict[date, float]]:
+    """Fetch each symbol's missing span in one request, store and return the new closes"""
+    symbols = list(missing)
+
+    async def fetch(symbol: str) -> Dict[date, float]:
+        days = missing[symbol]
+        closes = await price_service.fetch_history(
+            symbol, portfolio_type, days[0] - timedelta(days=HISTORY_LOOKBACK_DAYS), days[-1]
+        )
+        return _forward_fill(closes, days)
+
+    filled = dict(zip(symbols, await asyncio.gather(*(fetch(symbol) for symbol in symbols))))
+
+    rows = [
+        {"symbol": symbol, "source": source, "date": day, "close": close}
+        for symbol, closes in filled.items()
+        for day, close in closes.items()
+    ]
+    if rows:
+        await db.execute(_insert_ignore(db), rows)
+        await db.commit()
+        logger.info(f"📈 Stored {len(rows)} daily closes for {len(symbols)} symbols")
+    return filled
+
+
+async def get_closes(
+    db: AsyncSession,
+    symbols: list[str],
+    portfolio_type: str,
+    start: date,
+    end: date,
+) -> Dict[str, Dict[date, float]]:
+    """
+    Daily closes for several symbols over [start, end].
+
+    Served from price_history; only missing days are fetched upstream.
+    Days after the last complete day, and days before a symbol has any
+    known close, are left out.
+
+    Returns:
+        {symbol: {date: close}}, keyed by the symbols as passed in
+    """
+    symbols = list(dict.fromkeys(symbols))
+    end = min(end, last_complete_day())
+    if not symbols or start > end:
+        return {symbol: {} for symbol in symbols}
+
+    source = price_service.provider_for(portfolio_type)
+    by_upper = {symbol: symbol.upper() for symbol in symbols}
+    stored = await _load(db, list(set(by_upper.values())), source, start, end)
+
+    days = _days(start, end)
+    missing = {}
+    for upper in set(by_upper.values()):
+        gaps = [day for day in days if day not in stored[upper]]
+        if gaps:
+            missing[upper] = gaps
+
+    if missing:
+        for upper, closes in (await _fill_gaps(db, missing, portfolio_type, source)).items():
+            stored[upper].update(closes)
+
+    return {symbol: dict(sorted(stored[upper].items())) for symbol, upper in by_upper.items()}
@@ -0,0 +1,103 @@
+"""
+Background price refresher.
+
+Keeps the price cache warm for every symbol that is actually held, so
+summary requests are served from cache instead of waiting on upstream:
+
+- finds distinct (PortfolioEntry.symbol, Portfolio.type) pairs with amount > 0
+- refreshes them shortly before CACHE_TTL_CRYPTO / _STOCKS / _METALS run out,
+  in provider-sized batches (price_service.refresh_due_prices)
+- with Redis, a lease makes one uvicorn worker in the cluster do the work
+
+Started and stopped from the app lifespan (see main.py).
+"""
+import asyncio
+import logging
+import os
+import uuid
+from collections import defaultdict
+from typing import Dict, Optional, Set
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db import AsyncSessionLocal
+from app.models import Portfolio, PortfolioEntry
+from app import price_service
+
+logger = logging.getLogger(__name__)
+
+REFRESHER_ENABLED = os.getenv("PRICE_REFRESHER_ENABLED", "true").lower() == "true"
+REFRESH_INTERVAL_SECONDS = float(os.getenv("PRICE_REFRESH_INTERVAL", "10"))
+# Refresh this share of the TTL before expiry (at least one interval ahead)
+REFRESH_LEAD_FRACTION = 0.2
+LEASE_NAME = "price_refresher"
+LEASE_TTL_MS = int(REFRESH_INTERVAL_SECONDS * 3 * 1000)
+
+_worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+_task: Optional[asyncio.Task] = None
+
+
+async def get_held_symbols(db: AsyncSession) -> Dict[str, Set[str]]:
+    """Distinct held symbols grouped by portfolio type: {'crypto': {'BTC', ...}, ...}"""
+    result = await db.execute(
+        select(PortfolioEntry.symbol, Portfolio.type)
+        .join(Portfolio, Portfolio.id == PortfolioEntry.portfolio_id)
+        .where(PortfolioEntry.amount > 0)
+        .distinct()
+    )
+    held: Dict[str, Set[str]] = defaultdict(set)
+    for symbol, ptype in result.all():
+        held[ptype.value].add(symbol)
+    return held
+
+
+async def refresh_once(db: AsyncSession) -> int:
+    """One refresh pass over all held symbols, returns how many prices were fetched"""
+    held = await get_held_symbols(db)
+    refreshed = 0
+    for ptype, symbols in held.items():
+        ttl = price_service.ttl_for(ptype)
+        lead = max(ttl * REFRESH_LEAD_FRACTION, REFRESH_INTERVAL_SECONDS * 1.5)
+        try:
+            refreshed += await price_service.refresh_due_prices(sorted(symbols), ptype, lead)
+        except Exception as e:
+            logger.error(f"Price refresh failed for {ptype}: {e}")
+    return refreshed
+
+
+async def _run():
+    while True:
+        try:
+            if await price_service.cache.acquire_lease(LEASE_NAME, _worker_id, LEASE_TTL_MS):
+                async with AsyncSessionLocal() as db:
+                    refreshed = await refresh_once(db)
+                if refreshed:
+                    logger.info(f"🔄 Refreshed {refreshed} prices")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Price refresher error: {e}")
+        await asyncio.sleep(REFRESH_INTERVAL_SECONDS)
+
+
+def start() -> None:
+    """Start the refresher loop (called from the app lifespan)"""
+    global _task
+    if not REFRESHER_ENABLED or (_task and not _task.done()):
+        return
+    _task = asyncio.create_task(_run())
+    logger.info("✅ Background price refresher started")
+
+
+async def stop() -> None:
+    """Stop the loop and hand the lease to another worker"""
+    global _task
+    if _task:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
+    await price_service.cache.release_lease(LEASE_NAME, _worker_id)
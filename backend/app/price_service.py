@@ -5,30 +5,76 @@
 - Металлы: Yahoo Finance commodity tickers
 
 Features:
-- Redis-backed cache with in-memory fallback
+- Two-tier cache: per-process LRU/TTL L1 in front of Redis L2 (MGET / pipelined SETEX)
 - Configurable TTL per asset type
 - Thread pool for synchronous yfinance calls
+- Shared pooled HTTP clients per provider (app.http_clients)
+- Single-flight coalescing of concurrent cache misses (optionally cross-worker via Redis)
+- Stale-while-revalidate: stale prices are served at once and refreshed in background
+- refresh_due_prices() for the background refresher (app.price_refresher)
+- Negative cache with exponential backoff for symbols that fail to resolve
+- Per-provider rate budget, Retry-After and circuit breaker (app.provider_governor)
+- Bulk daily history ranges for app.price_history
 """
 import httpx
 import yfinance as yf
+import json
 import logging
 import os
-from typing import Dict, Optional
-from datetime import datetime, timedelta
+import time
+from typing import Any, Awaitable, Callable, Dict, NamedTuple, Optional, Set
+from datetime import date, datetime, time as dt_time, timedelta, timezone
 import asyncio
 from concurrent.futures import ThreadPoolExecutor
 
+from app.db import AsyncSessionLocal
+from app.http_clients import get_client, get_session
+from app.memory_cache import BoundedTTLCache
+from app.provider_governor import ProviderUnavailable, create_governors, parse_retry_after
+from app import price_history
+
 logger = logging.getLogger(__name__)
 
 
 # ========== CACHE ==========
 
+# Entries stay servable (stale) for soft TTL × factor; between the soft and
+# hard TTL the stale price is returned at once and refreshed in background.
+CACHE_HARD_TTL_FACTOR = int(os.getenv("PRICE_CACHE_HARD_TTL_FACTOR", "10"))
+
+
+class PriceQuote(NamedTuple):
+    """A price together with when it was fetched from upstream"""
+    price: float
+    as_of: datetime          # UTC, time of the upstream fetch
+    stale: bool = False      # past the soft TTL, refresh pending
+
+
+# How long a process keeps its own copy of a Redis entry (L1 in front of L2)
+CACHE_L1_TTL = float(os.getenv("PRICE_CACHE_L1_TTL", "5"))
+
+
 class PriceCache:
-    """Redis-backed price cache with in-memory fallback"""
+    """
+    Two-tier price cache.
+
+    - L1: bounded per-process LRU/TTL cache (short-lived copy of L2 entries,
+      or the only tier when Redis is missing or down)
+    - L2: Redis, shared by all workers
+
+    get_many/set_many cost at most one Redis round trip (MGET / pipelined
+    SETEX) for any number of keys, and none when L1 is hot.
+    """
 
     def __init__(self):
-        self._memory_cache: Dict[str, tuple[float, datetime]] = {}
+        # L1: key -> (price, fetched_at epoch, fetched_at monotonic)
+        self._memory_cache = BoundedTTLCache(
+            max_entries=int(os.getenv("PRICE_MEMORY_CACHE_MAX_ENTRIES", "10000")),
+            max_bytes=int(os.getenv("PRICE_MEMORY_CACHE_MAX_BYTES", str(16 * 1024 * 1024))),
+        )
         self._redis = None
+        self.redis_round_trips = 0
+        self.redis_errors = 0
         redis_url = os.getenv("REDIS_URL")
         if redis_url:
             try:
@@ -38,38 +84,165 @@ class PriceCache:
             except Exception as e:
                 logger.warning(f"⚠️ Redis not available, using in-memory cache: {e}")
 
-    async def get(self, key: str, ttl_seconds: int = 60) -> Optional[float]:
-        """Get cached price, returns None if expired or missing"""
-        # Try Redis first
-        if self._redis:
+    async def get_many(self, keys: list[str], ttl_seconds: int = 60) -> Dict[str, PriceQuote]:
+        """
+        Get cached quotes, fresh or stale, for several keys.
+
+        Missing keys (or past the hard TTL, ttl_seconds × CACHE_HARD_TTL_FACTOR)
+        are left out; check `.stale` for the soft TTL. L1 misses — and stale
+        L1 copies, in case another worker already refreshed them — are read
+        from Redis with a single MGET.
+        """
+        results: Dict[str, PriceQuote] = {}
+        remote: list[str] = []
+
+        for key in dict.fromkeys(keys):
+            cached = self._memory_cache.get(key)
+            if cached is not None:
+                price, fetched_at, fetched_mono = cached
+                results[key] = PriceQuote(
+                    price=price,
+                    as_of=datetime.fromtimestamp(fetched_at, timezone.utc),
+                    stale=self._memory_cache.now() - fetched_mono >= ttl_seconds,
+                )
+            if self._redis and (cached is None or results[key].stale):
+                remote.append(key)
+
+        if remote:
             try:
-                val = await self._redis.get(f"price:{key}")
-                if val is not None:
-                    return float(val)
+                self.redis_round_trips += 1
+                values = await self._redis.mget([f"price:{key}" for key in remote])
             except Exception:
-                pass
+                self.redis_errors += 1
+                values = []
+
+            now, now_mono = time.time(), self._memory_cache.now()
+            hard_ttl = ttl_seconds * CACHE_HARD_TTL_FACTOR
+            for key, val in zip(remote, values):
+                if val is None:
+                    continue
+                price, fetched_at = _decode_entry(val)
+                age = now - fetched_at
+                if age >= hard_ttl:
+                    continue
+                results[key] = PriceQuote(
+                    price=price,
+                    as_of=datetime.fromtimestamp(fetched_at, timezone.utc),
+                    stale=age >= ttl_seconds,
+                )
+                self._memory_cache.set(
+                    key, (price, fetched_at, now_mono - age), min(CACHE_L1_TTL, hard_ttl - age)
+                )
+
+        return results
+
+    async def get_entry(self, key: str, ttl_seconds: int = 60) -> Optional[PriceQuote]:
+        """Get one cached quote, fresh or stale (see get_many)"""
+        return (await self.get_many([key], ttl_seconds)).get(key)
 
-        # Fallback to in-memory
-        if key in self._memory_cache:
-            price, cached_at = self._memory_cache[key]
-            if datetime.utcnow() - cached_at < timedelta(seconds=ttl_seconds):
-                return price
-            else:
-                del self._memory_cache[key]  # Expired
-        return None
+    async def get(self, key: str, ttl_seconds: int = 60) -> Optional[float]:
+        """Get cached price, returns None if expired (past soft TTL) or missing"""
+        entry = await self.get_entry(key, ttl_seconds)
+        if entry is None or entry.stale:
+            return None
+        return entry.price
+
+    async def set_many(self, prices: Dict[str, float], ttl: int = 60):
+        """
+        Cache several prices with the same TTL (kept for ttl × CACHE_HARD_TTL_FACTOR
+        as stale) — one pipelined SETEX round trip to Redis.
+        """
+        if not prices:
+            return
+        fetched_at, fetched_mono = time.time(), self._memory_cache.now()
+        hard_ttl = ttl * CACHE_HARD_TTL_FACTOR
+        l1_ttl = hard_ttl
 
-    async def set(self, key: str, price: float, ttl: int = 60):
-        """Cache a price with TTL"""
-        # Try Redis first
         if self._redis:
             try:
-                await self._redis.setex(f"price:{key}", ttl, str(price))
-                return
+                self.redis_round_trips += 1
+                pipe = self._redis.pipeline(transaction=False)
+                for key, price in prices.items():
+                    pipe.setex(f"price:{key}", hard_ttl, _encode_entry(price, fetched_at))
+                await pipe.execute()
+                l1_ttl = min(CACHE_L1_TTL, hard_ttl)
             except Exception:
-                pass
+                # Redis down — L1 becomes the only tier for these entries
+                self.redis_errors += 1
+
+        for key, price in prices.items():
+            self._memory_cache.set(key, (price, fetched_at, fetched_mono), l1_ttl)
+
+    async def set(self, key: str, price: float, ttl: int = 60):
+        """Cache one price with TTL (see set_many)"""
+        await self.set_many({key: price}, ttl)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "l1": self._memory_cache.stats(),
+            "l2": {
+                "enabled": self._redis is not None,
+                "round_trips": self.redis_round_trips,
+                "errors": self.redis_errors,
+            },
+        }
+
+    @property
+    def has_redis(self) -> bool:
+        return self._redis is not None
+
+    async def acquire_locks(self, keys: list[str], ttl_ms: int) -> Set[str]:
+        """
+        Try to take cross-worker fetch locks for keys (SET NX PX).
+
+        Returns the keys this process now owns. Without Redis (or on Redis
+        errors) every key is "owned" — there is nobody else to coordinate with.
+        """
+        if not self._redis or not keys:
+            return set(keys)
+        try:
+            pipe = self._redis.pipeline(transaction=False)
+            for key in keys:
+                pipe.set(f"lock:price:{key}", "1", nx=True, px=ttl_ms)
+            acquired = await pipe.execute()
+            return {key for key, ok in zip(keys, acquired) if ok}
+        except Exception:
+            return set(keys)
+
+    async def release_locks(self, keys: list[str]):
+        """Release fetch locks taken with acquire_locks"""
+        if not self._redis or not keys:
+            return
+        try:
+            await self._redis.delete(*(f"lock:price:{key}" for key in keys))
+        except Exception:
+            pass
+
+    async def acquire_lease(self, name: str, owner: str, ttl_ms: int) -> bool:
+        """
+        Take or extend a named cluster-wide lease (e.g. for a background job).
 
-        # Fallback to in-memory
-        self._memory_cache[key] = (price, datetime.utcnow())
+        True if `owner` holds the lease afterwards. Without Redis every
+        process has its own in-memory cache, so each one is its own leader.
+        """
+        if not self._redis:
+            return True
+        try:
+            return bool(await self._redis.eval(
+                _LEASE_SCRIPT, 1, f"lease:{name}", owner, ttl_ms
+            ))
+        except Exception as e:
+            logger.warning(f"⚠️ Lease check failed for {name}, running locally: {e}")
+            return True
+
+    async def release_lease(self, name: str, owner: str):
+        """Drop a lease if `owner` still holds it"""
+        if not self._redis:
+            return
+        try:
+            await self._redis.eval(_RELEASE_LEASE_SCRIPT, 1, f"lease:{name}", owner)
+        except Exception:
+            pass
 
     async def clear(self):
         """Clear all cached prices"""
@@ -83,16 +256,446 @@ class PriceCache:
         self._memory_cache.clear()
 
 
+# Extend our own lease, or take it if nobody holds it
+_LEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+if redis.call('set', KEYS[1], ARGV[1], 'NX', 'PX', ARGV[2]) then
+    return 1
+end
+return 0
+"""
+
+_RELEASE_LEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+def _encode_entry(price: float, fetched_at: float) -> str:
+    return json.dumps({"price": price, "as_of": fetched_at})
+
+
+def _decode_entry(val: str) -> tuple[float, float]:
+    """Parse a Redis cache value; bare floats (older format) count as just fetched"""
+    try:
+        data = json.loads(val)
+    except ValueError:
+        data = None
+    if isinstance(data, dict):
+        return float(data["price"]), float(data["as_of"])
+    return float(val), time.time()
+
+
 # Global cache instance
 cache = PriceCache()
 
+
+# ========== NEGATIVE CACHE ==========
+
+# Backoff for lookups that returned nothing (unknown symbol, provider error):
+# base × 2^(failures-1), capped. Kept apart from positive entries.
+NEGATIVE_TTL_BASE = int(os.getenv("PRICE_NEGATIVE_TTL_BASE", "30"))
+NEGATIVE_TTL_MAX = int(os.getenv("PRICE_NEGATIVE_TTL_MAX", "1800"))
+# Failure history outlives the backoff so repeated failures keep escalating
+NEGATIVE_MEMORY_FACTOR = 2
+
+
+class NegativeRecord(NamedTuple):
+    provider: str
+    symbol: str
+    key: str
+    failures: int
+    retry_at: float          # epoch seconds; suppressed until then
+
+    @property
+    def suppressed(self) -> bool:
+        return time.time() < self.retry_at
+
+
+def negative_backoff(failures: int) -> int:
+    """Suppression window after `failures` consecutive failed lookups"""
+    return min(NEGATIVE_TTL_BASE * 2 ** (max(failures, 1) - 1), NEGATIVE_TTL_MAX)
+
+
+class NegativeCache:
+    """
+    Per-(provider, symbol) record of failed lookups with exponential backoff.
+
+    While a record is suppressed the symbol resolves to None without an
+    upstream call. Stored in-process, mirrored to Redis (neg:<key>) when
+    available so all workers share the backoff.
+    """
+
+    def __init__(self, price_cache: PriceCache):
+        self._price_cache = price_cache
+        self._memory = BoundedTTLCache(max_entries=5000, max_bytes=2 * 1024 * 1024)
+        self.suppressed_hits = 0
+
+    @property
+    def _redis(self):
+        return self._price_cache._redis
+
+    async def get_many(self, keys: list[str]) -> Dict[str, NegativeRecord]:
+        """Failure records (suppressed or not) for keys that have one"""
+        records: Dict[str, NegativeRecord] = {}
+        for key in keys:
+            record = self._memory.get(key)
+            if record is not None:
+                records[key] = record
+
+        remote = [key for key in keys if key not in records]
+        if self._redis and remote:
+            try:
+                values = await self._redis.mget([f"neg:{key}" for key in remote])
+            except Exception:
+                values = []
+            for key, val in zip(remote, values):
+                if val is not None:
+                    records[key] = NegativeRecord(**json.loads(val))
+        return records
+
+    async def update(
+        self,
+        failed: Dict[str, tuple[str, str]],
+        recovered: list[str],
+        history: Dict[str, NegativeRecord],
+    ):
+        """
+        Record failures (key -> (provider, symbol)) with escalating backoff
+        and forget keys that resolved again.
+        """
+        if not failed and not recovered:
+            return
+        now = time.time()
+        new_records = {}
+        for key, (provider, symbol) in failed.items():
+            failures = history[key].failures + 1 if key in history else 1
+            backoff = negative_backoff(failures)
+            new_records[key] = (NegativeRecord(provider, symbol, key, failures, now + backoff), backoff)
+
+        for key, (record, backoff) in new_records.items():
+            self._memory.set(key, record, backoff * NEGATIVE_MEMORY_FACTOR)
+            logger.info(
+                f"Suppressing {record.provider}:{record.symbol} for {backoff}s "
+                f"({record.failures} failed lookups)"
+            )
+        for key in recovered:
+            self._memory.delete(key)
+
+        if self._redis:
+            try:
+                pipe = self._redis.pipeline(transaction=False)
+                for key, (record, backoff) in new_records.items():
+                    pipe.setex(f"neg:{key}", backoff * NEGATIVE_MEMORY_FACTOR, json.dumps(record._asdict()))
+                for key in recovered:
+                    pipe.delete(f"neg:{key}")
+                await pipe.execute()
+            except Exception:
+                pass
+
+    async def list(self) -> list[NegativeRecord]:
+        """All known failure records (this process + Redis)"""
+        records = dict(self._memory.items())
+        if self._redis:
+            try:
+                keys = [key async for key in self._redis.scan_iter(match="neg:*")]
+                if keys:
+                    for val in await self._redis.mget(keys):
+                        if val is not None:
+                            record = NegativeRecord(**json.loads(val))
+                            records[record.key] = record
+            except Exception:
+                pass
+        return sorted(records.values(), key=lambda r: (r.provider, r.symbol))
+
+    async def clear(self):
+        self._memory.clear()
+        if self._redis:
+            try:
+                keys = [key async for key in self._redis.scan_iter(match="neg:*")]
+                if keys:
+                    await self._redis.delete(*keys)
+            except Exception:
+                pass
+
+
+negative_cache = NegativeCache(cache)
+
+
+async def get_suppressed_symbols() -> list[NegativeRecord]:
+    """Symbols whose lookups are currently suppressed by the negative cache"""
+    return [record for record in await negative_cache.list() if record.suppressed]
+
+
 # Cache TTLs per asset type (seconds)
 CACHE_TTL_CRYPTO = 60    # 1 минута для крипты
 CACHE_TTL_STOCKS = 300   # 5 минут для акций
 CACHE_TTL_METALS = 600   # 10 минут для металлов
 
 # Thread pool для синхронного yfinance
-_executor = ThreadPoolExecutor(max_workers=5)
+YFINANCE_WORKERS = 5
+_executor = ThreadPoolExecutor(max_workers=YFINANCE_WORKERS)
+
+
+# ========== SINGLE-FLIGHT ==========
+
+# Cross-worker coalescing via Redis locks (only when REDIS_URL is set)
+SINGLEFLIGHT_REDIS = os.getenv("PRICE_SINGLEFLIGHT_REDIS", "true").lower() == "true"
+SINGLEFLIGHT_LOCK_TTL_MS = 15_000    # > upstream timeout, so a crashed holder expires
+SINGLEFLIGHT_WAIT_SECONDS = 3.0      # how long to wait for another worker's fetch
+SINGLEFLIGHT_POLL_SECONDS = 0.1
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent cache misses on the same key into one upstream fetch.
+
+    Every miss goes through do_many(): keys already being fetched in this
+    process await the existing in-flight task, the rest are fetched by one
+    new task. With Redis, a per-key lock extends this across workers —
+    keys locked elsewhere are awaited in the shared cache before falling
+    back to a fetch of our own.
+
+    fetch(keys) must return {key: PriceQuote or None} and write hits to cache.
+    """
+
+    def __init__(self, price_cache: PriceCache):
+        self._cache = price_cache
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.requested = 0        # misses that reached single-flight
+        self.fetched = 0          # keys fetched upstream by this process
+        self.coalesced = 0        # keys served by another in-process fetch
+        self.coalesced_remote = 0  # keys served by another worker's fetch
+        self.refreshed = 0        # stale keys revalidated in background
+
+    async def do(self, key: str, fetch, ttl_seconds: int) -> Optional[PriceQuote]:
+        return (await self.do_many([key], fetch, ttl_seconds)).get(key)
+
+    async def do_many(self, keys: list[str], fetch, ttl_seconds: int) -> Dict[str, Optional[PriceQuote]]:
+        keys = list(dict.fromkeys(keys))
+        self.requested += len(keys)
+
+        waiting = {key: self._inflight[key] for key in keys if key in self._inflight}
+        self.coalesced += len(waiting)
+        own = [key for key in keys if key not in waiting]
+        if own:
+            task = self._start(own, fetch, ttl_seconds)
+            waiting.update({key: task for key in own})
+
+        results: Dict[str, Optional[PriceQuote]] = {}
+        unavailable: Optional[ProviderUnavailable] = None
+        for task in set(waiting.values()):
+            try:
+                results.update(await asyncio.shield(task))
+            except ProviderUnavailable as e:
+                results.update(e.results)
+                unavailable = e
+        if unavailable is not None:
+            # Keys left out of results were not attempted upstream
+            raise ProviderUnavailable(
+                unavailable.provider, unavailable.reason, unavailable.retry_after,
+                results={key: results[key] for key in keys if key in results},
+            )
+        return {key: results.get(key) for key in keys}
+
+    def refresh(self, keys: list[str], fetch, ttl_seconds: int) -> None:
+        """Start one background fetch for the keys not already in flight"""
+        own = [key for key in dict.fromkeys(keys) if key not in self._inflight]
+        if not own:
+            return
+        self.refreshed += len(own)
+        task = self._start(own, fetch, ttl_seconds)
+        task.add_done_callback(_log_refresh_failure)
+
+    def in_flight(self, key: str) -> bool:
+        return key in self._inflight
+
+    def _start(self, keys: list[str], fetch, ttl_seconds: int) -> asyncio.Task:
+        # A task (not a bare coroutine) so a cancelled caller doesn't
+        # cancel the fetch for everyone else awaiting it
+        task = asyncio.ensure_future(self._lead(keys, fetch, ttl_seconds))
+        for key in keys:
+            self._inflight[key] = task
+        task.add_done_callback(lambda _t: self._forget(keys, task))
+        return task
+
+    def _forget(self, keys: list[str], task: asyncio.Task):
+        for key in keys:
+            if self._inflight.get(key) is task:
+                del self._inflight[key]
+
+    async def _lead(self, keys: list[str], fetch, ttl_seconds: int) -> Dict[str, Optional[PriceQuote]]:
+        use_locks = SINGLEFLIGHT_REDIS and self._cache.has_redis
+        owned = await self._cache.acquire_locks(keys, SINGLEFLIGHT_LOCK_TTL_MS) if use_locks else set(keys)
+        remote = [key for key in keys if key not in owned]
+
+        try:
+            results: Dict[str, Optional[PriceQuote]] = {}
+            if owned:
+                self.fetched += len(owned)
+                results.update(await fetch([key for key in keys if key in owned]))
+
+            if remote:
+                found = await self._wait_for_remote(remote, ttl_seconds)
+                self.coalesced_remote += len(found)
+                results.update(found)
+                # Other worker failed or is too slow — fetch the rest ourselves
+                leftover = [key for key in remote if key not in found]
+                if leftover:
+                    self.fetched += len(leftover)
+                    results.update(await fetch(leftover))
+            return results
+        finally:
+            if use_locks:
+                await self._cache.release_locks(list(owned))
+
+    async def _wait_for_remote(self, keys: list[str], ttl_seconds: int) -> Dict[str, PriceQuote]:
+        found: Dict[str, PriceQuote] = {}
+        deadline = asyncio.get_running_loop().time() + SINGLEFLIGHT_WAIT_SECONDS
+        while len(found) < len(keys) and asyncio.get_running_loop().time() < deadline:
+            await asyncio.sleep(SINGLEFLIGHT_POLL_SECONDS)
+            pending = [key for key in keys if key not in found]
+            for key, entry in (await self._cache.get_many(pending, ttl_seconds)).items():
+                if not entry.stale:
+                    found[key] = entry
+        return found
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "requested": self.requested,
+            "fetched": self.fetched,
+            "coalesced": self.coalesced,
+            "coalesced_remote": self.coalesced_remote,
+            "refreshed": self.refreshed,
+            "in_flight": len(self._inflight),
+        }
+
+
+def _log_refresh_failure(task: asyncio.Task):
+    if task.cancelled() or task.exception() is None:
+        return
+    if isinstance(task.exception(), ProviderUnavailable):
+        logger.debug(f"Background price refresh skipped: {task.exception()}")
+    else:
+        logger.error(f"Background price refresh failed: {task.exception()}")
+
+
+_singleflight = SingleFlight(cache)
+
+# Rate budget / Retry-After / circuit breaker per upstream provider
+governors = create_governors(lambda: cache._redis)
+
+
+def get_fetch_stats() -> Dict[str, int]:
+    """Coalesced vs. total upstream fetch counters for this process"""
+    return _singleflight.stats()
+
+
+def get_provider_stats() -> Dict[str, Dict[str, Any]]:
+    """Circuit state, throttling and budget counters per upstream provider"""
+    return {name: governor.stats() for name, governor in governors.items()}
+
+
+def get_cache_stats() -> Dict[str, Any]:
+    """L1 hit/miss/eviction/size counters and L2 (Redis) round trips for this process"""
+    return {
+        **cache.stats(),
+        "negative": {
+            "entries": len(negative_cache._memory),
+            "suppressed_hits": negative_cache.suppressed_hits,
+        },
+    }
+
+
+class _Plan(NamedTuple):
+    """How to look up a group of symbols: their cache keys, fetcher and TTL"""
+    provider: str            # 'coingecko' | 'yahoo'
+    keys: Dict[str, str]     # symbol -> cache key (unknown symbols are left out)
+    fetch: Callable[[list[str]], Awaitable[Dict[str, Optional[PriceQuote]]]]
+    ttl: int
+
+
+async def _get_quotes(plan: _Plan) -> Dict[str, Optional[PriceQuote]]:
+    """
+    Serve a plan's keys from cache with stale-while-revalidate semantics.
+
+    Fresh entries are returned as is; stale ones are returned at once and
+    refreshed by one background fetch; misses wait on a single-flight fetch
+    (unless suppressed by the negative cache).
+    """
+    keys = list(dict.fromkeys(plan.keys.values()))
+    results: Dict[str, Optional[PriceQuote]] = {}
+    missing: list[str] = []
+    stale: list[str] = []
+
+    cached = await cache.get_many(keys, plan.ttl)
+    for key in keys:
+        entry = cached.get(key)
+        if entry is None:
+            missing.append(key)
+        else:
+            results[key] = entry
+            if entry.stale:
+                stale.append(key)
+
+    if stale:
+        _singleflight.refresh(stale, plan.fetch, plan.ttl)
+    if missing:
+        results.update(await _fetch_missing(plan, missing))
+    return results
+
+
+async def _fetch_missing(plan: _Plan, keys: list[str]) -> Dict[str, Optional[PriceQuote]]:
+    """Fetch keys through single-flight, honouring and updating the negative cache"""
+    history = await negative_cache.get_many(keys)
+    suppressed = [key for key in keys if key in history and history[key].suppressed]
+    negative_cache.suppressed_hits += len(suppressed)
+
+    to_fetch = [key for key in keys if key not in suppressed]
+    quotes: Dict[str, Optional[PriceQuote]] = {}
+    skipped: Set[str] = set()
+    if to_fetch:
+        try:
+            quotes = await _singleflight.do_many(to_fetch, plan.fetch, plan.ttl)
+        except ProviderUnavailable as e:
+            # Provider throttled or circuit open: fail fast, and don't hold
+            # the outage against the symbols in the negative cache
+            logger.warning(f"⚠️ {e}, serving cached prices only")
+            quotes = e.results
+            skipped = {key for key in to_fetch if key not in quotes}
+
+    symbols = {key: symbol for symbol, key in plan.keys.items()}
+    await negative_cache.update(
+        failed={
+            key: (plan.provider, symbols[key])
+            for key in to_fetch if quotes.get(key) is None and key not in skipped
+        },
+        recovered=[key for key in to_fetch if quotes.get(key) is not None and key in history],
+        history=history,
+    )
+    return {key: quotes.get(key) for key in keys}
+
+
+async def _store(prices: Dict[str, Optional[float]], ttl_seconds: int) -> Dict[str, Optional[PriceQuote]]:
+    """Write fetched prices to cache and wrap them as fresh quotes"""
+    to_cache = {key: price for key, price in prices.items() if price}
+    if to_cache:
+        await cache.set_many(to_cache, ttl_seconds)
+    now = datetime.now(timezone.utc)
+    return {key: PriceQuote(price, now) if price else None for key, price in prices.items()}
+
+
+def _prices(quotes: Dict[str, Optional[PriceQuote]]) -> Dict[str, Optional[float]]:
+    return {key: quote.price if quote else None for key, quote in quotes.items()}
+
+
+async def _quotes_for_plan(plan: _Plan, symbols: list[str]) -> Dict[str, Optional[PriceQuote]]:
+    quotes = await _get_quotes(plan)
+    return {symbol: quotes.get(plan.keys[symbol]) if symbol in plan.keys else None for symbol in symbols}
 
 
 # ========== CRYPTO (CoinGecko) ==========
@@ -119,38 +722,168 @@ SYMBOL_TO_ID = {
 
 COINGECKO_API_URL = "https://api.coingecko.com/api/v3"
 
+# Keep batched /simple/price URLs well under common proxy/CDN limits
+COINGECKO_MAX_URL_LENGTH = 2000
 
-async def get_crypto_price(symbol: str, vs_currency: str = "usd") -> Optional[float]:
-    """Get cryptocurrency price from CoinGecko"""
-    symbol_upper = symbol.upper()
-    cache_key = f"crypto_{symbol_upper}_{vs_currency}"
 
-    # Check cache
-    cached = await cache.get(cache_key, CACHE_TTL_CRYPTO)
-    if cached is not None:
-        return cached
+def _coin_id(symbol: str) -> str:
+    """Map a ticker to its CoinGecko id (falls back to the lowercased symbol)"""
+    return SYMBOL_TO_ID.get(symbol.upper(), symbol.lower())
+
+
+def _chunk_coin_ids(coin_ids: list[str], vs_currency: str) -> list[list[str]]:
+    """Split coin ids into groups whose /simple/price URL fits COINGECKO_MAX_URL_LENGTH"""
+    base_length = len(f"{COINGECKO_API_URL}/simple/price?ids=&vs_currencies={vs_currency}")
+    chunks: list[list[str]] = []
+    current: list[str] = []
+    length = base_length
+
+    for coin_id in coin_ids:
+        # Commas are percent-encoded in the query string (%2C)
+        extra = len(coin_id) + (3 if current else 0)
+        if current and length + extra > COINGECKO_MAX_URL_LENGTH:
+            chunks.append(current)
+            current = []
+            length = base_length
+            extra = len(coin_id)
+        current.append(coin_id)
+        length += extra
 
-    coin_id = SYMBOL_TO_ID.get(symbol_upper, symbol.lower())
+    if current:
+        chunks.append(current)
+    return chunks
 
+
+async def _coingecko_get(client: httpx.AsyncClient, path: str, params: dict) -> Any:
+    """
+    GET a CoinGecko endpoint through the provider governor.
+
+    Returns the decoded JSON, or None on a failed request. Raises
+    ProviderUnavailable when the request was not made (circuit open,
+    budget spent) or CoinGecko answered 429.
+    """
+    governor = governors["coingecko"]
+    await governor.acquire()
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.get(
-                f"{COINGECKO_API_URL}/simple/price",
-                params={"ids": coin_id, "vs_currencies": vs_currency}
-            )
-            response.raise_for_status()
-            data = response.json()
+        response = await client.get(f"{COINGECKO_API_URL}{path}", params=params)
+    except asyncio.CancelledError:
+        governor.abandon_probe()
+        raise
+    except Exception as e:
+        # Timeouts, connection errors
+        governor.record_failure()
+        logger.error(f"CoinGecko request {path} failed: {e!r}")
+        return None
 
-            if coin_id in data and vs_currency in data[coin_id]:
-                price = float(data[coin_id][vs_currency])
-                await cache.set(cache_key, price, CACHE_TTL_CRYPTO)
-                return price
-            return None
+    retry_after = parse_retry_after(response.headers.get("Retry-After"))
+    if response.status_code == 429 or (response.status_code == 503 and retry_after is not None):
+        seconds = governor.record_rate_limited(retry_after)
+        await governor.share_block()
+        raise ProviderUnavailable("coingecko", f"HTTP {response.status_code}", seconds)
+    if response.status_code >= 500:
+        governor.record_failure()
+        logger.error(f"CoinGecko request {path} failed: HTTP {response.status_code}")
+        return None
+
+    # Any other answer means the upstream itself is healthy
+    governor.record_success()
+    try:
+        response.raise_for_status()
+        return response.json()
     except Exception as e:
-        logger.error(f"Error fetching crypto price for {symbol}: {e}")
+        logger.error(f"CoinGecko request {path} failed: {e}")
         return None
 
 
+async def _fetch_crypto_chunk(
+    client: httpx.AsyncClient,
+    coin_ids: list[str],
+    vs_currency: str
+) -> Optional[Dict[str, float]]:
+    """
+    Fetch one comma-joined /simple/price batch, returns {coin_id: price}
+
+    Returns None when CoinGecko could not be asked (see _coingecko_get).
+    """
+    try:
+        data = await _coingecko_get(
+            client, "/simple/price",
+            {"ids": ",".join(coin_ids), "vs_currencies": vs_currency},
+        )
+    except ProviderUnavailable:
+        return None
+    if not isinstance(data, dict):
+        if data is not None:
+            logger.error(f"Unexpected CoinGecko response for {len(coin_ids)} coins")
+        return {}
+
+    prices = {}
+    for coin_id in coin_ids:
+        if coin_id in data and vs_currency in data[coin_id]:
+            prices[coin_id] = float(data[coin_id][vs_currency])
+    return prices
+
+
+def _crypto_plan(symbols: list[str], vs_currency: str = "usd") -> _Plan:
+    keys = {symbol: f"crypto_{symbol.upper()}_{vs_currency}" for symbol in symbols}
+    coin_ids = {key: _coin_id(symbol) for symbol, key in keys.items()}
+
+    async def fetch(fetch_keys: list[str]) -> Dict[str, Optional[PriceQuote]]:
+        client = get_client("coingecko")
+        chunks = _chunk_coin_ids(list(dict.fromkeys(coin_ids[key] for key in fetch_keys)), vs_currency)
+        fetched: Dict[str, float] = {}
+        skipped: Set[str] = set()
+        for chunk, chunk_prices in zip(chunks, await asyncio.gather(
+            *(_fetch_crypto_chunk(client, chunk, vs_currency) for chunk in chunks)
+        )):
+            if chunk_prices is None:
+                skipped.update(chunk)
+            else:
+                fetched.update(chunk_prices)
+
+        quotes = await _store(
+            {key: fetched.get(coin_ids[key]) for key in fetch_keys if coin_ids[key] not in skipped},
+            CACHE_TTL_CRYPTO,
+        )
+        if skipped:
+            governor = governors["coingecko"]
+            raise ProviderUnavailable("coingecko", "throttled", governor.blocked_for(), results=quotes)
+        return quotes
+
+    return _Plan("coingecko", keys, fetch, CACHE_TTL_CRYPTO)
+
+
+async def get_crypto_quotes(
+    symbols: list[str],
+    vs_currency: str = "usd"
+) -> Dict[str, Optional[PriceQuote]]:
+    """
+    Get several cryptocurrency quotes with as few CoinGecko requests as possible
+
+    Cached symbols are served from cache; the misses are fetched in
+    comma-joined /simple/price batches (chunked by URL length) and written
+    back to cache in one pass.
+
+    Returns:
+        {symbol: PriceQuote or None}, keyed by the symbols as passed in
+    """
+    return await _quotes_for_plan(_crypto_plan(symbols, vs_currency), symbols)
+
+
+async def get_crypto_prices(
+    symbols: list[str],
+    vs_currency: str = "usd"
+) -> Dict[str, Optional[float]]:
+    """Get several cryptocurrency prices (see get_crypto_quotes)"""
+    return _prices(await get_crypto_quotes(symbols, vs_currency))
+
+
+async def get_crypto_price(symbol: str, vs_currency: str = "usd") -> Optional[float]:
+    """Get cryptocurrency price from CoinGecko"""
+    prices = await get_crypto_prices([symbol], vs_currency)
+    return prices[symbol]
+
+
 # ========== STOCKS / ETF (Yahoo Finance) ==========
 
 # Popular stock/ETF symbols
@@ -162,46 +895,117 @@ STOCK_SYMBOLS = [
 ]
 
 
+def _yahoo_rate_limit_hook(response, *args, **kwargs):
+    """requests hook: report Yahoo 429s to the governor (runs in executor threads)"""
+    if response.status_code == 429:
+        governors["yahoo"].record_rate_limited(parse_retry_after(response.headers.get("Retry-After")))
+    return response
+
+
+def _yahoo_session():
+    """Shared Yahoo session with the rate-limit hook installed"""
+    session = get_session("yahoo")
+    hooks = session.hooks.setdefault("response", [])
+    if _yahoo_rate_limit_hook not in hooks:
+        hooks.append(_yahoo_rate_limit_hook)
+    return session
+
+
 def _get_stock_price_sync(symbol: str) -> Optional[float]:
     """Synchronous helper for yfinance (runs in thread pool)"""
+    ticker = yf.Ticker(symbol.upper(), session=_yahoo_session())
+    # Try fast_info first (faster), fallback to info
     try:
-        ticker = yf.Ticker(symbol.upper())
-        # Try fast_info first (faster), fallback to info
-        try:
-            price = ticker.fast_info.last_price
-            if price and price > 0:
-                return float(price)
-        except Exception:
-            pass
+        price = ticker.fast_info.last_price
+        if price and price > 0:
+            return float(price)
+    except Exception:
+        pass
 
-        # Fallback: get from history
-        hist = ticker.history(period="1d")
-        if not hist.empty:
-            return float(hist['Close'].iloc[-1])
+    # Fallback: get from history
+    hist = ticker.history(period="1d")
+    if not hist.empty:
+        return float(hist['Close'].iloc[-1])
 
-        return None
+    return None
+
+
+async def _yahoo_call(func: Callable, ticker: str, *args) -> Any:
+    """
+    Run a blocking yfinance call in the thread pool through the Yahoo governor.
+
+    Returns None if the call raised; raises ProviderUnavailable when the
+    request was not allowed or Yahoo answered 429.
+    """
+    governor = governors["yahoo"]
+    await governor.acquire()
+    loop = asyncio.get_event_loop()
+    try:
+        result = await loop.run_in_executor(_executor, func, ticker, *args)
+    except asyncio.CancelledError:
+        governor.abandon_probe()
+        raise
     except Exception as e:
-        logger.error(f"Error fetching stock price for {symbol}: {e}")
+        governor.record_failure()
+        logger.error(f"Error fetching Yahoo Finance data for {ticker}: {e}")
         return None
 
+    if not result and governor.blocked_for() > 0:
+        # yfinance swallows HTTP errors; the session hook saw a 429
+        await governor.share_block()
+        raise ProviderUnavailable("yahoo", "HTTP 429", governor.blocked_for())
+    governor.record_success()
+    return result
+
+
+async def _fetch_yahoo_price(ticker: str) -> Optional[float]:
+    """One yfinance price lookup (raises ProviderUnavailable)"""
+    return await _yahoo_call(_get_stock_price_sync, ticker)
+
+
+def _yahoo_plan(tickers: Dict[str, str], prefix: str, ttl_seconds: int) -> _Plan:
+    """Plan for Yahoo lookups; tickers maps symbol -> Yahoo ticker"""
+    keys = {symbol: f"{prefix}_{symbol.upper()}" for symbol in tickers}
+    key_tickers = {keys[symbol]: ticker for symbol, ticker in tickers.items()}
+
+    async def fetch(fetch_keys: list[str]) -> Dict[str, Optional[PriceQuote]]:
+        outcomes = await asyncio.gather(
+            *(_fetch_yahoo_price(key_tickers[key]) for key in fetch_keys),
+            return_exceptions=True,
+        )
+        prices: Dict[str, Optional[float]] = {}
+        unavailable: Optional[ProviderUnavailable] = None
+        for key, outcome in zip(fetch_keys, outcomes):
+            if isinstance(outcome, ProviderUnavailable):
+                unavailable = outcome
+            elif isinstance(outcome, BaseException):
+                raise outcome
+            else:
+                prices[key] = outcome
 
-async def get_stock_price(symbol: str) -> Optional[float]:
-    """Get stock/ETF price from Yahoo Finance"""
-    symbol_upper = symbol.upper()
-    cache_key = f"stock_{symbol_upper}"
+        quotes = await _store(prices, ttl_seconds)
+        if unavailable is not None:
+            raise ProviderUnavailable(
+                "yahoo", unavailable.reason, unavailable.retry_after, results=quotes
+            )
+        return quotes
 
-    # Check cache
-    cached = await cache.get(cache_key, CACHE_TTL_STOCKS)
-    if cached is not None:
-        return cached
+    return _Plan("yahoo", keys, fetch, ttl_seconds)
+
+
+def _stock_plan(symbols: list[str]) -> _Plan:
+    return _yahoo_plan({symbol: symbol.upper() for symbol in symbols}, "stock", CACHE_TTL_STOCKS)
 
-    loop = asyncio.get_event_loop()
-    price = await loop.run_in_executor(_executor, _get_stock_price_sync, symbol)
 
-    if price:
-        await cache.set(cache_key, price, CACHE_TTL_STOCKS)
+async def get_stock_quote(symbol: str) -> Optional[PriceQuote]:
+    """Get stock/ETF quote from Yahoo Finance"""
+    return (await _quotes_for_plan(_stock_plan([symbol]), [symbol]))[symbol]
 
-    return price
+
+async def get_stock_price(symbol: str) -> Optional[float]:
+    """Get stock/ETF price from Yahoo Finance"""
+    quote = await get_stock_quote(symbol)
+    return quote.price if quote else None
 
 
 # ========== METALS ==========
@@ -231,54 +1035,81 @@ METALS_INFO = {
 }
 
 
+def _metal_plan(symbols: list[str]) -> _Plan:
+    tickers = {}
+    for symbol in symbols:
+        ticker_symbol = METAL_TICKERS.get(symbol.upper())
+        if ticker_symbol:
+            tickers[symbol] = ticker_symbol
+        else:
+            logger.warning(f"Unknown metal symbol: {symbol}")
+    return _yahoo_plan(tickers, "metal", CACHE_TTL_METALS)
+
+
+async def get_metal_quote(symbol: str) -> Optional[PriceQuote]:
+    """Get precious metal quote from Yahoo Finance futures"""
+    return (await _quotes_for_plan(_metal_plan([symbol]), [symbol]))[symbol]
+
+
 async def get_metal_price(symbol: str) -> Optional[float]:
     """Get precious metal price from Yahoo Finance futures"""
-    symbol_upper = symbol.upper()
-    cache_key = f"metal_{symbol_upper}"
+    quote = await get_metal_quote(symbol)
+    return quote.price if quote else None
 
-    # Check cache
-    cached = await cache.get(cache_key, CACHE_TTL_METALS)
-    if cached is not None:
-        return cached
 
-    ticker_symbol = METAL_TICKERS.get(symbol_upper)
-    if not ticker_symbol:
-        logger.warning(f"Unknown metal symbol: {symbol}")
-        return None
+# ========== UNIFIED PRICE FUNCTION ==========
 
-    loop = asyncio.get_event_loop()
-    price = await loop.run_in_executor(_executor, _get_stock_price_sync, ticker_symbol)
+def provider_for(portfolio_type: str) -> str:
+    """Upstream provider serving a portfolio type ('coingecko' or 'yahoo')"""
+    return "coingecko" if portfolio_type.lower() == "crypto" else "yahoo"
 
-    if price:
-        await cache.set(cache_key, price, CACHE_TTL_METALS)
 
-    return price
+def ttl_for(portfolio_type: str) -> int:
+    """Cache TTL (seconds) for a portfolio type's prices"""
+    ptype = portfolio_type.lower()
+    if ptype == "crypto":
+        return CACHE_TTL_CRYPTO
+    elif ptype == "metals":
+        return CACHE_TTL_METALS
+    return CACHE_TTL_STOCKS
 
 
-# ========== UNIFIED PRICE FUNCTION ==========
+def _plan_for(symbols: list[str], portfolio_type: str) -> _Plan:
+    ptype = portfolio_type.lower()
+    if ptype == "crypto":
+        return _crypto_plan(symbols)
+    elif ptype == "metals":
+        return _metal_plan(symbols)
+    # stocks, etf — and default to stock
+    return _stock_plan(symbols)
 
-async def get_price_by_type(symbol: str, portfolio_type: str) -> Optional[float]:
+
+async def get_quote_by_type(symbol: str, portfolio_type: str) -> Optional[PriceQuote]:
     """
-    Get asset price based on portfolio type
+    Get asset quote (price + as_of) based on portfolio type
 
     Args:
         symbol: Asset symbol (BTC, AAPL, XAU, etc.)
         portfolio_type: One of 'crypto', 'stocks', 'etf', 'metals'
 
     Returns:
-        Price in USD or None
+        PriceQuote in USD or None
     """
-    ptype = portfolio_type.lower()
+    return (await get_multiple_quotes_by_type([symbol], portfolio_type))[symbol]
 
-    if ptype == "crypto":
-        return await get_crypto_price(symbol)
-    elif ptype in ("stocks", "etf"):
-        return await get_stock_price(symbol)
-    elif ptype == "metals":
-        return await get_metal_price(symbol)
-    else:
-        # Default to stock
-        return await get_stock_price(symbol)
+
+async def get_price_by_type(symbol: str, portfolio_type: str) -> Optional[float]:
+    """Get asset price in USD based on portfolio type (see get_quote_by_type)"""
+    quote = await get_quote_by_type(symbol, portfolio_type)
+    return quote.price if quote else None
+
+
+async def get_multiple_quotes_by_type(
+    symbols: list[str],
+    portfolio_type: str
+) -> Dict[str, Optional[PriceQuote]]:
+    """Get multiple asset quotes based on portfolio type (one cache pass, batched misses)"""
+    return await _quotes_for_plan(_plan_for(symbols, portfolio_type), symbols)
 
 
 async def get_multiple_prices_by_type(
@@ -286,9 +1117,163 @@ async def get_multiple_prices_by_type(
     portfolio_type: str
 ) -> Dict[str, Optional[float]]:
     """Get multiple asset prices based on portfolio type"""
-    tasks = [get_price_by_type(symbol, portfolio_type) for symbol in symbols]
-    prices = await asyncio.gather(*tasks)
-    return dict(zip(symbols, prices))
+    return _prices(await get_multiple_quotes_by_type(symbols, portfolio_type))
+
+
+def _price_namespace(portfolio_type: str) -> str:
+    """Portfolio types sharing cache keys and fetcher: stocks and ETFs are both 'stocks'"""
+    ptype = portfolio_type.lower()
+    return ptype if ptype in ("crypto", "metals") else "stocks"
+
+
+async def get_quotes_across_types(
+    symbols_by_type: Dict[str, list[str]]
+) -> Dict[str, Dict[str, Optional[PriceQuote]]]:
+    """
+    Get quotes for holdings of several portfolio types at once
+
+    Symbols are merged per price namespace before lookup, so all crypto goes
+    out as one CoinGecko batch and stocks/ETFs/metals as one concurrent set
+    of Yahoo lookups, however many portfolios they come from.
+
+    Returns:
+        {portfolio_type: {symbol: PriceQuote or None}}
+    """
+    merged: Dict[str, list[str]] = {}
+    for ptype, symbols in symbols_by_type.items():
+        merged.setdefault(_price_namespace(ptype), []).extend(symbols)
+
+    namespaces = list(merged)
+    lookups = []
+    for namespace in namespaces:
+        symbols = list(dict.fromkeys(merged[namespace]))
+        lookups.append(_quotes_for_plan(_plan_for(symbols, namespace), symbols))
+    by_namespace = dict(zip(namespaces, await asyncio.gather(*lookups)))
+
+    return {
+        ptype: {symbol: by_namespace[_price_namespace(ptype)].get(symbol) for symbol in symbols}
+        for ptype, symbols in symbols_by_type.items()
+    }
+
+
+# ========== HISTORY (bulk ranges) ==========
+
+def yahoo_ticker(symbol: str, portfolio_type: str) -> Optional[str]:
+    """Yahoo Finance ticker for a stocks/etf/metals symbol"""
+    if portfolio_type.lower() == "metals":
+        return METAL_TICKERS.get(symbol.upper())
+    return symbol.upper()
+
+
+def _daily_closes(points: list[tuple[datetime, float]]) -> Dict[date, float]:
+    """Last price of every UTC day"""
+    closes: Dict[date, float] = {}
+    for ts, price in sorted(points):
+        closes[ts.date()] = price
+    return closes
+
+
+async def fetch_crypto_history(
+    symbol: str,
+    start: date,
+    end: date,
+    vs_currency: str = "usd"
+) -> Dict[date, float]:
+    """Daily closes for [start, end] in one CoinGecko /market_chart/range request"""
+    range_start = datetime.combine(start, dt_time.min, tzinfo=timezone.utc)
+    range_end = datetime.combine(end + timedelta(days=1), dt_time.min, tzinfo=timezone.utc)
+    data = await _coingecko_get(
+        get_client("coingecko"),
+        f"/coins/{_coin_id(symbol)}/market_chart/range",
+        {
+            "vs_currency": vs_currency,
+            "from": int(range_start.timestamp()),
+            "to": int(range_end.timestamp()) - 1,
+        },
+    )
+    if not isinstance(data, dict):
+        return {}
+    points = [
+        (datetime.fromtimestamp(ms / 1000, tz=timezone.utc), float(price))
+        for ms, price in data.get("prices", [])
+        if price is not None
+    ]
+    return _daily_closes(points)
+
+
+def _get_yahoo_history_sync(ticker: str, start: date, end: date) -> Dict[date, float]:
+    """Synchronous yfinance daily history for [start, end] (runs in thread pool)"""
+    hist = yf.Ticker(ticker, session=_yahoo_session()).history(
+        start=start.isoformat(), end=(end + timedelta(days=1)).isoformat(), interval="1d"
+    )
+    if hist.empty:
+        return {}
+    return {ts.date(): float(close) for ts, close in hist["Close"].items()}
+
+
+async def fetch_yahoo_history(ticker: str, start: date, end: date) -> Dict[date, float]:
+    """Daily closes for [start, end] in one yfinance history() call (trading days only)"""
+    return await _yahoo_call(_get_yahoo_history_sync, ticker, start, end) or {}
+
+
+async def fetch_history(symbol: str, portfolio_type: str, start: date, end: date) -> Dict[date, float]:
+    """
+    Daily closes for a symbol over [start, end] with one upstream request.
+
+    Returns {} when the provider is unavailable or knows no such symbol.
+    """
+    try:
+        if portfolio_type.lower() == "crypto":
+            return await fetch_crypto_history(symbol, start, end)
+        ticker = yahoo_ticker(symbol, portfolio_type)
+        if not ticker:
+            return {}
+        return await fetch_yahoo_history(ticker, start, end)
+    except ProviderUnavailable as e:
+        logger.warning(f"⚠️ History for {symbol} not fetched: {e}")
+        return {}
+
+
+# ========== BACKGROUND REFRESH ==========
+
+# Symbols per refresh call: one CoinGecko batch request; one yfinance call per
+# executor thread
+PROVIDER_BATCH_SIZE = {
+    "coingecko": 250,
+    "yahoo": YFINANCE_WORKERS,
+}
+
+
+async def refresh_due_prices(
+    symbols: list[str],
+    portfolio_type: str,
+    lead_seconds: Optional[float] = None
+) -> int:
+    """
+    Refetch cached prices that expire within lead_seconds (or are missing).
+
+    Runs in provider-sized batches through single-flight, so it never races
+    user requests for the same key. Returns the number of prices refreshed.
+    """
+    plan = _plan_for(symbols, portfolio_type)
+    if lead_seconds is None:
+        lead_seconds = plan.ttl * 0.2
+    now = datetime.now(timezone.utc)
+
+    keys = list(dict.fromkeys(plan.keys.values()))
+    cached = await cache.get_many(keys, plan.ttl)
+    due = []
+    for key in keys:
+        entry = cached.get(key)
+        if entry is None or (now - entry.as_of).total_seconds() >= plan.ttl - lead_seconds:
+            due.append(key)
+
+    refreshed = 0
+    batch_size = PROVIDER_BATCH_SIZE[plan.provider]
+    for i in range(0, len(due), batch_size):
+        quotes = await _fetch_missing(plan, due[i:i + batch_size])
+        refreshed += sum(1 for quote in quotes.values() if quote is not None)
+    return refreshed
 
 
 # ========== LEGACY FUNCTIONS (для совместимости) ==========
@@ -300,9 +1285,7 @@ async def get_price(symbol: str, vs_currency: str = "usd") -> Optional[float]:
 
 async def get_multiple_prices(symbols: list[str], vs_currency: str = "usd") -> Dict[str, Optional[float]]:
     """Legacy: Get multiple crypto prices"""
-    tasks = [get_crypto_price(symbol, vs_currency) for symbol in symbols]
-    prices = await asyncio.gather(*tasks)
-    return dict(zip(symbols, prices))
+    return await get_crypto_prices(symbols, vs_currency)
 
 
 async def get_historical_price(
@@ -310,23 +1293,30 @@ async def get_historical_price(
     date: datetime,
     vs_currency: str = "usd"
 ) -> Optional[float]:
-    """Get historical crypto price from CoinGecko"""
-    symbol_upper = symbol.upper()
-    coin_id = SYMBOL_TO_ID.get(symbol_upper, symbol.lower())
+    """
+    Legacy: Get historical crypto price
+
+    USD closes come from the price_history table (backfilled in bulk on
+    a miss); other currencies still ask CoinGecko /coins/{id}/history.
+    """
+    if vs_currency == "usd":
+        day = date.date()
+        async with AsyncSessionLocal() as db:
+            closes = await price_history.get_closes(db, [symbol], "crypto", day, day)
+        return closes[symbol].get(day)
+
+    coin_id = _coin_id(symbol)
     date_str = date.strftime("%d-%m-%Y")
 
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.get(
-                f"{COINGECKO_API_URL}/coins/{coin_id}/history",
-                params={"date": date_str, "localization": "false"}
-            )
-            response.raise_for_status()
-            data = response.json()
-
-            if "market_data" in data and "current_price" in data["market_data"]:
-                return float(data["market_data"]["current_price"].get(vs_currency, 0))
-            return None
+        data = await _coingecko_get(
+            get_client("coingecko"),
+            f"/coins/{coin_id}/history",
+            {"date": date_str, "localization": "false"},
+        )
+        if data and "market_data" in data and "current_price" in data["market_data"]:
+            return float(data["market_data"]["current_price"].get(vs_currency, 0))
+        return None
     except Exception as e:
         logger.error(f"Error fetching historical price for {symbol} on {date_str}: {e}")
         return None
@@ -0,0 +1,292 @@
+"""
+Upstream request governor for price providers (CoinGecko, Yahoo).
+
+Each provider gets:
+- a token-bucket request budget, shared by all workers through Redis when
+  available (per process otherwise)
+- Retry-After handling: a 429/503 blocks the provider for the advertised
+  time (cluster-wide with Redis)
+- a circuit breaker: after repeated failures calls fail fast for a while,
+  so the price service falls back to cached/stale values instead of
+  waiting on timeouts
+
+price_service calls acquire() before every upstream request and reports
+the outcome with record_success/record_failure/record_rate_limited.
+Breaker state is per process; the request budget and Retry-After blocks
+are shared.
+"""
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RETRY_AFTER = 60.0   # seconds, when a 429 carries no Retry-After
+
+
+class ProviderUnavailable(Exception):
+    """The provider must not be called right now (breaker open, throttled, budget spent)"""
+
+    def __init__(self, provider: str, reason: str, retry_after: float = 0.0, results: Optional[dict] = None):
+        super().__init__(f"{provider} unavailable: {reason}")
+        self.provider = provider
+        self.reason = reason
+        self.retry_after = retry_after
+        # Partial results obtained before the provider became unavailable
+        self.results = results or {}
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After header (delta-seconds or HTTP-date) -> seconds from now"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+# Token bucket + Retry-After block in one round trip.
+# Returns {status, seconds}: 0 = go after `seconds`, 1 = budget exhausted,
+# 2 = blocked by Retry-After for `seconds`.
+_ACQUIRE_SCRIPT = """
+local blocked = redis.call('pttl', KEYS[2])
+if blocked > 0 then
+    return {2, tostring(blocked / 1000)}
+end
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local max_wait = tonumber(ARGV[3])
+local t = redis.call('time')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local data = redis.call('hmget', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(data[1]) or capacity
+local ts = tonumber(data[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens < 1 then
+    wait = (1 - tokens) / rate
+    if wait > max_wait then
+        redis.call('hset', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+        return {1, tostring(wait)}
+    end
+end
+redis.call('hset', KEYS[1], 'tokens', tostring(tokens - 1), 'ts', tostring(now))
+redis.call('pexpire', KEYS[1], math.ceil(capacity / rate * 1000) + 1000)
+return {0, tostring(wait)}
+"""
+
+
+class ProviderGovernor:
+    """Rate budget, Retry-After and circuit breaker for one upstream provider"""
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(
+        self,
+        name: str,
+        rate_per_minute: float,
+        burst: int,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        max_wait: float = 2.0,
+        redis_getter: Callable[[], object] = lambda: None,
+    ):
+        self.name = name
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(burst)
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_wait = max_wait
+        self._redis_getter = redis_getter
+
+        # Local token bucket (used without Redis or when Redis fails)
+        self._tokens = self.capacity
+        self._tokens_ts = time.monotonic()
+        self._blocked_until = 0.0       # monotonic, from Retry-After
+
+        # Circuit breaker
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+        # Counters
+        self.allowed = 0
+        self.rejected = 0
+        self.rate_limited = 0
+        self.failures = 0
+        self.waited_seconds = 0.0
+
+    # ----- acquire -----
+
+    async def acquire(self) -> None:
+        """Wait for a request slot or raise ProviderUnavailable"""
+        probe = self._check_breaker()
+        try:
+            remaining = self.blocked_for()
+            if remaining > 0:
+                self._reject("retry-after", remaining)
+
+            status, seconds = await self._take_token()
+            if status == 2:
+                self._blocked_until = time.monotonic() + seconds
+                self._reject("retry-after", seconds)
+            if status == 1:
+                self._reject("rate budget exhausted", seconds)
+
+            if seconds > 0:
+                self.waited_seconds += seconds
+                await asyncio.sleep(seconds)
+        except BaseException:
+            # Rejected or cancelled before the probe was sent: the next call probes
+            if probe:
+                self.abandon_probe()
+            raise
+        self.allowed += 1
+
+    def _check_breaker(self) -> bool:
+        """Reject while the circuit is open; True if this call is the half-open probe"""
+        if self.state == self.OPEN:
+            elapsed = time.monotonic() - self._opened_at
+            if elapsed < self.reset_timeout:
+                self._reject("circuit open", self.reset_timeout - elapsed)
+            self.state = self.HALF_OPEN
+            self._probe_in_flight = False
+        if self.state == self.HALF_OPEN:
+            # Let exactly one probe through; everyone else keeps failing fast
+            if self._probe_in_flight:
+                self._reject("circuit half-open", self.reset_timeout)
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def abandon_probe(self) -> None:
+        """The request got no answer either way (e.g. cancelled): let another call probe"""
+        self._probe_in_flight = False
+
+    def _reject(self, reason: str, retry_after: float):
+        self.rejected += 1
+        raise ProviderUnavailable(self.name, reason, retry_after)
+
+    async def _take_token(self) -> tuple[int, float]:
+        redis = self._redis_getter()
+        if redis is not None:
+            try:
+                status, seconds = await redis.eval(
+                    _ACQUIRE_SCRIPT, 2,
+                    f"gov:{self.name}:bucket", f"gov:{self.name}:blocked",
+                    self.rate, self.capacity, self.max_wait,
+                )
+                return int(status), float(seconds)
+            except Exception as e:
+                logger.debug(f"Shared rate budget for {self.name} unavailable, using local: {e}")
+        return self._take_local_token()
+
+    def _take_local_token(self) -> tuple[int, float]:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._tokens_ts) * self.rate)
+        self._tokens_ts = now
+        wait = 0.0
+        if self._tokens < 1:
+            wait = (1 - self._tokens) / self.rate
+            if wait > self.max_wait:
+                return 1, wait
+        self._tokens -= 1
+        return 0, wait
+
+    # ----- outcomes -----
+
+    def record_success(self) -> None:
+        if self.state != self.CLOSED:
+            logger.info(f"✅ {self.name}: upstream healthy again, closing circuit")
+        self.state = self.CLOSED
+        self._failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        """Timeout, connection error or 5xx"""
+        self.failures += 1
+        self._failures += 1
+        if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+            self._open()
+
+    def record_rate_limited(self, retry_after: Optional[float]) -> float:
+        """
+        429 (or 503 with Retry-After): block the provider for retry_after seconds.
+
+        Safe to call from executor threads; share_block() propagates the
+        block to other workers.
+        """
+        self.rate_limited += 1
+        seconds = retry_after if retry_after is not None else DEFAULT_RETRY_AFTER
+        self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+        self._probe_in_flight = False
+        logger.warning(f"⚠️ {self.name} rate limited, backing off for {seconds:.0f}s")
+        return seconds
+
+    async def share_block(self) -> None:
+        """Publish the current Retry-After block through Redis"""
+        redis = self._redis_getter()
+        remaining = self.blocked_for()
+        if redis is None or remaining <= 0:
+            return
+        try:
+            await redis.set(f"gov:{self.name}:blocked", "1", px=int(remaining * 1000))
+        except Exception as e:
+            logger.debug(f"Could not share {self.name} rate limit block: {e}")
+
+    def blocked_for(self) -> float:
+        """Seconds left on the local Retry-After block"""
+        return max(0.0, self._blocked_until - time.monotonic())
+
+    def _open(self):
+        if self.state != self.OPEN:
+            logger.warning(
+                f"⚠️ {self.name}: {self._failures} consecutive failures, "
+                f"opening circuit for {self.reset_timeout:.0f}s"
+            )
+        self.state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._probe_in_flight = False
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "state": self.state,
+            "blocked_for": round(self.blocked_for(), 1),
+            "allowed": self.allowed,
+            "rejected": self.rejected,
+            "rate_limited": self.rate_limited,
+            "failures": self.failures,
+            "waited_seconds": round(self.waited_seconds, 3),
+        }
+
+
+def create_governors(redis_getter: Callable[[], object]) -> Dict[str, ProviderGovernor]:
+    """Governors for all price providers, budgets from the environment"""
+    return {
+        # CoinGecko public API: ~30 calls/min
+        "coingecko": ProviderGovernor(
+            "coingecko",
+            rate_per_minute=float(os.getenv("COINGECKO_RATE_PER_MINUTE", "30")),
+            burst=int(os.getenv("COINGECKO_BURST", "10")),
+            redis_getter=redis_getter,
+        ),
+        "yahoo": ProviderGovernor(
+            "yahoo",
+            rate_per_minute=float(os.getenv("YAHOO_RATE_PER_MINUTE", "120")),
+            burst=int(os.getenv("YAHOO_BURST", "20")),
+            redis_getter=redis_getter,
+        ),
+    }
@@ -0,0 +1,35 @@
+from fastapi import APIRouter, Depends
+from datetime import datetime, timezone
+from typing import List
+
+from app.dependencies import get_admin_user
+from app.user_cache import Principal
+from app.schemas import SuppressedSymbolRead
+from app.price_service import get_cache_stats, get_fetch_stats, get_provider_stats, get_suppressed_symbols
+
+router = APIRouter(prefix="/admin", tags=["Admin"])
+
+
+@router.get("/prices/suppressed", response_model=List[SuppressedSymbolRead])
+async def list_suppressed_symbols(admin: Principal = Depends(get_admin_user)):
+    """Symbols the negative cache currently answers with None instead of calling upstream"""
+    return [
+        SuppressedSymbolRead(
+            provider=record.provider,
+            symbol=record.symbol,
+            failures=record.failures,
+            retry_at=datetime.fromtimestamp(record.retry_at, timezone.utc),
+        )
+        for record in await get_suppressed_symbols()
+    ]
+
+
+@router.get("/prices/stats")
+async def price_stats(admin: Principal = Depends(get_admin_user)):
+    """Price service counters for this worker (upstream fetches, L1/L2 cache)"""
+    return {
+        "fetches": get_fetch_stats(),
+        "cache": get_cache_stats(),
+        "providers": get_provider_stats(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+    }
@@ -9,7 +9,7 @@ from fastapi.responses import JSONResponse
 from app.models import User
 from app.schemas import UserCreate, UserRead
 from app.db import get_db
-from app.utils import hash_password, verify_password
+from app.utils import PasswordHashingBusy, hash_password, hash_password_async, needs_rehash, verify_password_async
 from app.auth import create_access_token, create_refresh_token, verify_token
 from app.dependencies import get_current_user
 
@@ -20,6 +20,18 @@ router = APIRouter()
 class RefreshTokenRequest(BaseModel):
     refresh_token: str
 
+# Checked when the email is unknown, so those logins cost a bcrypt check
+# too and take as long as a wrong password (no account enumeration)
+_DUMMY_HASH = hash_password("no such account")
+
+
+def _hashing_busy() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Too many sign-in attempts in progress, try again shortly",
+        headers={"Retry-After": "1"},
+    )
+
 
 @router.post("/register", response_model=UserRead)
 async def register(user_in: UserCreate, db: AsyncSession = Depends(get_db)):
@@ -29,7 +41,10 @@ async def register(user_in: UserCreate, db: AsyncSession = Depends(get_db)):
     if existing_user:
         raise HTTPException(status_code=400, detail="User already exists")
 
-    hashed = hash_password(user_in.password)
+    try:
+        hashed = await hash_password_async(user_in.password)
+    except PasswordHashingBusy:
+        raise _hashing_busy()
     new_user = User(email=user_in.email, hashed_password=hashed)
     db.add(new_user)
     
@@ -44,8 +59,16 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSessi
     result = await db.execute(select(User).where(User.email == form_data.username))
     user = result.scalars().first()
 
-    if not user or not verify_password(form_data.password, user.hashed_password):
-        raise HTTPException(status_code=401, detail="Invalid credentials")
+    try:
+        valid = await verify_password_async(form_data.password, user.hashed_password if user else _DUMMY_HASH)
+        if not user or not valid:
+            raise HTTPException(status_code=401, detail="Invalid credentials")
+        # Upgrade legacy SHA-256 (or outdated bcrypt) hashes while we have the password
+        if needs_rehash(user.hashed_password):
+            user.hashed_password = await hash_password_async(form_data.password)
+            await db.commit()
+    except PasswordHashingBusy:
+        raise _hashing_busy()
 
     access_token = create_access_token(user.id)
     refresh_token = create_refresh_token(user.id)
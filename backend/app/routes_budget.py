@@ -1,12 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, Depends, HTTPException, Path, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy.orm import selectinload
 from sqlalchemy import func
 from app.db import get_db
-from app.dependencies import get_current_user
-from app.models import User, BudgetCategory, BudgetTransaction, BudgetType, DEFAULT_BUDGET_CATEGORIES
+from app.limiter import COST_BULK, COST_READ, COST_WRITE, rate_limit
+from app import exports
+from app.dependencies import get_principal
+from app.user_cache import Principal
+from app.models import BudgetCategory, BudgetTransaction, BudgetType, DEFAULT_BUDGET_CATEGORIES
 from app.schemas import (
     BudgetCategoryCreate, BudgetCategoryRead,
     BudgetTransactionCreate, BudgetTransactionRead,
@@ -15,19 +17,16 @@ from app.schemas import (
 from typing import List, Optional
 from datetime import datetime, timedelta
 from collections import defaultdict
-import csv
-import io
-import json
 
 router = APIRouter(prefix="/budget", tags=["Budget"])
 
 
 # ========== Categories ==========
 
-@router.get("/categories", response_model=List[BudgetCategoryRead])
+@router.get("/categories", response_model=List[BudgetCategoryRead], dependencies=[Depends(rate_limit(COST_READ))])
 async def get_categories(
     db: AsyncSession = Depends(get_db),
-    user: User = Depends(get_current_user)
+    user: Principal = Depends(get_principal)
 ):
     """Get all budget categories for user"""
     result = await db.execute(
@@ -63,11 +62,11 @@ async def get_categories(
     ]
 
 
-@router.post("/categories", response_model=BudgetCategoryRead)
+@router.post("/categories", response_model=BudgetCategoryRead, dependencies=[Depends(rate_limit(COST_WRITE))])
 async def create_category(
     data: BudgetCategoryCreate,
     db: AsyncSession = Depends(get_db),
-    user: User = Depends(get_current_user)
+    user: Principal = Depends(get_principal)
 ):
     """Create new budget category"""
     try:
@@ -93,11 +92,11 @@ async def create_category(
     )
 
 
-@router.delete("/categories/{category_id}")
+@router.delete("/categories/{category_id}", dependencies=[Depends(rate_limit(COST_WRITE))])
 async def delete_category(
     category_id: int,
     db: AsyncSession = Depends(get_db),
-    user: User = Depends(get_current_user)
+    user: Principal = Depends(get_principal)
 ):
     """Delete budget category"""
     result = await db.execute(
@@ -117,14 +116,14 @@ async def delete_category(
 
 # ========== Transactions ==========
 
-@router.get("/transactions", response_model=List[BudgetTransactionRead])
+@router.get("/transactions", response_model=List[BudgetTransactionRead], dependencies=[Depends(rate_limit(COST_READ))])
 async def get_transactions(
     limit: int = Query(50, ge=1, le=200),
     offset: int = Query(0, ge=0),
     category_id: Optional[int] = None,
     type: Optional[str] = None,
     db: AsyncSession = Depends(get_db),
-    user: User = Depends(get_current_user)
+    user: Principal = Depends(get_principal)
 ):
     """Get budget transactions with optional filters"""
     query = select(BudgetTransaction).where(BudgetTransaction.user_id == user.id)
@@ -160,11 +159,11 @@ async def get_transactions(
     ]
 
 
-@router.post("/transactions", response_model=BudgetTransactionRead)
+@router.post("/transactions", response_model=BudgetTransactionRead, dependencies=[Depends(rate_limit(COST_WRITE))])
 async def create_transaction(
     data: BudgetTransactionCreate,
     db: AsyncSession = Depends(get_db),
-    user: User = Depends(get_current_user)
+    user: Principal = Depends(get_principal)
 ):
     """Create new budget transaction (income or expense)"""
     # Verify category belongs to user
@@ -204,11 +203,11 @@ async def create_transaction(
     )
 
 
-@router.delete("/transactions/{transaction_id}")
+@router.delete("/transactions/{transaction_id}", dependencies=[Depends(rate_limit(COST_WRITE))])
 async def delete_transaction(
     transaction_id: int,
     db: AsyncSession = Depends(get_db),
-    user: User = Depends(get_current_user)
+    user: Principal = Depends(get_principal)
 ):
     """Delete budget transaction"""
     result = await db.execute(
@@ -228,11 +227,11 @@ async def delete_transaction(
 
 # ========== Summary ==========
 
-@router.get("/summary", response_model=BudgetSummary)
+@router.get("/summary", response_model=BudgetSummary, dependencies=[Depends(rate_limit(COST_READ))])
 async def get_summary(
     period: str = Query("month", regex="^(week|month|year|all)$"),
     db: AsyncSession = Depends(get_db),
-    user: User = Depends(get_current_user)
+    user: Principal = Depends(get_principal)
 ):
     """Get budget summary for period"""
     # Calculate date range
@@ -304,11 +303,11 @@ async def get_summary(
 
 # ========== Chart Data ==========
 
-@router.get("/chart-data", response_model=BudgetChartData)
+@router.get("/chart-data", response_model=BudgetChartData, dependencies=[Depends(rate_limit(COST_READ))])
 async def get_chart_data(
     period: str = Query("month", pattern="^(week|month|year|all)$"),
     db: AsyncSession = Depends(get_db),
-    user: User = Depends(get_current_user)
+    user: Principal = Depends(get_principal)
 ):
     """Get aggregated data for budget charts"""
     # Calculate date range
@@ -391,15 +390,8 @@ async def get_chart_data(
 
 # ========== Export ==========
 
-@router.get("/export/csv")
-async def export_budget_csv(
-    period: str = Query("month", pattern="^(week|month|year|all)$"),
-    db: AsyncSession = Depends(get_db),
-    user: User = Depends(get_current_user)
-):
-    """Export budget transactions as CSV file"""
-    # Calculate date range
-    now = datetime.utcnow()
+def _export_transactions(user: Principal, period: str, now: datetime):
+    """Budget transactions of the period with their category (columns only, newest first)"""
     if period == "week":
         start_date = now - timedelta(days=7)
     elif period == "month":
@@ -409,95 +401,106 @@ async def export_budget_csv(
     else:
         start_date = None
     
-    # Get transactions
-    tx_query = select(BudgetTransaction).where(BudgetTransaction.user_id == user.id)
+    tx_query = (
+        select(
+            BudgetTransaction.id, BudgetTransaction.date, BudgetTransaction.amount,
+            BudgetTransaction.description, BudgetCategory.name.label("category"),
+            BudgetCategory.type, BudgetCategory.icon
+        )
+        .outerjoin(BudgetCategory, BudgetCategory.id == BudgetTransaction.category_id)
+        .where(BudgetTransaction.user_id == user.id)
+    )
     if start_date:
         tx_query = tx_query.where(BudgetTransaction.date >= start_date)
-    tx_query = tx_query.options(selectinload(BudgetTransaction.category))
-    tx_query = tx_query.order_by(BudgetTransaction.date.desc())
-    
-    result = await db.execute(tx_query)
-    transactions = result.scalars().all()
-    
-    # Build CSV
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(["Date", "Category", "Type", "Amount", "Description"])
-    
-    for tx in transactions:
-        writer.writerow([
-            tx.date.strftime("%Y-%m-%d %H:%M"),
-            tx.category.name if tx.category else "Unknown",
-            tx.category.type.value if tx.category else "unknown",
-            tx.amount,
-            tx.description
-        ])
-    
-    output.seek(0)
+    return tx_query.order_by(BudgetTransaction.date.desc())
+
+
+def _transactions_arrow_schema(pa):
+    """Typed columns of _export_transactions for Parquet / Arrow"""
+    return pa.schema([
+        ("id", pa.int64()),
+        ("date", pa.timestamp("us")),
+        ("amount", pa.decimal128(12, 2)),
+        ("description", pa.string()),
+        ("category", pa.dictionary(pa.int32(), pa.string())),
+        ("type", pa.dictionary(pa.int8(), pa.string())),
+        ("icon", pa.dictionary(pa.int32(), pa.string())),
+    ])
+
+
+def budget_csv_parts(user: Principal, period: str, now: datetime) -> list:
+    """CSV export of budget transactions, also used by export jobs"""
+    return [
+        [["Date", "Category", "Type", "Amount", "Description"]],
+        exports.Rows(_export_transactions(user, period, now), lambda row: [
+            row.date.strftime("%Y-%m-%d %H:%M"),
+            row.category or "Unknown",
+            row.type.value if row.type else "unknown",
+            row.amount,
+            row.description
+        ]),
+    ]
+
+
+@router.get("/export/csv", dependencies=[Depends(rate_limit(COST_BULK))])
+async def export_budget_csv(
+    period: str = Query("month", pattern="^(week|month|year|all)$"),
+    db: AsyncSession = Depends(get_db),
+    user: Principal = Depends(get_principal)
+):
+    """Export budget transactions as CSV file (streamed)"""
+    now = datetime.utcnow()
+    parts = budget_csv_parts(user, period, now)
     
     filename = f"budget_export_{period}_{now.strftime('%Y%m%d')}.csv"
-    
-    return StreamingResponse(
-        iter([output.getvalue()]),
-        media_type="text/csv",
-        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    return exports.streaming_response(
+        exports.own_session(db, lambda session: exports.csv_stream(session, parts)), "text/csv", filename
     )
 
 
-@router.get("/export/json")
+@router.get("/export/json", dependencies=[Depends(rate_limit(COST_BULK))])
 async def export_budget_json(
     period: str = Query("month", pattern="^(week|month|year|all)$"),
     db: AsyncSession = Depends(get_db),
-    user: User = Depends(get_current_user)
+    user: Principal = Depends(get_principal)
 ):
-    """Export budget transactions as JSON file"""
-    # Calculate date range
+    """Export budget transactions as JSON file (streamed)"""
     now = datetime.utcnow()
-    if period == "week":
-        start_date = now - timedelta(days=7)
-    elif period == "month":
-        start_date = now - timedelta(days=30)
-    elif period == "year":
-        start_date = now - timedelta(days=365)
-    else:
-        start_date = None
-    
-    # Get transactions
-    tx_query = select(BudgetTransaction).where(BudgetTransaction.user_id == user.id)
-    if start_date:
-        tx_query = tx_query.where(BudgetTransaction.date >= start_date)
-    tx_query = tx_query.options(selectinload(BudgetTransaction.category))
-    tx_query = tx_query.order_by(BudgetTransaction.date.desc())
-    
-    result = await db.execute(tx_query)
-    transactions = result.scalars().all()
-    
-    # Build JSON
-    data = {
+    document = {
         "export_date": now.isoformat(),
         "period": period,
-        "transactions": [
-            {
-                "id": tx.id,
-                "date": tx.date.isoformat(),
-                "category": tx.category.name if tx.category else None,
-                "type": tx.category.type.value if tx.category else None,
-                "icon": tx.category.icon if tx.category else None,
-                "amount": tx.amount,
-                "description": tx.description
-            }
-            for tx in transactions
-        ]
+        "transactions": exports.Rows(_export_transactions(user, period, now), lambda row: {
+            "id": row.id,
+            "date": row.date.isoformat(),
+            "category": row.category,
+            "type": row.type.value if row.type else None,
+            "icon": row.icon,
+            "amount": row.amount,
+            "description": row.description
+        }),
     }
     
-    output = io.StringIO()
-    json.dump(data, output, indent=2, ensure_ascii=False)
-    output.seek(0)
-    
     filename = f"budget_export_{period}_{now.strftime('%Y%m%d')}.json"
-    
-    return StreamingResponse(
-        iter([output.getvalue()]),
-        media_type="application/json",
-        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    return exports.streaming_response(
+        exports.own_session(db, lambda session: exports.json_stream(session, document)), "application/json", filename
     )
+
+
+@router.get("/export/{fmt}", dependencies=[Depends(rate_limit(COST_BULK))])
+async def export_budget_columnar(
+    fmt: str = Path(..., pattern="^(parquet|arrow)$"),
+    period: str = Query("month", pattern="^(week|month|year|all)$"),
+    db: AsyncSession = Depends(get_db),
+    user: Principal = Depends(get_principal)
+):
+    """Export budget transactions as Parquet or Arrow IPC stream (typed columns, streamed)"""
+    if exports.load_pyarrow() is None:
+        raise HTTPException(status_code=501, detail="Parquet/Arrow exports need the pyarrow package")
+    
+    media_type, extension = exports.COLUMNAR_FORMATS[fmt]
+    now = datetime.utcnow()
+    filename = f"budget_export_{period}_{now.strftime('%Y%m%d')}.{extension}"
+    body = exports.own_session(db, lambda session: exports.columnar_stream(
+        session, _export_transactions(user, period, now), _transactions_arrow_schema, fmt
+    ))
+    return exports.streaming_response(body, media_type, filename)
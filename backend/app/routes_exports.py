@@ -0,0 +1,92 @@
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import FileResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from datetime import datetime
+from uuid import UUID
+import os
+
+from app.db import get_db
+from app.limiter import COST_BULK, COST_READ, rate_limit
+from app.dependencies import get_principal
+from app.user_cache import Principal
+from app.models import ExportJob, ExportStatus
+from app.schemas import ExportJobRead
+from app import export_jobs
+
+router = APIRouter(prefix="/exports", tags=["Exports"])
+
+
+def _read(job: ExportJob) -> ExportJobRead:
+    return ExportJobRead(
+        id=job.id,
+        status=job.status.value,
+        created_at=job.created_at,
+        started_at=job.started_at,
+        finished_at=job.finished_at,
+        size_bytes=job.size_bytes,
+        error=job.error,
+        download_url=f"/exports/{job.id}/download" if job.status == ExportStatus.done else None
+    )
+
+
+async def _get_job(db: AsyncSession, job_id: UUID, user: Principal) -> ExportJob:
+    result = await db.execute(
+        select(ExportJob).where(ExportJob.id == job_id, ExportJob.user_id == user.id)
+    )
+    job = result.scalars().first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Export not found")
+    return job
+
+
+@router.post("", response_model=ExportJobRead, status_code=202, dependencies=[Depends(rate_limit(COST_BULK))])
+async def create_export(
+    db: AsyncSession = Depends(get_db),
+    user: Principal = Depends(get_principal)
+):
+    """Queue an export of the whole account (all portfolios + budget) as a zip archive"""
+    if export_jobs.queue_full():
+        raise HTTPException(status_code=503, detail="Export queue is full, try again later")
+    
+    job = await export_jobs.create_job(db, user.id)
+    if job is None:
+        raise HTTPException(status_code=429, detail="An export is already in progress")
+    
+    if not export_jobs.enqueue(job.id) and export_jobs.queue_full():
+        # Filled up since the check above: no worker would pick the job up
+        job.status = ExportStatus.failed
+        job.error = "Export queue is full"
+        job.finished_at = datetime.utcnow()
+        await db.commit()
+        raise HTTPException(status_code=503, detail="Export queue is full, try again later")
+    return _read(job)
+
+
+@router.get("/{job_id}", response_model=ExportJobRead, dependencies=[Depends(rate_limit(COST_READ))])
+async def get_export(
+    job_id: UUID,
+    db: AsyncSession = Depends(get_db),
+    user: Principal = Depends(get_principal)
+):
+    """Export job status (download_url once it's done)"""
+    return _read(await _get_job(db, job_id, user))
+
+
+@router.get("/{job_id}/download", dependencies=[Depends(rate_limit(COST_READ))])
+async def download_export(
+    job_id: UUID,
+    db: AsyncSession = Depends(get_db),
+    user: Principal = Depends(get_principal)
+):
+    """Download a finished export archive (streamed from disk)"""
+    job = await _get_job(db, job_id, user)
+    path = export_jobs.archive_path(job.id)
+    if job.status != ExportStatus.done or not os.path.exists(path):
+        raise HTTPException(status_code=409, detail=f"Export is {job.status.value}")
+    
+    return FileResponse(
+        path,
+        media_type="application/zip",
+        filename=f"dilfwallet_export_{job.created_at.strftime('%Y%m%d')}.zip"
+    )
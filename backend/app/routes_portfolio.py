@@ -1,36 +1,41 @@
-from fastapi import APIRouter, Depends, HTTPException
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, Depends, File, HTTPException, Path, Query, UploadFile
+from sqlalchemy import case, func, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy.orm import selectinload
 from app.db import get_db
-from app.dependencies import get_current_user
+from app.limiter import COST_BULK, COST_PRICED, COST_READ, COST_WRITE, rate_limit
+from app.dependencies import get_principal, get_user_portfolio
 from app.models import (
-    User, Portfolio, PortfolioEntry, Transaction, 
-    TransactionType, PortfolioType
+    Portfolio, PortfolioEntry, Transaction, 
+    TransactionType, PortfolioType, CostBasisMethod
 )
 from app.schemas import (
     PortfolioCreate, PortfolioRead, PortfolioEntryCreate, PortfolioEntryRead,
     PortfolioSummary, PortfolioItemSummary, TransactionCreate, TransactionRead, 
-    TransactionWithPL
+    TransactionWithPL, PortfolioHistory, PortfolioHistoryPoint,
+    Dashboard, DashboardPortfolio, DashboardHolding, RealizedItem, RealizedReport,
+    TransactionImportResult, ImportRowError
 )
-from app.price_service import get_multiple_prices_by_type
-from typing import List, Dict
+from app.user_cache import Principal
+from app.price_service import get_multiple_quotes_by_type, get_quotes_across_types
+from app import exports, pnl_engine, portfolio_snapshots, tax_lots, transaction_import
+from typing import List, Dict, Optional
 from collections import defaultdict
-from datetime import datetime
-import csv
-import io
-import json
+from datetime import date, datetime
+from decimal import Decimal
+
+import numpy as np
 
 router = APIRouter()
 
 
 # ========== Portfolio CRUD ==========
 
-@router.get("/portfolios", response_model=List[PortfolioRead])
+@router.get("/portfolios", response_model=List[PortfolioRead], dependencies=[Depends(rate_limit(COST_READ))])
 async def get_portfolios(
     db: AsyncSession = Depends(get_db), 
-    user: User = Depends(get_current_user)
+    user: Principal = Depends(get_principal)
 ):
     """Get all user's portfolios"""
     result = await db.execute(
@@ -44,27 +49,33 @@ async def get_portfolios(
             id=p.id, 
             name=p.name, 
             type=p.type.value,
+            cost_basis_method=p.cost_basis_method.value,
             created_at=p.created_at
         ) for p in portfolios
     ]
 
 
-@router.post("/portfolios", response_model=PortfolioRead)
+@router.post("/portfolios", response_model=PortfolioRead, dependencies=[Depends(rate_limit(COST_WRITE))])
 async def create_portfolio(
     data: PortfolioCreate,
     db: AsyncSession = Depends(get_db),
-    user: User = Depends(get_current_user)
+    user: Principal = Depends(get_principal)
 ):
     """Create new portfolio"""
     try:
         ptype = PortfolioType(data.type)
     except ValueError:
         raise HTTPException(status_code=400, detail=f"Invalid portfolio type: {data.type}")
+    try:
+        method = CostBasisMethod(data.cost_basis_method)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid cost basis method: {data.cost_basis_method}")
     
     portfolio = Portfolio(
         user_id=user.id,
         name=data.name,
-        type=ptype
+        type=ptype,
+        cost_basis_method=method
     )
     db.add(portfolio)
     await db.commit()
@@ -74,27 +85,17 @@ async def create_portfolio(
         id=portfolio.id,
         name=portfolio.name,
         type=portfolio.type.value,
+        cost_basis_method=portfolio.cost_basis_method.value,
         created_at=portfolio.created_at
     )
 
 
-@router.delete("/portfolios/{portfolio_id}")
+@router.delete("/portfolios/{portfolio_id}", dependencies=[Depends(rate_limit(COST_WRITE))])
 async def delete_portfolio(
-    portfolio_id: int,
     db: AsyncSession = Depends(get_db),
-    user: User = Depends(get_current_user)
+    portfolio: Portfolio = Depends(get_user_portfolio)
 ):
     """Delete portfolio and all its entries"""
-    result = await db.execute(
-        select(Portfolio).where(
-            Portfolio.id == portfolio_id,
-            Portfolio.user_id == user.id
-        )
-    )
-    portfolio = result.scalars().first()
-    if not portfolio:
-        raise HTTPException(status_code=404, detail="Portfolio not found")
-    
     await db.delete(portfolio)
     await db.commit()
     return {"message": "Portfolio deleted"}
@@ -102,130 +103,93 @@ async def delete_portfolio(
 
 # ========== Portfolio Entries ==========
 
-@router.post("/portfolios/{portfolio_id}/entries", response_model=PortfolioEntryRead)
+def _buy_values(quantity: Decimal, price: Decimal) -> dict:
+    """UPDATE values adding a buy to an entry: amount and weighted average price, computed in SQL"""
+    new_amount = PortfolioEntry.amount + quantity
+    return {
+        "amount": new_amount,
+        "purchase_price": case(
+            (new_amount > 0, (PortfolioEntry.amount * PortfolioEntry.purchase_price + quantity * price) / new_amount),
+            else_=price
+        ),
+    }
+
+
+@router.post("/portfolios/{portfolio_id}/entries", response_model=PortfolioEntryRead, dependencies=[Depends(rate_limit(COST_WRITE))])
 async def add_entry(
-    portfolio_id: int,
     entry: PortfolioEntryCreate,
     db: AsyncSession = Depends(get_db),
-    user: User = Depends(get_current_user)
+    portfolio: Portfolio = Depends(get_user_portfolio)
 ):
     """Add asset to portfolio"""
-    # Verify portfolio belongs to user
-    pf_result = await db.execute(
-        select(Portfolio).where(
-            Portfolio.id == portfolio_id,
-            Portfolio.user_id == user.id
-        )
-    )
-    portfolio = pf_result.scalars().first()
-    if not portfolio:
-        raise HTTPException(status_code=404, detail="Portfolio not found")
-    
-    # Check if entry with same symbol exists
-    existing = await db.execute(
-        select(PortfolioEntry).where(
-            PortfolioEntry.portfolio_id == portfolio_id,
-            PortfolioEntry.symbol == entry.symbol.upper()
-        )
+    symbol = entry.symbol.upper()
+    # Existing symbol: add to it in one UPDATE ... RETURNING, no read-modify-write
+    result = await db.execute(
+        update(PortfolioEntry)
+        .where(PortfolioEntry.portfolio_id == portfolio.id, PortfolioEntry.symbol == symbol)
+        .values(**_buy_values(Decimal(str(entry.amount)), Decimal(str(entry.purchase_price))))
+        .returning(PortfolioEntry)
     )
-    existing_entry = existing.scalars().first()
-    
-    if existing_entry:
-        # Update existing entry with weighted average price
-        total_cost = existing_entry.amount * existing_entry.purchase_price + entry.amount * entry.purchase_price
-        new_amount = existing_entry.amount + entry.amount
-        existing_entry.purchase_price = total_cost / new_amount if new_amount > 0 else entry.purchase_price
-        existing_entry.amount = new_amount
-        
-        # Create transaction
-        tx = Transaction(
-            portfolio_entry_id=existing_entry.id,
-            symbol=entry.symbol.upper(),
-            quantity=entry.amount,
-            price=entry.purchase_price,
-            type=TransactionType.buy
-        )
-        db.add(tx)
-        await db.commit()
-        await db.refresh(existing_entry)
-        return existing_entry
-    else:
-        # Create new entry
-        new_entry = PortfolioEntry(
-            portfolio_id=portfolio_id,
-            symbol=entry.symbol.upper(),
+    pe = result.scalars().first()
+    if pe is None:
+        pe = PortfolioEntry(
+            portfolio_id=portfolio.id,
+            symbol=symbol,
             amount=entry.amount,
             purchase_price=entry.purchase_price
         )
-        db.add(new_entry)
-        await db.commit()
-        await db.refresh(new_entry)
-        
-        # Create initial transaction
-        tx = Transaction(
-            portfolio_entry_id=new_entry.id,
-            symbol=entry.symbol.upper(),
-            quantity=entry.amount,
-            price=entry.purchase_price,
-            type=TransactionType.buy
-        )
-        db.add(tx)
-        await db.commit()
-        
-        return new_entry
+        db.add(pe)
+        await db.flush()  # id for the transaction and lot, committed together below
+    
+    # Create transaction
+    tx = Transaction(
+        portfolio_entry_id=pe.id,
+        symbol=symbol,
+        quantity=entry.amount,
+        price=entry.purchase_price,
+        type=TransactionType.buy
+    )
+    db.add(tx)
+    tax_lots.open_lot(db, pe, tx)
+    await db.commit()
+    return pe
 
 
-@router.get("/portfolios/{portfolio_id}/entries", response_model=List[PortfolioEntryRead])
+@router.get("/portfolios/{portfolio_id}/entries", response_model=List[PortfolioEntryRead], dependencies=[Depends(rate_limit(COST_READ))])
 async def get_entries(
-    portfolio_id: int,
     db: AsyncSession = Depends(get_db),
-    user: User = Depends(get_current_user)
+    portfolio: Portfolio = Depends(get_user_portfolio)
 ):
     """Get all entries in portfolio"""
-    # Verify portfolio belongs to user
-    pf_result = await db.execute(
-        select(Portfolio).where(
-            Portfolio.id == portfolio_id,
-            Portfolio.user_id == user.id
-        )
-    )
-    if not pf_result.scalars().first():
-        raise HTTPException(status_code=404, detail="Portfolio not found")
-    
     result = await db.execute(
-        select(PortfolioEntry).where(PortfolioEntry.portfolio_id == portfolio_id)
+        select(PortfolioEntry).where(PortfolioEntry.portfolio_id == portfolio.id)
     )
     return result.scalars().all()
 
 
-@router.delete("/portfolios/{portfolio_id}/entries/{entry_id}")
+@router.delete("/portfolios/{portfolio_id}/entries/{entry_id}", dependencies=[Depends(rate_limit(COST_WRITE))])
 async def delete_entry(
-    portfolio_id: int,
     entry_id: int,
     db: AsyncSession = Depends(get_db),
-    user: User = Depends(get_current_user)
+    portfolio: Portfolio = Depends(get_user_portfolio)
 ):
     """Delete entry from portfolio"""
-    # Verify portfolio belongs to user
-    pf_result = await db.execute(
-        select(Portfolio).where(
-            Portfolio.id == portfolio_id,
-            Portfolio.user_id == user.id
-        )
-    )
-    if not pf_result.scalars().first():
-        raise HTTPException(status_code=404, detail="Portfolio not found")
-    
     result = await db.execute(
         select(PortfolioEntry).where(
             PortfolioEntry.id == entry_id,
-            PortfolioEntry.portfolio_id == portfolio_id
+            PortfolioEntry.portfolio_id == portfolio.id
         )
     )
     entry = result.scalars().first()
     if not entry:
         raise HTTPException(status_code=404, detail="Entry not found")
-    
+
+    # Snapshots carry holdings forward: drop every one the entry is part of
+    first_tx_at = await db.scalar(
+        select(func.min(Transaction.date)).where(Transaction.portfolio_entry_id == entry.id)
+    )
+    since = first_tx_at.date() if first_tx_at else datetime.utcnow().date()
+    await portfolio_snapshots.invalidate_snapshots(db, portfolio.id, since)
     await db.delete(entry)
     await db.commit()
     return {"message": "Entry deleted"}
@@ -233,188 +197,390 @@ async def delete_entry(
 
 # ========== Portfolio Summary ==========
 
-@router.get("/portfolios/{portfolio_id}/summary", response_model=PortfolioSummary)
+@router.get("/portfolios/{portfolio_id}/summary", response_model=PortfolioSummary, dependencies=[Depends(rate_limit(COST_PRICED))])
 async def get_portfolio_summary(
-    portfolio_id: int,
+    include_transactions: bool = False,
+    limit: int = Query(50, ge=1, le=500),
+    offset: int = Query(0, ge=0),
     db: AsyncSession = Depends(get_db),
-    user: User = Depends(get_current_user)
+    portfolio: Portfolio = Depends(get_user_portfolio)
 ):
-    """Get portfolio summary with current prices and P&L"""
-    # Get portfolio
-    pf_result = await db.execute(
-        select(Portfolio).where(
-            Portfolio.id == portfolio_id,
-            Portfolio.user_id == user.id
-        )
-    )
-    portfolio = pf_result.scalars().first()
-    if not portfolio:
-        raise HTTPException(status_code=404, detail="Portfolio not found")
-    
-    # Get entries
-    entries_result = await db.execute(
-        select(PortfolioEntry).where(PortfolioEntry.portfolio_id == portfolio_id)
-    )
-    entries = entries_result.scalars().all()
-    
-    if not entries:
-        return PortfolioSummary(
-            portfolio=PortfolioRead(
-                id=portfolio.id,
-                name=portfolio.name,
-                type=portfolio.type.value,
-                created_at=portfolio.created_at
-            ),
-            items=[],
-            total_invested=0.0,
-            total_current_value=0.0,
-            total_profit_loss=0.0,
-            total_profit_loss_percentage=0.0
+    """
+    Get portfolio summary with current prices and P&L
+
+    The portfolio comes with the auth query (get_user_portfolio); entries
+    and per-entry transaction aggregates from one more. Positions and P&L
+    per entry come from the portfolio's transactions, loaded column-wise
+    and reduced per entry by pnl_engine. Per-transaction P&L rows are opt-in (include_transactions=true),
+    newest first, paginated across the portfolio with limit/offset.
+    """
+    tx_stats = (
+        select(
+            PortfolioEntry.id.label("entry_id"),
+            func.count(Transaction.id).label("tx_count"),
+            func.max(Transaction.date).label("last_tx_at"),
         )
-    
-    # Get transactions
-    entry_ids = [e.id for e in entries]
-    tx_result = await db.execute(
-        select(Transaction)
-        .where(Transaction.portfolio_entry_id.in_(entry_ids))
-        .order_by(Transaction.date.desc())
+        .join(PortfolioEntry, PortfolioEntry.id == Transaction.portfolio_entry_id)
+        .where(PortfolioEntry.portfolio_id == portfolio.id)
+        # Entries come off ix_portfolio_entries_portfolio in id order: no sort to group
+        .group_by(PortfolioEntry.id)
+        .subquery()
     )
-    all_transactions = tx_result.scalars().all()
-    
-    tx_by_entry: Dict[int, list] = defaultdict(list)
-    for tx in all_transactions:
-        tx_by_entry[tx.portfolio_entry_id].append(tx)
-    
+    rows = (await db.execute(
+        select(PortfolioEntry, tx_stats.c.tx_count, tx_stats.c.last_tx_at)
+        .outerjoin(tx_stats, tx_stats.c.entry_id == PortfolioEntry.id)
+        .where(PortfolioEntry.portfolio_id == portfolio.id)
+        .order_by(PortfolioEntry.id)
+    )).all()
+    entries = [(entry, tx_count or 0, last_tx_at) for entry, tx_count, last_tx_at in rows]
+
     # Get current prices for all portfolio types
-    symbols = list(set([e.symbol for e in entries]))
-    prices = await get_multiple_prices_by_type(symbols, portfolio.type.value)
-    
+    symbols = list(set(entry.symbol for entry, _, _ in entries))
+    quotes = await get_multiple_quotes_by_type(symbols, portfolio.type.value) if symbols else {}
+
+    # Optional page of transactions with per-transaction P&L
+    tx_by_entry: Dict[int, list] = defaultdict(list)
+    if include_transactions and entries:
+        tx_result = await db.execute(
+            select(Transaction)
+            .join(PortfolioEntry, PortfolioEntry.id == Transaction.portfolio_entry_id)
+            .where(PortfolioEntry.portfolio_id == portfolio.id)
+            .order_by(Transaction.date.desc())
+            .limit(limit)
+            .offset(offset)
+        )
+        for tx in _transactions_with_pl(tx_result.scalars().all(), [e for e, _, _ in entries], quotes):
+            tx_by_entry[tx[0]].append(tx[1])
+
+    # Per-entry position and P&L from every transaction, vectorized
+    entry_list = [entry for entry, _, _ in entries]
+    tx = await pnl_engine.load_transactions(db, [portfolio.id], [entry.id for entry in entry_list])
+    prices = {symbol: quote.price if quote else None for symbol, quote in quotes.items()}
+    pnl = pnl_engine.entry_pnl(tx, pnl_engine.prices_for_entries([e.symbol for e in entry_list], prices))
+    none_if_nan = pnl_engine.none_if_nan
+
     items = []
-    total_invested = 0.0
-    total_current_value = 0.0
-    
-    for entry in entries:
-        current_price = prices.get(entry.symbol)
-        invested = entry.amount * entry.purchase_price
-        current_value = entry.amount * current_price if current_price else invested
-        profit_loss = current_value - invested if current_price else None
-        profit_loss_pct = (profit_loss / invested * 100) if invested > 0 and profit_loss is not None else None
-        
-        # Build transaction list
-        tx_list = []
-        for tx in tx_by_entry.get(entry.id, []):
-            tx_qty = float(tx.quantity)
-            tx_price = float(tx.price)
-            tx_invested = tx_qty * tx_price
-            
-            if tx.type == TransactionType.buy and current_price:
-                tx_current_value = tx_qty * current_price
-                tx_pl = tx_current_value - tx_invested
-                tx_pl_pct = (tx_pl / tx_invested * 100) if tx_invested > 0 else 0
-            else:
-                tx_current_value = None
-                tx_pl = None
-                tx_pl_pct = None
-            
-            tx_list.append(TransactionWithPL(
-                id=tx.id,
-                date=tx.date,
-                type=tx.type.value,
-                quantity=tx_qty,
-                price=tx_price,
-                current_price=current_price,
-                invested=tx_invested,
-                current_value=tx_current_value,
-                profit_loss=tx_pl,
-                profit_loss_percentage=tx_pl_pct
-            ))
-        
+    for i, (entry, tx_count, last_tx_at) in enumerate(entries):
+        quote = quotes.get(entry.symbol)
+        current_price = quote.price if quote else None
         items.append(PortfolioItemSummary(
             symbol=entry.symbol,
-            amount=entry.amount,
-            avg_purchase_price=entry.purchase_price,
+            amount=float(pnl.amount[i]),
+            avg_purchase_price=float(pnl.avg_price[i]),
             current_price=current_price,
-            total_value=current_value if current_price else None,
-            profit_loss=profit_loss,
-            profit_loss_percentage=profit_loss_pct,
-            transactions=tx_list
+            price_as_of=quote.as_of if quote else None,
+            total_value=float(pnl.current_value[i]) if current_price else None,
+            profit_loss=none_if_nan(pnl.profit_loss[i]),
+            profit_loss_percentage=none_if_nan(pnl.profit_loss_percentage[i]),
+            transaction_count=tx_count,
+            last_transaction_at=last_tx_at,
+            transactions=tx_by_entry.get(entry.id, [])
         ))
-        
-        total_invested += invested
-        total_current_value += current_value
-    
+
+    total_invested = float(pnl.invested.sum())
+    total_current_value = float(pnl.current_value.sum())
     total_profit_loss = total_current_value - total_invested
     total_profit_loss_pct = (total_profit_loss / total_invested * 100) if total_invested > 0 else 0.0
-    
+    as_of_values = [item.price_as_of for item in items if item.price_as_of]
+
     return PortfolioSummary(
         portfolio=PortfolioRead(
             id=portfolio.id,
             name=portfolio.name,
             type=portfolio.type.value,
+            cost_basis_method=portfolio.cost_basis_method.value,
             created_at=portfolio.created_at
         ),
         items=items,
         total_invested=total_invested,
         total_current_value=total_current_value,
         total_profit_loss=total_profit_loss,
-        total_profit_loss_percentage=total_profit_loss_pct
+        total_profit_loss_percentage=total_profit_loss_pct,
+        prices_as_of=min(as_of_values) if as_of_values else None,
+        transactions_total=sum(tx_count for _, tx_count, _ in entries)
+    )
+
+
+def _transactions_with_pl(transactions: list, entries: list, quotes: dict) -> list:
+    """(entry_id, TransactionWithPL) for each transaction, P&L computed by the vectorized engine"""
+    tx = pnl_engine.from_rows(
+        ((t.portfolio_entry_id, t.quantity, t.price, t.type) for t in transactions),
+        [entry.id for entry in entries],
+    )
+    prices = {symbol: quote.price if quote else None for symbol, quote in quotes.items()}
+    pnl = pnl_engine.transaction_pnl(tx, pnl_engine.prices_for_entries([e.symbol for e in entries], prices))
+
+    none_if_nan = pnl_engine.none_if_nan
+    # Plain floats first: indexing arrays per row costs more than the math saves
+    columns = zip(
+        tx.quantity.tolist(), tx.price.tolist(), pnl.current_price.tolist(), pnl.invested.tolist(),
+        pnl.current_value.tolist(), pnl.profit_loss.tolist(), pnl.profit_loss_percentage.tolist(),
+    )
+    return [
+        (t.portfolio_entry_id, TransactionWithPL(
+            id=t.id,
+            date=t.date,
+            type=t.type.value,
+            quantity=quantity,
+            price=price,
+            current_price=none_if_nan(current_price),
+            invested=invested,
+            current_value=none_if_nan(current_value),
+            profit_loss=none_if_nan(profit_loss),
+            profit_loss_percentage=none_if_nan(pct)
+        ))
+        for t, (quantity, price, current_price, invested, current_value, profit_loss, pct) in zip(transactions, columns)
+    ]
+
+
+# ========== Dashboard ==========
+
+def _pl_pct(profit_loss: Optional[float], invested: float) -> Optional[float]:
+    return (profit_loss / invested * 100) if invested > 0 and profit_loss is not None else None
+
+
+@router.get("/dashboard", response_model=Dashboard, dependencies=[Depends(rate_limit(COST_PRICED))])
+async def get_dashboard(
+    db: AsyncSession = Depends(get_db),
+    user: Principal = Depends(get_principal)
+):
+    """
+    All portfolios of the user with totals, plus every held symbol
+    consolidated across portfolios.
+
+    Three queries however many portfolios there are (portfolios + entries,
+    transaction aggregates, transaction columns for pnl_engine) and one
+    price batch per provider.
+    """
+    rows = (await db.execute(
+        select(Portfolio, PortfolioEntry)
+        .outerjoin(PortfolioEntry, PortfolioEntry.portfolio_id == Portfolio.id)
+        .where(Portfolio.user_id == user.id)
+        .order_by(Portfolio.created_at, Portfolio.id, PortfolioEntry.id)
+    )).all()
+
+    tx_stats = {
+        portfolio_id: (count, last_date)
+        for portfolio_id, count, last_date in (await db.execute(
+            select(Portfolio.id, func.count(Transaction.id), func.max(Transaction.date))
+            .join(PortfolioEntry, PortfolioEntry.portfolio_id == Portfolio.id)
+            .join(Transaction, Transaction.portfolio_entry_id == PortfolioEntry.id)
+            .where(Portfolio.user_id == user.id)
+            # ix_portfolios_user_created order, so grouping needs no sort
+            .group_by(Portfolio.created_at, Portfolio.id)
+        )).all()
+    }
+
+    portfolios: Dict[int, Portfolio] = {}
+    entries = []
+    symbols_by_type: Dict[str, list] = defaultdict(list)
+    for portfolio, entry in rows:
+        portfolios[portfolio.id] = portfolio
+        if entry is not None:
+            entries.append((portfolio, entry))
+            symbols_by_type[portfolio.type.value].append(entry.symbol)
+
+    quotes = await get_quotes_across_types(symbols_by_type) if symbols_by_type else {}
+    entry_quotes = [quotes.get(portfolio.type.value, {}).get(entry.symbol) for portfolio, entry in entries]
+
+    # Per-entry positions from every transaction, then grouped per portfolio and per symbol
+    tx = await pnl_engine.load_transactions(db, list(portfolios), [entry.id for _, entry in entries])
+    pnl = pnl_engine.entry_pnl(tx, np.asarray(
+        [quote.price if quote and quote.price else np.nan for quote in entry_quotes], dtype=np.float64
+    ))
+    position = {portfolio_id: i for i, portfolio_id in enumerate(portfolios)}
+    portfolio_index = np.asarray([position[portfolio.id] for portfolio, _ in entries], dtype=np.int64)
+    invested_by_portfolio, value_by_portfolio = pnl_engine.group_totals(
+        portfolio_index, len(portfolios), pnl.invested, pnl.current_value
+    )
+
+    as_of_by_portfolio: Dict[int, list] = defaultdict(list)
+    consolidated: Dict[tuple, dict] = {}
+    holding_index = []
+    for i, ((portfolio, entry), quote) in enumerate(zip(entries, entry_quotes)):
+        if quote:
+            as_of_by_portfolio[portfolio.id].append(quote.as_of)
+        if pnl.amount[i] > 0:
+            holding = consolidated.setdefault((entry.symbol, portfolio.type.value), {
+                "index": len(consolidated), "quote": quote, "portfolio_ids": [],
+            })
+            holding["portfolio_ids"].append(portfolio.id)
+            holding_index.append((i, holding["index"]))
+
+    portfolio_items = []
+    for i, portfolio in enumerate(portfolios.values()):
+        invested_total, value_total = float(invested_by_portfolio[i]), float(value_by_portfolio[i])
+        as_of_values = as_of_by_portfolio[portfolio.id]
+        count, last_date = tx_stats.get(portfolio.id, (0, None))
+        portfolio_items.append(DashboardPortfolio(
+            portfolio=PortfolioRead(
+                id=portfolio.id,
+                name=portfolio.name,
+                type=portfolio.type.value,
+                cost_basis_method=portfolio.cost_basis_method.value,
+                created_at=portfolio.created_at
+            ),
+            total_invested=invested_total,
+            total_current_value=value_total,
+            total_profit_loss=value_total - invested_total,
+            total_profit_loss_percentage=_pl_pct(value_total - invested_total, invested_total) or 0.0,
+            transaction_count=count,
+            last_transaction_at=last_date,
+            prices_as_of=min(as_of_values) if as_of_values else None
+        ))
+
+    held = np.asarray([i for i, _ in holding_index], dtype=np.int64)
+    amount_by_holding, invested_by_holding = pnl_engine.group_totals(
+        np.asarray([h for _, h in holding_index], dtype=np.int64), len(consolidated),
+        pnl.amount[held], pnl.invested[held]
+    )
+    holdings = []
+    for (symbol, ptype), holding in consolidated.items():
+        quote = holding["quote"]
+        amount = float(amount_by_holding[holding["index"]])
+        invested = float(invested_by_holding[holding["index"]])
+        current_value = amount * quote.price if quote else None
+        profit_loss = current_value - invested if current_value is not None else None
+        holdings.append(DashboardHolding(
+            symbol=symbol,
+            type=ptype,
+            amount=amount,
+            avg_purchase_price=invested / amount,
+            current_price=quote.price if quote else None,
+            price_as_of=quote.as_of if quote else None,
+            total_value=current_value,
+            profit_loss=profit_loss,
+            profit_loss_percentage=_pl_pct(profit_loss, invested),
+            portfolio_ids=holding["portfolio_ids"]
+        ))
+    holdings.sort(key=lambda h: h.total_value or 0.0, reverse=True)
+
+    total_invested = sum(p.total_invested for p in portfolio_items)
+    total_current_value = sum(p.total_current_value for p in portfolio_items)
+    as_of_values = [p.prices_as_of for p in portfolio_items if p.prices_as_of]
+    return Dashboard(
+        portfolios=portfolio_items,
+        holdings=holdings,
+        total_invested=total_invested,
+        total_current_value=total_current_value,
+        total_profit_loss=total_current_value - total_invested,
+        total_profit_loss_percentage=_pl_pct(total_current_value - total_invested, total_invested) or 0.0,
+        prices_as_of=min(as_of_values) if as_of_values else None
+    )
+
+
+# ========== History ==========
+
+@router.get("/portfolios/{portfolio_id}/history", response_model=PortfolioHistory, dependencies=[Depends(rate_limit(COST_PRICED))])
+async def get_portfolio_history(
+    from_date: Optional[date] = Query(None, alias="from"),
+    to_date: Optional[date] = Query(None, alias="to"),
+    granularity: str = Query("day", pattern="^(day|week|month)$"),
+    db: AsyncSession = Depends(get_db),
+    portfolio: Portfolio = Depends(get_user_portfolio)
+):
+    """Portfolio value over time from daily snapshots (missing days are filled first)"""
+    if from_date and to_date and from_date > to_date:
+        raise HTTPException(status_code=400, detail="'from' must not be after 'to'")
+
+    snapshots = await portfolio_snapshots.get_history(db, portfolio, from_date, to_date, granularity)
+
+    return PortfolioHistory(
+        portfolio_id=portfolio.id,
+        granularity=granularity,
+        points=[
+            PortfolioHistoryPoint(
+                date=snapshot.date,
+                invested=float(snapshot.invested),
+                market_value=float(snapshot.market_value),
+                profit_loss=float(snapshot.market_value) - float(snapshot.invested),
+                holdings={symbol: position["value"] for symbol, position in snapshot.holdings.items()},
+            )
+            for snapshot in snapshots
+        ]
+    )
+
+
+# ========== Realized P&L ==========
+
+@router.get("/portfolios/{portfolio_id}/realized", response_model=RealizedReport, dependencies=[Depends(rate_limit(COST_READ))])
+async def get_realized(
+    year: Optional[int] = Query(None, ge=1900, le=9999),
+    db: AsyncSession = Depends(get_db),
+    portfolio: Portfolio = Depends(get_user_portfolio)
+):
+    """Realized P&L per asset from the precomputed tax lots (optionally for one calendar year)"""
+    items = [
+        RealizedItem(
+            entry_id=entry_id,
+            symbol=symbol,
+            quantity_sold=float(quantity or 0),
+            proceeds=float(proceeds or 0),
+            cost_basis=float(cost_basis or 0),
+            realized_pl=float(realized_pl or 0),
+            realized_pl_total=float(realized_pl_total or 0),
+        )
+        for entry_id, symbol, realized_pl_total, quantity, proceeds, cost_basis, realized_pl
+        in await tax_lots.realized_by_entry(db, portfolio.id, year)
+    ]
+
+    return RealizedReport(
+        portfolio_id=portfolio.id,
+        year=year,
+        cost_basis_method=portfolio.cost_basis_method.value,
+        items=items,
+        total_proceeds=sum(item.proceeds for item in items),
+        total_cost_basis=sum(item.cost_basis for item in items),
+        total_realized_pl=sum(item.realized_pl for item in items),
     )
 
 
 # ========== Transactions ==========
 
-@router.post("/portfolios/{portfolio_id}/transactions", response_model=TransactionRead)
+@router.post("/portfolios/{portfolio_id}/transactions", response_model=TransactionRead, dependencies=[Depends(rate_limit(COST_WRITE))])
 async def create_transaction(
-    portfolio_id: int,
     transaction: TransactionCreate,
     db: AsyncSession = Depends(get_db),
-    user: User = Depends(get_current_user)
+    portfolio: Portfolio = Depends(get_user_portfolio)
 ):
     """Create BUY/SELL transaction"""
-    # Verify portfolio belongs to user
-    pf_result = await db.execute(
-        select(Portfolio).where(
-            Portfolio.id == portfolio_id,
-            Portfolio.user_id == user.id
-        )
-    )
-    if not pf_result.scalars().first():
-        raise HTTPException(status_code=404, detail="Portfolio not found")
-    
     if not transaction.portfolio_entry_id:
         raise HTTPException(status_code=400, detail="portfolio_entry_id is required")
     
-    # Get entry
-    pe_result = await db.execute(
-        select(PortfolioEntry).where(
-            PortfolioEntry.id == transaction.portfolio_entry_id,
-            PortfolioEntry.portfolio_id == portfolio_id
-        )
-    )
-    pe = pe_result.scalars().first()
-    if not pe:
-        raise HTTPException(status_code=404, detail="Portfolio entry not found")
-    
     try:
         tx_type = TransactionType(transaction.type)
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid transaction type")
     
-    quantity = float(transaction.quantity)
-    price = float(transaction.price)
+    # Numeric columns load as Decimal — keep the arithmetic in Decimal
+    quantity = transaction.quantity
+    price = transaction.price
     
+    # The entry is changed by one atomic UPDATE ... RETURNING (which also
+    # row-locks it on PostgreSQL until the commit), so parallel fills on
+    # one entry can't overwrite each other's amount
+    entry_filter = (
+        PortfolioEntry.id == transaction.portfolio_entry_id,
+        PortfolioEntry.portfolio_id == portfolio.id
+    )
     if tx_type == TransactionType.sell:
-        if pe.amount < quantity:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Insufficient balance. Available: {pe.amount}, requested: {quantity}"
-            )
-        pe.amount -= quantity
+        stmt = (
+            update(PortfolioEntry)
+            .where(*entry_filter, PortfolioEntry.amount >= quantity)
+            .values(amount=PortfolioEntry.amount - quantity)
+        )
     else:
-        total_cost = pe.amount * pe.purchase_price + quantity * price
-        new_amount = pe.amount + quantity
-        pe.purchase_price = total_cost / new_amount if new_amount > 0 else price
-        pe.amount = new_amount
+        stmt = update(PortfolioEntry).where(*entry_filter).values(**_buy_values(quantity, price))
+    pe = (await db.execute(stmt.returning(PortfolioEntry))).scalars().first()
+    
+    if pe is None:
+        available = await db.scalar(select(PortfolioEntry.amount).where(*entry_filter))
+        if available is None:
+            raise HTTPException(status_code=404, detail="Portfolio entry not found")
+        raise HTTPException(
+            status_code=400,
+            detail=f"Insufficient balance. Available: {available}, requested: {quantity}"
+        )
     
     new_tx = Transaction(
         portfolio_entry_id=pe.id,
@@ -424,8 +590,12 @@ async def create_transaction(
         type=tx_type
     )
     db.add(new_tx)
+    # Lots and realized P&L in the same commit as the transaction
+    if tx_type == TransactionType.sell:
+        await tax_lots.close_lots(db, pe, new_tx, portfolio.cost_basis_method)
+    else:
+        tax_lots.open_lot(db, pe, new_tx)
     await db.commit()
-    await db.refresh(new_tx)
     
     return TransactionRead(
         id=new_tx.id,
@@ -438,26 +608,41 @@ async def create_transaction(
     )
 
 
-@router.get("/portfolios/{portfolio_id}/transactions", response_model=List[TransactionRead])
+@router.post("/portfolios/{portfolio_id}/transactions/import", response_model=TransactionImportResult, dependencies=[Depends(rate_limit(COST_BULK))])
+async def import_transactions(
+    file: UploadFile = File(...),
+    format: Optional[str] = Query(None, pattern="^(csv|ndjson)$"),
+    db: AsyncSession = Depends(get_db),
+    portfolio: Portfolio = Depends(get_user_portfolio)
+):
+    """
+    Import BUY/SELL transactions from a CSV or NDJSON file
+    (columns: symbol, type, quantity, price, date). Invalid rows are
+    skipped and reported, the rest is written in one transaction.
+    """
+    fmt = format or transaction_import.detect_format(file.filename, file.content_type)
+    try:
+        result = await transaction_import.import_transactions(db, portfolio, file.file, fmt)
+    except transaction_import.ImportFormatError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return TransactionImportResult(
+        imported=result.imported,
+        failed=result.failed,
+        entries_updated=result.entries_updated,
+        errors=[ImportRowError(line=e.line, error=e.error) for e in result.errors]
+    )
+
+
+@router.get("/portfolios/{portfolio_id}/transactions", response_model=List[TransactionRead], dependencies=[Depends(rate_limit(COST_READ))])
 async def get_transactions(
-    portfolio_id: int,
     db: AsyncSession = Depends(get_db),
-    user: User = Depends(get_current_user)
+    portfolio: Portfolio = Depends(get_user_portfolio)
 ):
     """Get all transactions for portfolio"""
-    # Verify portfolio belongs to user
-    pf_result = await db.execute(
-        select(Portfolio).where(
-            Portfolio.id == portfolio_id,
-            Portfolio.user_id == user.id
-        )
-    )
-    if not pf_result.scalars().first():
-        raise HTTPException(status_code=404, detail="Portfolio not found")
-    
     # Get entry IDs
     entries_result = await db.execute(
-        select(PortfolioEntry.id).where(PortfolioEntry.portfolio_id == portfolio_id)
+        select(PortfolioEntry.id).where(PortfolioEntry.portfolio_id == portfolio.id)
     )
     entry_ids = [e for e in entries_result.scalars().all()]
     
@@ -486,122 +671,90 @@ async def get_transactions(
 
 # ========== Export ==========
 
-@router.get("/portfolios/{portfolio_id}/export/csv")
+def _export_holdings(portfolio_id: int):
+    return (
+        select(PortfolioEntry.symbol, PortfolioEntry.amount, PortfolioEntry.purchase_price)
+        .where(PortfolioEntry.portfolio_id == portfolio_id)
+        .order_by(PortfolioEntry.id)
+    )
+
+
+def _export_transactions(portfolio_id: int):
+    return (
+        select(Transaction.id, Transaction.date, Transaction.symbol, Transaction.type,
+               Transaction.quantity, Transaction.price)
+        .join(PortfolioEntry, PortfolioEntry.id == Transaction.portfolio_entry_id)
+        .where(PortfolioEntry.portfolio_id == portfolio_id)
+        .order_by(Transaction.date.desc())
+    )
+
+
+def _transactions_arrow_schema(pa):
+    """Typed columns of _export_transactions for Parquet / Arrow"""
+    return pa.schema([
+        ("id", pa.string()),
+        ("date", pa.timestamp("us")),
+        ("symbol", pa.dictionary(pa.int32(), pa.string())),
+        ("type", pa.dictionary(pa.int8(), pa.string())),
+        ("quantity", pa.decimal128(38, 12)),
+        ("price", pa.decimal128(38, 12)),
+    ])
+
+
+def portfolio_csv_parts(portfolio: Portfolio, now: datetime) -> list:
+    """CSV export of a portfolio (holdings + transactions), also used by export jobs"""
+    return [
+        # Portfolio info
+        [
+            ["Portfolio Export", portfolio.name],
+            ["Type", portfolio.type.value],
+            ["Export Date", now.strftime("%Y-%m-%d %H:%M")],
+            [],
+            ["=== HOLDINGS ==="],
+            ["Symbol", "Amount", "Avg Purchase Price", "Total Invested"],
+        ],
+        exports.Rows(_export_holdings(portfolio.id), lambda row: [
+            row.symbol, row.amount, row.purchase_price, row.amount * row.purchase_price
+        ]),
+        [
+            [],
+            ["=== TRANSACTIONS ==="],
+            ["Date", "Symbol", "Type", "Quantity", "Price", "Total"],
+        ],
+        exports.Rows(_export_transactions(portfolio.id), lambda row: [
+            row.date.strftime("%Y-%m-%d %H:%M"),
+            row.symbol,
+            row.type.value.upper(),
+            float(row.quantity),
+            float(row.price),
+            float(row.quantity) * float(row.price)
+        ]),
+    ]
+
+
+@router.get("/portfolios/{portfolio_id}/export/csv", dependencies=[Depends(rate_limit(COST_BULK))])
 async def export_portfolio_csv(
-    portfolio_id: int,
     db: AsyncSession = Depends(get_db),
-    user: User = Depends(get_current_user)
+    portfolio: Portfolio = Depends(get_user_portfolio)
 ):
-    """Export portfolio as CSV file"""
-    # Get portfolio
-    pf_result = await db.execute(
-        select(Portfolio).where(
-            Portfolio.id == portfolio_id,
-            Portfolio.user_id == user.id
-        )
-    )
-    portfolio = pf_result.scalars().first()
-    if not portfolio:
-        raise HTTPException(status_code=404, detail="Portfolio not found")
-    
-    # Get entries with transactions
-    entries_result = await db.execute(
-        select(PortfolioEntry).where(PortfolioEntry.portfolio_id == portfolio_id)
-    )
-    entries = entries_result.scalars().all()
-    
-    entry_ids = [e.id for e in entries]
-    tx_result = await db.execute(
-        select(Transaction)
-        .where(Transaction.portfolio_entry_id.in_(entry_ids))
-        .order_by(Transaction.date.desc())
-    ) if entry_ids else None
-    transactions = tx_result.scalars().all() if tx_result else []
-    
-    # Build CSV
-    output = io.StringIO()
-    writer = csv.writer(output)
-    
+    """Export portfolio as CSV file (streamed)"""
     now = datetime.utcnow()
-    
-    # Portfolio info
-    writer.writerow(["Portfolio Export", portfolio.name])
-    writer.writerow(["Type", portfolio.type.value])
-    writer.writerow(["Export Date", now.strftime("%Y-%m-%d %H:%M")])
-    writer.writerow([])
-    
-    # Holdings section
-    writer.writerow(["=== HOLDINGS ==="])
-    writer.writerow(["Symbol", "Amount", "Avg Purchase Price", "Total Invested"])
-    for entry in entries:
-        writer.writerow([
-            entry.symbol,
-            entry.amount,
-            entry.purchase_price,
-            entry.amount * entry.purchase_price
-        ])
-    writer.writerow([])
-    
-    # Transactions section
-    writer.writerow(["=== TRANSACTIONS ==="])
-    writer.writerow(["Date", "Symbol", "Type", "Quantity", "Price", "Total"])
-    for tx in transactions:
-        writer.writerow([
-            tx.date.strftime("%Y-%m-%d %H:%M"),
-            tx.symbol,
-            tx.type.value.upper(),
-            float(tx.quantity),
-            float(tx.price),
-            float(tx.quantity) * float(tx.price)
-        ])
-    
-    output.seek(0)
+    parts = portfolio_csv_parts(portfolio, now)
     
     filename = f"portfolio_{portfolio.name.replace(' ', '_')}_{now.strftime('%Y%m%d')}.csv"
-    
-    return StreamingResponse(
-        iter([output.getvalue()]),
-        media_type="text/csv",
-        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    return exports.streaming_response(
+        exports.own_session(db, lambda session: exports.csv_stream(session, parts)), "text/csv", filename
     )
 
 
-@router.get("/portfolios/{portfolio_id}/export/json")
+@router.get("/portfolios/{portfolio_id}/export/json", dependencies=[Depends(rate_limit(COST_BULK))])
 async def export_portfolio_json(
-    portfolio_id: int,
     db: AsyncSession = Depends(get_db),
-    user: User = Depends(get_current_user)
+    portfolio: Portfolio = Depends(get_user_portfolio)
 ):
-    """Export portfolio as JSON file"""
-    # Get portfolio
-    pf_result = await db.execute(
-        select(Portfolio).where(
-            Portfolio.id == portfolio_id,
-            Portfolio.user_id == user.id
-        )
-    )
-    portfolio = pf_result.scalars().first()
-    if not portfolio:
-        raise HTTPException(status_code=404, detail="Portfolio not found")
-    
-    # Get entries with transactions
-    entries_result = await db.execute(
-        select(PortfolioEntry).where(PortfolioEntry.portfolio_id == portfolio_id)
-    )
-    entries = entries_result.scalars().all()
-    
-    entry_ids = [e.id for e in entries]
-    tx_result = await db.execute(
-        select(Transaction)
-        .where(Transaction.portfolio_entry_id.in_(entry_ids))
-        .order_by(Transaction.date.desc())
-    ) if entry_ids else None
-    transactions = tx_result.scalars().all() if tx_result else []
-    
+    """Export portfolio as JSON file (streamed)"""
     now = datetime.utcnow()
-    
-    # Build JSON
-    data = {
+    document = {
         "export_date": now.isoformat(),
         "portfolio": {
             "id": portfolio.id,
@@ -609,37 +762,43 @@ async def export_portfolio_json(
             "type": portfolio.type.value,
             "created_at": portfolio.created_at.isoformat()
         },
-        "holdings": [
-            {
-                "symbol": entry.symbol,
-                "amount": entry.amount,
-                "avg_purchase_price": entry.purchase_price,
-                "total_invested": entry.amount * entry.purchase_price
-            }
-            for entry in entries
-        ],
-        "transactions": [
-            {
-                "id": str(tx.id),
-                "date": tx.date.isoformat(),
-                "symbol": tx.symbol,
-                "type": tx.type.value,
-                "quantity": float(tx.quantity),
-                "price": float(tx.price),
-                "total": float(tx.quantity) * float(tx.price)
-            }
-            for tx in transactions
-        ]
+        "holdings": exports.Rows(_export_holdings(portfolio.id), lambda row: {
+            "symbol": row.symbol,
+            "amount": row.amount,
+            "avg_purchase_price": row.purchase_price,
+            "total_invested": row.amount * row.purchase_price
+        }),
+        "transactions": exports.Rows(_export_transactions(portfolio.id), lambda row: {
+            "id": str(row.id),
+            "date": row.date.isoformat(),
+            "symbol": row.symbol,
+            "type": row.type.value,
+            "quantity": float(row.quantity),
+            "price": float(row.price),
+            "total": float(row.quantity) * float(row.price)
+        }),
     }
     
-    output = io.StringIO()
-    json.dump(data, output, indent=2, ensure_ascii=False)
-    output.seek(0)
-    
     filename = f"portfolio_{portfolio.name.replace(' ', '_')}_{now.strftime('%Y%m%d')}.json"
-    
-    return StreamingResponse(
-        iter([output.getvalue()]),
-        media_type="application/json",
-        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    return exports.streaming_response(
+        exports.own_session(db, lambda session: exports.json_stream(session, document)), "application/json", filename
     )
+
+
+@router.get("/portfolios/{portfolio_id}/export/{fmt}", dependencies=[Depends(rate_limit(COST_BULK))])
+async def export_portfolio_columnar(
+    fmt: str = Path(..., pattern="^(parquet|arrow)$"),
+    db: AsyncSession = Depends(get_db),
+    portfolio: Portfolio = Depends(get_user_portfolio)
+):
+    """Export portfolio transactions as Parquet or Arrow IPC stream (typed columns, streamed)"""
+    if exports.load_pyarrow() is None:
+        raise HTTPException(status_code=501, detail="Parquet/Arrow exports need the pyarrow package")
+    
+    media_type, extension = exports.COLUMNAR_FORMATS[fmt]
+    now = datetime.utcnow()
+    filename = f"portfolio_{portfolio.name.replace(' ', '_')}_transactions_{now.strftime('%Y%m%d')}.{extension}"
+    body = exports.own_session(db, lambda session: exports.columnar_stream(
+        session, _export_transactions(portfolio.id), _transactions_arrow_schema, fmt
+    ))
+    return exports.streaming_response(body, media_type, filename)
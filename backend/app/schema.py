@@ -0,0 +1,44 @@
+"""
+Database schema: `alembic upgrade head`, run from the app lifespan.
+
+Deploys start the app directly (render.yaml, Dockerfile), so migrations run
+on startup rather than in a separate step. Databases created by earlier
+versions with Base.metadata.create_all have no alembic_version table: they
+are stamped at the initial revision first, and later revisions skip the
+tables, columns and indexes create_all already made.
+"""
+import asyncio
+import logging
+import os
+
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import inspect
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.db import engine
+
+logger = logging.getLogger(__name__)
+
+ALEMBIC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "alembic")
+INITIAL_REVISION = "001_initial"
+
+
+def _config() -> Config:
+    # No alembic.ini: its logging config would replace the app's
+    config = Config()
+    config.set_main_option("script_location", ALEMBIC_DIR)
+    return config
+
+
+async def upgrade(db_engine: AsyncEngine = engine) -> None:
+    """Bring the database to the latest revision (alembic's env.py connects on its own)"""
+    async with db_engine.connect() as conn:
+        tables = set(await conn.run_sync(lambda sync_conn: inspect(sync_conn).get_table_names()))
+
+    config = _config()
+    # env.py runs its own event loop: keep it off the app's
+    if "alembic_version" not in tables and "users" in tables:
+        logger.info("🗄️ Database predates migrations, stamping it at the initial revision")
+        await asyncio.to_thread(command.stamp, config, INITIAL_REVISION)
+    await asyncio.to_thread(command.upgrade, config, "head")
@@ -1,7 +1,7 @@
 from pydantic import BaseModel, EmailStr
 from uuid import UUID
-from datetime import datetime
-from typing import List, Optional
+from datetime import date, datetime
+from typing import Dict, List, Optional
 from decimal import Decimal
 
 
@@ -25,11 +25,13 @@ class UserRead(BaseModel):
 class PortfolioCreate(BaseModel):
     name: str
     type: str = "crypto"  # crypto, stocks, etf, metals
+    cost_basis_method: str = "fifo"  # fifo, lifo, average
 
 class PortfolioRead(BaseModel):
     id: int
     name: str
     type: str
+    cost_basis_method: str = "fifo"
     created_at: datetime
 
     class Config:
@@ -49,6 +51,7 @@ class PortfolioEntryCreate(PortfolioEntryBase):
 class PortfolioEntryRead(PortfolioEntryBase):
     id: int
     portfolio_id: int
+    realized_pl: Optional[float] = 0
 
     class Config:
         from_attributes = True
@@ -74,6 +77,17 @@ class TransactionRead(TransactionBase):
         from_attributes = True
 
 
+class ImportRowError(BaseModel):
+    line: int
+    error: str
+
+class TransactionImportResult(BaseModel):
+    imported: int
+    failed: int
+    entries_updated: int
+    errors: List[ImportRowError]  # first TRANSACTION_IMPORT_MAX_ERRORS only
+
+
 # ========== Portfolio Summary Schemas ==========
 
 class TransactionWithPL(BaseModel):
@@ -96,10 +110,13 @@ class PortfolioItemSummary(BaseModel):
     amount: float
     avg_purchase_price: float
     current_price: Optional[float] = None
+    price_as_of: Optional[datetime] = None  # when current_price was fetched upstream
     total_value: Optional[float] = None
     profit_loss: Optional[float] = None
     profit_loss_percentage: Optional[float] = None
-    transactions: List[TransactionWithPL] = []
+    transaction_count: int = 0
+    last_transaction_at: Optional[datetime] = None
+    transactions: List[TransactionWithPL] = []  # only with include_transactions=true
 
 class PortfolioSummary(BaseModel):
     portfolio: PortfolioRead
@@ -108,6 +125,77 @@ class PortfolioSummary(BaseModel):
     total_current_value: float
     total_profit_loss: float
     total_profit_loss_percentage: float
+    prices_as_of: Optional[datetime] = None  # oldest price_as_of among items
+    transactions_total: int = 0  # for paginating include_transactions
+
+
+# ========== Dashboard Schemas ==========
+
+class DashboardPortfolio(BaseModel):
+    portfolio: PortfolioRead
+    total_invested: float
+    total_current_value: float
+    total_profit_loss: float
+    total_profit_loss_percentage: float
+    transaction_count: int = 0
+    last_transaction_at: Optional[datetime] = None
+    prices_as_of: Optional[datetime] = None
+
+class DashboardHolding(BaseModel):
+    """One symbol consolidated across all portfolios holding it"""
+    symbol: str
+    type: str
+    amount: float
+    avg_purchase_price: float
+    current_price: Optional[float] = None
+    price_as_of: Optional[datetime] = None
+    total_value: Optional[float] = None
+    profit_loss: Optional[float] = None
+    profit_loss_percentage: Optional[float] = None
+    portfolio_ids: List[int] = []
+
+class Dashboard(BaseModel):
+    portfolios: List[DashboardPortfolio]
+    holdings: List[DashboardHolding]
+    total_invested: float
+    total_current_value: float
+    total_profit_loss: float
+    total_profit_loss_percentage: float
+    prices_as_of: Optional[datetime] = None  # oldest price used
+
+
+# ========== Portfolio History Schemas ==========
+
+class PortfolioHistoryPoint(BaseModel):
+    date: date
+    invested: float
+    market_value: float
+    profit_loss: float
+    holdings: Dict[str, float] = {}  # symbol -> market value
+
+class PortfolioHistory(BaseModel):
+    portfolio_id: int
+    granularity: str
+    points: List[PortfolioHistoryPoint]
+
+
+class RealizedItem(BaseModel):
+    entry_id: int
+    symbol: str
+    quantity_sold: float
+    proceeds: float
+    cost_basis: float
+    realized_pl: float
+    realized_pl_total: float  # all time, not just the requested year
+
+class RealizedReport(BaseModel):
+    portfolio_id: int
+    year: Optional[int] = None
+    cost_basis_method: str
+    items: List[RealizedItem]
+    total_proceeds: float
+    total_cost_basis: float
+    total_realized_pl: float
 
 
 # ========== Budget Schemas ==========
@@ -169,4 +257,24 @@ class BudgetChartData(BaseModel):
     income_by_category: List[CategoryChartData]
     daily_totals: List[DailyTotals]
     total_income: float
-    total_expense: float
\ No newline at end of file
+    total_expense: float
+
+# ========== Export Job Schemas ==========
+
+class ExportJobRead(BaseModel):
+    id: UUID
+    status: str  # queued, running, done, failed, expired
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    size_bytes: Optional[int] = None
+    error: Optional[str] = None
+    download_url: Optional[str] = None
+
+# ========== Admin Schemas ==========
+
+class SuppressedSymbolRead(BaseModel):
+    provider: str
+    symbol: str
+    failures: int
+    retry_at: datetime
@@ -0,0 +1,223 @@
+"""
+Tax lots and realized P&L (tax_lots / realized_gains tables).
+
+Every buy opens a lot. Every sell closes its quantity from the entry's open
+lots in the portfolio's cost-basis method and stores one realized_gains row
+(proceeds, cost basis, realized P&L); the entry keeps a running
+realized_pl total. Both are written in the same database transaction as
+the Transaction row, so reports read precomputed rows instead of replaying
+the transaction log.
+
+Methods:
+- fifo: oldest lots are sold first
+- lifo: newest lots are sold first
+- average: every open lot shrinks pro rata, so the cost basis is the
+  average cost the entry already shows as purchase_price
+"""
+import logging
+from collections import deque
+from datetime import datetime
+from decimal import Decimal
+from typing import Optional, Tuple
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import (
+    CostBasisMethod, PortfolioEntry, RealizedGain, TaxLot, Transaction, TransactionType
+)
+
+logger = logging.getLogger(__name__)
+
+ZERO = Decimal(0)
+
+
+def _dec(value) -> Decimal:
+    return value if isinstance(value, Decimal) else Decimal(str(value or 0))
+
+
+def open_lot(db: AsyncSession, entry: PortfolioEntry, tx: Transaction) -> TaxLot:
+    """Open the lot of a buy transaction (added to the session, not committed)"""
+    if tx.date is None:
+        tx.date = datetime.utcnow()
+    quantity = _dec(tx.quantity)
+    lot = TaxLot(
+        portfolio_entry_id=entry.id,
+        transaction=tx,
+        acquired_at=tx.date,
+        quantity=quantity,
+        remaining=quantity,
+        cost_per_unit=_dec(tx.price),
+    )
+    db.add(lot)
+    return lot
+
+
+def _consume(open_lots: deque, quantity: Decimal, method: CostBasisMethod) -> Tuple[Decimal, Decimal]:
+    """
+    Take `quantity` from open lots (oldest first in the deque).
+
+    Exhausted lots are dropped from the deque. Returns (quantity covered
+    by lots, cost basis of that quantity).
+    """
+    if method == CostBasisMethod.average:
+        held = sum((lot.remaining for lot in open_lots), ZERO)
+        if held <= 0:
+            return ZERO, ZERO
+        share = min(quantity / held, Decimal(1))
+        cost = ZERO
+        for lot in open_lots:
+            taken = lot.remaining if share == 1 else lot.remaining * share
+            lot.remaining -= taken
+            cost += taken * lot.cost_per_unit
+        if share == 1:
+            open_lots.clear()
+        return min(quantity, held), cost
+
+    fifo = method == CostBasisMethod.fifo
+    left, cost = quantity, ZERO
+    while left > 0 and open_lots:
+        lot = open_lots[0] if fifo else open_lots[-1]
+        taken = min(lot.remaining, left)
+        lot.remaining -= taken
+        cost += taken * lot.cost_per_unit
+        left -= taken
+        if lot.remaining <= 0:
+            open_lots.popleft() if fifo else open_lots.pop()
+    return quantity - left, cost
+
+
+def _gain_values(
+    purchase_price, quantity: Decimal, price: Decimal, open_lots: deque, method: CostBasisMethod
+) -> dict:
+    covered, cost_basis = _consume(open_lots, quantity, method)
+    # Quantity without lots (shouldn't happen) is costed at the entry's average
+    cost_basis += (quantity - covered) * _dec(purchase_price)
+    proceeds = quantity * price
+    return {
+        "quantity": quantity,
+        "proceeds": proceeds,
+        "cost_basis": cost_basis,
+        "realized_pl": proceeds - cost_basis,
+    }
+
+
+async def close_lots(
+    db: AsyncSession, entry: PortfolioEntry, tx: Transaction, method: CostBasisMethod
+) -> RealizedGain:
+    """Close a sell transaction against the entry's open lots (not committed)"""
+    if tx.date is None:
+        tx.date = datetime.utcnow()
+    result = await db.execute(
+        select(TaxLot)
+        .where(TaxLot.portfolio_entry_id == entry.id, TaxLot.remaining > 0)
+        .order_by(TaxLot.acquired_at, TaxLot.id)
+        .with_for_update()
+    )
+    values = _gain_values(entry.purchase_price, _dec(tx.quantity), _dec(tx.price), deque(result.scalars().all()), method)
+    gain = RealizedGain(portfolio_entry_id=entry.id, transaction=tx, date=tx.date, **values)
+    # Incremented in SQL on flush, like the entry's amount in the routes
+    entry.realized_pl = PortfolioEntry.realized_pl + gain.realized_pl
+    db.add(gain)
+    return gain
+
+
+class _Lot:
+    """Lot while replaying (bulk inserted afterwards)"""
+    __slots__ = ("transaction_id", "acquired_at", "quantity", "remaining", "cost_per_unit")
+
+    def __init__(self, transaction_id, acquired_at, quantity: Decimal, cost_per_unit: Decimal):
+        self.transaction_id = transaction_id
+        self.acquired_at = acquired_at
+        self.quantity = self.remaining = quantity
+        self.cost_per_unit = cost_per_unit
+
+
+def _transactions(entry_id: int):
+    return (
+        select(Transaction.id, Transaction.type, Transaction.quantity, Transaction.price, Transaction.date)
+        .where(Transaction.portfolio_entry_id == entry_id)
+        .order_by(Transaction.date, Transaction.id)
+    )
+
+
+def _replay(entry_id: int, purchase_price, transactions, method: CostBasisMethod) -> Tuple[list, list, Decimal]:
+    """tax_lots rows, realized_gains rows and realized total of an entry's transactions in date order"""
+    lots: list[_Lot] = []
+    gains: list[dict] = []
+    open_lots: deque = deque()
+    realized = ZERO
+    for tx_id, tx_type, quantity, price, tx_date in transactions:
+        tx_date = tx_date or datetime.utcnow()
+        if tx_type == TransactionType.sell:
+            values = _gain_values(purchase_price, _dec(quantity), _dec(price), open_lots, method)
+            gains.append({"portfolio_entry_id": entry_id, "transaction_id": tx_id, "date": tx_date, **values})
+            realized += values["realized_pl"]
+        else:
+            lot = _Lot(tx_id, tx_date, _dec(quantity), _dec(price))
+            lots.append(lot)
+            open_lots.append(lot)
+
+    lot_rows = [
+        {
+            "portfolio_entry_id": entry_id,
+            "transaction_id": lot.transaction_id,
+            "acquired_at": lot.acquired_at,
+            "quantity": lot.quantity,
+            "remaining": lot.remaining,
+            "cost_per_unit": lot.cost_per_unit,
+        }
+        for lot in lots
+    ]
+    return lot_rows, gains, realized
+
+
+async def rebuild(db: AsyncSession, entry: PortfolioEntry, method: CostBasisMethod) -> None:
+    """
+    Recreate an entry's lots and realized rows from its transactions (not
+    committed). Used after back-dated or bulk-imported fills; rows are
+    written with two bulk INSERTs.
+    """
+    await db.execute(delete(TaxLot).where(TaxLot.portfolio_entry_id == entry.id))
+    await db.execute(delete(RealizedGain).where(RealizedGain.portfolio_entry_id == entry.id))
+
+    transactions = (await db.execute(_transactions(entry.id))).all()
+    lots, gains, realized = _replay(entry.id, entry.purchase_price, transactions, method)
+    if lots:
+        await db.execute(insert(TaxLot), lots)
+    if gains:
+        await db.execute(insert(RealizedGain), gains)
+    entry.realized_pl = realized
+
+
+async def realized_by_entry(
+    db: AsyncSession, portfolio_id: int, year: Optional[int] = None
+) -> list[tuple]:
+    """
+    Realized totals per entry from realized_gains (one grouped query).
+
+    Returns (entry_id, symbol, realized_pl_total, quantity, proceeds,
+    cost_basis, realized_pl) rows for entries with sells in the year
+    (or ever, without a year).
+    """
+    query = (
+        select(
+            PortfolioEntry.id,
+            PortfolioEntry.symbol,
+            PortfolioEntry.realized_pl,
+            func.sum(RealizedGain.quantity),
+            func.sum(RealizedGain.proceeds),
+            func.sum(RealizedGain.cost_basis),
+            func.sum(RealizedGain.realized_pl),
+        )
+        .join(RealizedGain, RealizedGain.portfolio_entry_id == PortfolioEntry.id)
+        .where(PortfolioEntry.portfolio_id == portfolio_id)
+        .group_by(PortfolioEntry.id, PortfolioEntry.symbol, PortfolioEntry.realized_pl)
+        .order_by(PortfolioEntry.symbol)
+    )
+    if year is not None:
+        query = query.where(
+            RealizedGain.date >= datetime(year, 1, 1),
+            RealizedGain.date < datetime(year + 1, 1, 1),
+        )
+    return (await db.execute(query)).all()
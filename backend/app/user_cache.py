@@ -0,0 +1,118 @@
+"""
+Authenticated-user cache (JWT sub -> Principal).
+
+get_principal resolves a token to the user's id and email without a users
+query while the entry is cached:
+
+- L1: per-process BoundedTTLCache, USER_CACHE_TTL seconds
+- L2: Redis (user:<sub>, same TTL) when the price cache has a connection,
+  so a user looked up by one worker is known to the others
+
+User rows changed or deleted through the ORM drop their entry (mapper
+events below): immediately in this process and in Redis, other workers'
+L1 copies age out within USER_CACHE_TTL. Bulk Core UPDATE/DELETE on users
+bypasses the events — call invalidate() after those.
+"""
+import asyncio
+import json
+import logging
+import os
+import uuid
+from typing import Any, Callable, NamedTuple, Optional
+
+from sqlalchemy import event
+
+from app.memory_cache import BoundedTTLCache
+from app.models import User
+
+logger = logging.getLogger(__name__)
+
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "30"))
+USER_CACHE_MAX_ENTRIES = int(os.getenv("USER_CACHE_MAX_ENTRIES", "10000"))
+
+
+class Principal(NamedTuple):
+    """Who made the request — enough for routes that only filter by user"""
+    id: uuid.UUID
+    email: str
+
+
+class UserCache:
+    def __init__(self, redis_source: Callable[[], Any] = lambda: None):
+        self._memory = BoundedTTLCache(max_entries=USER_CACHE_MAX_ENTRIES, max_bytes=4 * 1024 * 1024)
+        self._redis_source = redis_source
+        self._pending: set[asyncio.Task] = set()
+
+    @property
+    def _redis(self):
+        return self._redis_source()
+
+    async def get(self, sub: str) -> Optional[Principal]:
+        principal = self._memory.get(sub)
+        if principal is not None or not self._redis:
+            return principal
+        try:
+            val = await self._redis.get(f"user:{sub}")
+        except Exception:
+            return None
+        if val is None:
+            return None
+        data = json.loads(val)
+        principal = Principal(uuid.UUID(data["id"]), data["email"])
+        self._memory.set(sub, principal, USER_CACHE_TTL)
+        return principal
+
+    async def set(self, principal: Principal) -> None:
+        sub = str(principal.id)
+        self._memory.set(sub, principal, USER_CACHE_TTL)
+        if self._redis:
+            try:
+                await self._redis.setex(
+                    f"user:{sub}", int(USER_CACHE_TTL) or 1,
+                    json.dumps({"id": sub, "email": principal.email})
+                )
+            except Exception:
+                pass
+
+    async def invalidate(self, user_id) -> None:
+        """Forget a user in this process and in Redis"""
+        sub = str(user_id)
+        self._memory.delete(sub)
+        if self._redis:
+            try:
+                await self._redis.delete(f"user:{sub}")
+            except Exception as e:
+                logger.warning(f"⚠️ User cache invalidation failed for {sub}: {e}")
+
+    def forget(self, user_id) -> None:
+        """invalidate() from sync code: L1 now, Redis in a background task"""
+        self._memory.delete(str(user_id))
+        if not self._redis:
+            return
+        try:
+            task = asyncio.get_running_loop().create_task(self.invalidate(user_id))
+        except RuntimeError:
+            return
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    def clear(self) -> None:
+        self._memory.clear()
+
+    def stats(self):
+        return self._memory.stats()
+
+
+def _redis():
+    # Shares the price cache's connection (one Redis client per process)
+    from app.price_service import cache
+    return cache._redis
+
+
+user_cache = UserCache(_redis)
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _user_changed(mapper, connection, target: User) -> None:
+    user_cache.forget(target.id)
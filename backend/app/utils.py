@@ -1,17 +1,103 @@
+"""
+Password hashing.
+
+New hashes are bcrypt (BCRYPT_ROUNDS). Hashes from the old salted SHA-256
+format ("<salt>$<sha256 hex>") still verify, and login replaces them with
+bcrypt (needs_rehash) — accounts upgrade as their users sign in.
+
+bcrypt costs ~100-250 ms of CPU per call, so the async handlers go through
+hash_password_async / verify_password_async: they run on a dedicated
+thread pool (PASSWORD_HASH_WORKERS threads, bcrypt releases the GIL) and
+never on the event loop. At most PASSWORD_HASH_QUEUE_MAX calls wait for a
+thread; beyond that PasswordHashingBusy is raised (503) instead of letting
+a login burst queue unbounded work.
+"""
+import asyncio
 import hashlib
-import secrets
+import hmac
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+PASSWORD_HASH_QUEUE_MAX = int(os.getenv("PASSWORD_HASH_QUEUE_MAX", "64"))
+
+_BCRYPT_PREFIXES = ("$2a$", "$2b$", "$2y$")
+
 
 def hash_password(password: str) -> str:
-    """Simple SHA256 hash with salt for password hashing"""
-    salt = secrets.token_hex(16)
-    hash_obj = hashlib.sha256((salt + password).encode())
-    return f"{salt}${hash_obj.hexdigest()}"
+    """bcrypt hash (blocking — use hash_password_async from request handlers)"""
+    return bcrypt.hashpw(password.encode(), bcrypt.gensalt(BCRYPT_ROUNDS)).decode()
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """Verify password against stored hash"""
+
+def _verify_sha256(plain_password: str, hashed_password: str) -> bool:
+    """Legacy format: salt + '$' + sha256(salt + password)"""
     try:
         salt, stored_hash = hashed_password.split('$')
-        hash_obj = hashlib.sha256((salt + plain_password).encode())
-        return hash_obj.hexdigest() == stored_hash
     except ValueError:
         return False
+    hash_obj = hashlib.sha256((salt + plain_password).encode())
+    return hmac.compare_digest(hash_obj.hexdigest(), stored_hash)
+
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    """Verify password against stored hash (bcrypt or legacy SHA-256)"""
+    if hashed_password.startswith(_BCRYPT_PREFIXES):
+        try:
+            return bcrypt.checkpw(plain_password.encode(), hashed_password.encode())
+        except ValueError:
+            return False
+    return _verify_sha256(plain_password, hashed_password)
+
+
+def needs_rehash(hashed_password: str) -> bool:
+    """True for legacy SHA-256 hashes and bcrypt hashes with other rounds"""
+    if not hashed_password.startswith(_BCRYPT_PREFIXES):
+        return True
+    try:
+        return int(hashed_password.split("$")[2]) != BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return True
+
+
+# ========== Bounded hashing pool ==========
+
+class PasswordHashingBusy(Exception):
+    """More password checks are queued than PASSWORD_HASH_QUEUE_MAX"""
+
+
+_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password")
+_in_flight = 0
+_in_flight_lock = threading.Lock()
+
+
+def _release(future) -> None:
+    # Runs when the pool is done with the call (on a worker thread, or at
+    # once if it was cancelled before starting) — not when the awaiting
+    # request is cancelled, since bcrypt keeps running after that
+    global _in_flight
+    with _in_flight_lock:
+        _in_flight -= 1
+
+
+async def _run(func, *args):
+    global _in_flight
+    with _in_flight_lock:
+        if _in_flight >= PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE_MAX:
+            raise PasswordHashingBusy()
+        _in_flight += 1
+    future = _executor.submit(func, *args)
+    future.add_done_callback(_release)
+    return await asyncio.wrap_future(future)
+
+
+async def hash_password_async(password: str) -> str:
+    return await _run(hash_password, password)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await _run(verify_password, plain_password, hashed_password)
+
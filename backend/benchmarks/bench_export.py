@@ -0,0 +1,172 @@
+"""
+Benchmark: portfolio transaction exports.
+
+Fills a SQLite file database with N transactions and, per size, measures:
+- memory (tracemalloc peak): buffered = the previous export (ORM rows +
+  whole file in io.StringIO) vs streamed = app.exports.csv_stream, chunks
+  discarded as a client would consume them
+- formats: output size and encode time of the streamed CSV and JSON
+  writers vs Parquet and Arrow IPC (needs pyarrow). Encode time is the
+  total minus a pass that only reads the same partitions from the cursor.
+
+Usage (from backend/):
+    python -m benchmarks.bench_export [--sizes 10000 100000]
+"""
+import argparse
+import asyncio
+import csv
+import io
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from sqlalchemy import insert, select
+
+from app import exports
+from app.models import PortfolioEntry, Transaction, TransactionType
+from benchmarks.bench_import import _session
+
+
+async def _fill(db, portfolio, n: int):
+    entry = PortfolioEntry(portfolio_id=portfolio.id, symbol="BTC", amount=0, purchase_price=0)
+    db.add(entry)
+    await db.flush()
+    rng = random.Random(n)
+    start = datetime(2020, 1, 1)
+    for offset in range(0, n, 10_000):
+        await db.execute(insert(Transaction), [
+            {
+                "id": uuid.uuid4(), "portfolio_entry_id": entry.id, "symbol": "BTC",
+                "quantity": Decimal(f"{rng.uniform(0.1, 5):.8f}"), "price": Decimal(f"{rng.uniform(10, 1000):.2f}"),
+                "type": TransactionType.buy, "date": start + timedelta(minutes=offset + i),
+            }
+            for i in range(min(10_000, n - offset))
+        ])
+    await db.commit()
+
+
+async def buffered(db, portfolio_id):
+    result = await db.execute(
+        select(Transaction).join(PortfolioEntry)
+        .where(PortfolioEntry.portfolio_id == portfolio_id).order_by(Transaction.date.desc())
+    )
+    output = io.StringIO()
+    writer = csv.writer(output)
+    for tx in result.scalars().all():
+        writer.writerow([tx.date.strftime("%Y-%m-%d %H:%M"), tx.symbol, tx.type.value.upper(),
+                         float(tx.quantity), float(tx.price), float(tx.quantity) * float(tx.price)])
+    return len(output.getvalue())
+
+
+def _query(portfolio_id):
+    return (
+        select(Transaction.id, Transaction.date, Transaction.symbol, Transaction.type,
+               Transaction.quantity, Transaction.price)
+        .join(PortfolioEntry).where(PortfolioEntry.portfolio_id == portfolio_id)
+        .order_by(Transaction.date.desc())
+    )
+
+
+async def streamed(db, portfolio_id):
+    query = _query(portfolio_id)
+    size = 0
+    async for chunk in exports.csv_stream(db, [exports.Rows(query, lambda row: [
+        row.date.strftime("%Y-%m-%d %H:%M"), row.symbol, row.type.value.upper(),
+        float(row.quantity), float(row.price), float(row.quantity) * float(row.price),
+    ])]):
+        size += len(chunk)
+    return size
+
+
+async def _read_only(db, query, size):
+    rows = 0
+    async for partition in exports.partitions(db, query, size):
+        rows += len(partition)
+    return rows
+
+
+async def _encoded(body) -> int:
+    size = 0
+    async for chunk in body:
+        size += len(chunk)
+    return size
+
+
+async def formats(db, portfolio_id):
+    """(format, output bytes, total seconds, encode seconds)"""
+    from app.routes_portfolio import _transactions_arrow_schema
+
+    query = _query(portfolio_id)
+    to_row = lambda row: [row.date.strftime("%Y-%m-%d %H:%M"), row.symbol, row.type.value.upper(),
+                          float(row.quantity), float(row.price), float(row.quantity) * float(row.price)]
+    to_item = lambda row: {"id": str(row.id), "date": row.date.isoformat(), "symbol": row.symbol,
+                           "type": row.type.value, "quantity": float(row.quantity), "price": float(row.price)}
+    bodies = {
+        "csv": (lambda: exports.csv_stream(db, [exports.Rows(query, to_row)]), exports.EXPORT_CHUNK_SIZE),
+        "json": (lambda: exports.json_stream(db, {"transactions": exports.Rows(query, to_item)}),
+                 exports.EXPORT_CHUNK_SIZE),
+    }
+    if exports.load_pyarrow():
+        for fmt in exports.COLUMNAR_FORMATS:
+            bodies[fmt] = (
+                lambda fmt=fmt: exports.columnar_stream(db, query, _transactions_arrow_schema, fmt),
+                exports.EXPORT_RECORD_BATCH_SIZE,
+            )
+
+    results = []
+    for fmt, (body, chunk) in bodies.items():
+        db.expunge_all()
+        start = time.perf_counter()
+        await _read_only(db, query, chunk)
+        read_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        size = await _encoded(body())
+        total = time.perf_counter() - start
+        results.append((fmt, size, total, max(total - read_seconds, 0.0)))
+    return results
+
+
+async def _measure(fn, db, portfolio_id):
+    db.expunge_all()
+    tracemalloc.start()
+    start = time.perf_counter()
+    size = await fn(db, portfolio_id)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    db.expunge_all()
+    return size, elapsed, peak / 1024 / 1024
+
+
+async def main(sizes):
+    memory, sizes_and_times = [], []
+    for n in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            engine, db, _, portfolio = await _session(os.path.join(tmp, "bench.db"))
+            await _fill(db, portfolio, n)
+            for name, fn in (("buffered", buffered), ("streamed", streamed)):
+                memory.append((n, name, *await _measure(fn, db, portfolio.id)))
+            sizes_and_times += [(n, *result) for result in await formats(db, portfolio.id)]
+            await db.close()
+            await engine.dispose()
+
+    print(f"{'rows':>8}  {'mode':>9}  {'seconds':>8}  {'peak MB':>8}  {'output MB':>9}")
+    for n, name, size, seconds, peak in memory:
+        print(f"{n:>8}  {name:>9}  {seconds:>8.2f}  {peak:>8.1f}  {size / 1024 / 1024:>9.1f}")
+    print(f"\n{'rows':>8}  {'format':>9}  {'output MB':>9}  {'total s':>8}  {'encode s':>8}")
+    for n, fmt, size, total, encode in sizes_and_times:
+        print(f"{n:>8}  {fmt:>9}  {size / 1024 / 1024:>9.2f}  {total:>8.2f}  {encode:>8.2f}")
+    print(f"\nchunk size {exports.EXPORT_CHUNK_SIZE} (text) / {exports.EXPORT_RECORD_BATCH_SIZE} (columnar); "
+          "peak = tracemalloc peak during the export")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    args = parser.parse_args()
+    asyncio.run(main(args.sizes))
@@ -0,0 +1,108 @@
+"""
+Benchmark: new httpx.AsyncClient per lookup vs the shared pooled client.
+
+Runs a tiny local HTTP/1.1 stub that answers like CoinGecko /simple/price
+and measures per-request latency for both strategies.
+
+Usage (from backend/):
+    python -m benchmarks.bench_http_clients [--requests 500] [--latency-ms 0]
+
+The stub is plain HTTP, so the numbers only include the TCP handshake;
+against the real HTTPS API the pooled client also skips the TLS handshake.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+from app import http_clients
+
+STUB_BODY = b'{"bitcoin": {"usd": 42000.0}}'
+
+
+async def _handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, latency: float):
+    """Serve keep-alive requests until the client closes the connection"""
+    try:
+        while True:
+            request = await reader.readuntil(b"\r\n\r\n")
+            if not request:
+                break
+            if latency:
+                await asyncio.sleep(latency)
+            writer.write(
+                b"HTTP/1.1 200 OK\r\n"
+                b"Content-Type: application/json\r\n"
+                b"Content-Length: " + str(len(STUB_BODY)).encode() + b"\r\n"
+                b"Connection: keep-alive\r\n\r\n" + STUB_BODY
+            )
+            await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionResetError):
+        pass
+    finally:
+        writer.close()
+
+
+async def _time_requests(get_client, url: str, n: int) -> list[float]:
+    """Issue n sequential lookups, returns per-request latency in ms"""
+    timings = []
+    for _ in range(n):
+        start = time.perf_counter()
+        async with get_client() as client:
+            response = await client.get(url, params={"ids": "bitcoin", "vs_currencies": "usd"})
+            response.raise_for_status()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+class _Shared:
+    """Async context manager that hands out the registry client without closing it"""
+
+    async def __aenter__(self):
+        return http_clients.get_client("coingecko")
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+def _report(name: str, timings: list[float]) -> float:
+    timings = sorted(timings)
+    mean = statistics.mean(timings)
+    p50 = timings[len(timings) // 2]
+    p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+    print(f"{name:<28} mean {mean:7.3f} ms   p50 {p50:7.3f} ms   p99 {p99:7.3f} ms")
+    return mean
+
+
+async def main(n: int, latency_ms: float):
+    server = await asyncio.start_server(
+        lambda r, w: _handle(r, w, latency_ms / 1000), "127.0.0.1", 0
+    )
+    port = server.sockets[0].getsockname()[1]
+    url = f"http://127.0.0.1:{port}/api/v3/simple/price"
+
+    print(f"{n} sequential requests against stub at {url}\n")
+
+    per_call = await _time_requests(
+        lambda: http_clients.create_client("coingecko"), url, n
+    )
+    pooled = await _time_requests(_Shared, url, n)
+
+    mean_new = _report("new client per request", per_call)
+    mean_pooled = _report("shared pooled client", pooled)
+    print(f"\nsaved per request: {mean_new - mean_pooled:.3f} ms "
+          f"({(1 - mean_pooled / mean_new) * 100:.1f}%)")
+
+    await http_clients.shutdown()
+    server.close()
+    await server.wait_closed()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--latency-ms", type=float, default=0.0,
+                        help="Artificial server latency per response")
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.latency_ms))
@@ -0,0 +1,131 @@
+"""
+Benchmark: bulk transaction import (app.transaction_import) throughput.
+
+Generates a synthetic history (20 symbols, ~25% sells, chronological) and
+imports it into a fresh SQLite file database, per size and format:
+- csv / ndjson: the import endpoint's code path (streamed parse, batched
+  inserts, one commit, lots rebuilt at the end)
+- per-request: the old one-POST-per-fill path (ownership query, entry
+  query, insert, commit) timed on --baseline rows and reported as rows/s
+
+Usage (from backend/):
+    python -m benchmarks.bench_import [--sizes 10000 100000] [--baseline 2000]
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import transaction_import
+from app.models import Base, Portfolio, PortfolioEntry, PortfolioType, Transaction, TransactionType, User
+
+SYMBOLS = [f"SYM{i}" for i in range(20)]
+
+
+def _rows(n: int):
+    rng = random.Random(n)
+    held = {symbol: 0.0 for symbol in SYMBOLS}
+    start = datetime(2020, 1, 1)
+    for i in range(n):
+        symbol = rng.choice(SYMBOLS)
+        if held[symbol] > 1 and rng.random() < 0.25:
+            tx_type, quantity = "sell", round(held[symbol] * rng.uniform(0.1, 0.5), 8)
+            held[symbol] -= quantity
+        else:
+            tx_type, quantity = "buy", round(rng.uniform(0.1, 5), 8)
+            held[symbol] += quantity
+        yield {
+            "symbol": symbol,
+            "type": tx_type,
+            "quantity": f"{quantity:.8f}",
+            "price": f"{rng.uniform(10, 1000):.2f}",
+            "date": (start + timedelta(minutes=i)).isoformat(),
+        }
+
+
+def _file(n: int, fmt: str) -> bytes:
+    if fmt == "ndjson":
+        return "".join(json.dumps(row) + "\n" for row in _rows(n)).encode()
+    lines = ["symbol,type,quantity,price,date"]
+    lines += [f"{r['symbol']},{r['type']},{r['quantity']},{r['price']},{r['date']}" for r in _rows(n)]
+    return ("\n".join(lines) + "\n").encode()
+
+
+async def _session(path: str):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)()
+    user = User(email="bench@example.com", hashed_password="x")
+    session.add(user)
+    await session.flush()
+    portfolio = Portfolio(user_id=user.id, name="Bench", type=PortfolioType.crypto)
+    session.add(portfolio)
+    await session.commit()
+    return engine, session, user, portfolio
+
+
+async def run_import(n: int, fmt: str) -> float:
+    data = _file(n, fmt)
+    with tempfile.TemporaryDirectory() as tmp:
+        engine, db, _, portfolio = await _session(os.path.join(tmp, "bench.db"))
+        start = time.perf_counter()
+        result = await transaction_import.import_transactions(db, portfolio, io.BytesIO(data), fmt)
+        elapsed = time.perf_counter() - start
+        assert result.imported == n, result
+        await db.close()
+        await engine.dispose()
+    return elapsed
+
+
+async def run_per_request(n: int) -> float:
+    """One ownership query, entry query, insert and commit per fill, like POST /transactions"""
+    with tempfile.TemporaryDirectory() as tmp:
+        engine, db, user, portfolio = await _session(os.path.join(tmp, "bench.db"))
+        for symbol in SYMBOLS:
+            db.add(PortfolioEntry(portfolio_id=portfolio.id, symbol=symbol, amount=0, purchase_price=0))
+        await db.commit()
+        start = time.perf_counter()
+        for row in _rows(n):
+            await db.execute(select(Portfolio).where(Portfolio.id == portfolio.id, Portfolio.user_id == user.id))
+            pe = (await db.execute(select(PortfolioEntry).where(
+                PortfolioEntry.portfolio_id == portfolio.id, PortfolioEntry.symbol == row["symbol"]
+            ))).scalars().first()
+            db.add(Transaction(
+                portfolio_entry_id=pe.id, symbol=pe.symbol, quantity=float(row["quantity"]),
+                price=float(row["price"]), type=TransactionType(row["type"]),
+            ))
+            await db.commit()
+        elapsed = time.perf_counter() - start
+        await db.close()
+        await engine.dispose()
+    return elapsed
+
+
+async def main(sizes, baseline):
+    print(f"{'rows':>8}  {'format':>8}  {'seconds':>8}  {'rows/s':>9}")
+    for n in sizes:
+        for fmt in transaction_import.FORMATS:
+            seconds = await run_import(n, fmt)
+            print(f"{n:>8}  {fmt:>8}  {seconds:>8.2f}  {n / seconds:>9,.0f}")
+    if baseline:
+        seconds = await run_per_request(baseline)
+        print(f"{baseline:>8}  {'per-req':>8}  {seconds:>8.2f}  {baseline / seconds:>9,.0f}")
+    print("\nSQLite file database; per-req = one POST /transactions worth of queries + commit per row")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--baseline", type=int, default=2_000)
+    args = parser.parse_args()
+    asyncio.run(main(args.sizes, args.baseline))
@@ -0,0 +1,102 @@
+"""
+Benchmark: /health latency while a burst of logins is in flight.
+
+Runs the app in-process (httpx ASGITransport, SQLite file database), fires
+N concurrent POST /login with a real bcrypt hash and polls GET /health
+back to back until every login has answered:
+- inline: password checks on the event loop (how login worked before the
+  hashing pool)
+- pool: app.utils hashing pool (PASSWORD_HASH_WORKERS threads)
+
+Usage (from backend/):
+    python -m benchmarks.bench_login [--logins 100] [--rounds 12]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+from unittest.mock import patch
+
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import utils
+from app.db import get_db
+from app.limiter import limiter
+from app.main import app
+from app.models import Base, User
+
+PASSWORD = "BenchPass123!"
+
+
+async def _inline(func, *args):
+    return func(*args)
+
+
+async def burst(client: AsyncClient, logins: int) -> dict:
+    requests = asyncio.gather(*(
+        client.post("/login", data={"username": "bench@example.com", "password": PASSWORD})
+        for _ in range(logins)
+    ))
+    latencies = []
+    start = time.perf_counter()
+    while not requests.done():
+        sent = time.perf_counter()
+        await client.get("/health")
+        latencies.append((time.perf_counter() - sent) * 1000)
+    responses = await requests
+    assert all(r.status_code == 200 for r in responses), {r.status_code for r in responses}
+    latencies.sort()
+    return {
+        "logins_s": time.perf_counter() - start,
+        "health_calls": len(latencies),
+        "p50": statistics.median(latencies),
+        "p99": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+        "max": latencies[-1],
+    }
+
+
+async def main(logins: int, rounds: int):
+    limiter.enabled = False
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(tmp, 'bench.db')}")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        factory = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+        async def override_get_db():
+            async with factory() as session:
+                yield session
+
+        app.dependency_overrides[get_db] = override_get_db
+        # Queue room for the whole burst, so every login is really in flight
+        with patch("app.utils.BCRYPT_ROUNDS", rounds), patch("app.utils.PASSWORD_HASH_QUEUE_MAX", logins):
+            async with factory() as db:
+                db.add(User(email="bench@example.com", hashed_password=utils.hash_password(PASSWORD)))
+                await db.commit()
+
+            async with AsyncClient(transport=ASGITransport(app=app), base_url="http://bench") as client:
+                await client.get("/health")
+                with patch("app.utils._run", _inline):
+                    results["inline"] = await burst(client, logins)
+                results["pool"] = await burst(client, logins)
+        app.dependency_overrides.clear()
+        await engine.dispose()
+
+    print(f"{logins} concurrent logins, bcrypt rounds {rounds}, {utils.PASSWORD_HASH_WORKERS} hashing threads\n")
+    print(f"{'mode':>7}  {'logins s':>8}  {'/health calls':>13}  {'p50 ms':>8}  {'p99 ms':>8}  {'max ms':>8}")
+    for mode, r in results.items():
+        print(f"{mode:>7}  {r['logins_s']:>8.2f}  {r['health_calls']:>13}  "
+              f"{r['p50']:>8.1f}  {r['p99']:>8.1f}  {r['max']:>8.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--logins", type=int, default=100)
+    parser.add_argument("--rounds", type=int, default=utils.BCRYPT_ROUNDS)
+    args = parser.parse_args()
+    asyncio.run(main(args.logins, args.rounds))
@@ -0,0 +1,172 @@
+"""
+Benchmark: per-transaction P&L loop vs the vectorized engine (app.pnl_engine).
+
+Builds synthetic Decimal rows like the ORM returns (50 entries, mixed buys
+and sells) and times, per size, the same output from both paths: one
+TransactionWithPL per transaction plus each entry's position and P&L.
+- loop: per-row float(Decimal) math, running average cost per entry
+- engine: column-wise arrays, transaction_pnl + entry_pnl, then the
+  response objects built from the arrays as the summary route does
+
+Both are also timed without the response objects (arithmetic only).
+
+Usage (from backend/):
+    python -m benchmarks.bench_pnl [--sizes 1000 10000 100000] [--repeat 3]
+"""
+import argparse
+import random
+import time
+import uuid
+from datetime import datetime
+from decimal import Decimal
+
+from app import pnl_engine
+from app.models import TransactionType
+from app.schemas import TransactionWithPL
+
+ENTRIES = 50
+
+
+class _Tx:
+    """Stand-in for a loaded Transaction row"""
+    __slots__ = ("id", "portfolio_entry_id", "quantity", "price", "type", "date")
+
+    def __init__(self, entry_id, quantity, price, tx_type):
+        self.id = uuid.uuid4()
+        self.portfolio_entry_id = entry_id
+        self.quantity = quantity
+        self.price = price
+        self.type = tx_type
+        self.date = datetime(2026, 1, 1)
+
+
+def _make(n: int):
+    rng = random.Random(n)
+    entry_ids = list(range(1, ENTRIES + 1))
+    held = dict.fromkeys(entry_ids, Decimal(0))
+    txs = []
+    for _ in range(n):
+        entry_id = rng.choice(entry_ids)
+        quantity = Decimal(f"{rng.uniform(0.01, 5):.8f}")
+        # Sells never exceed the position, as create_transaction enforces
+        sell = rng.random() < 0.2 and quantity <= held[entry_id]
+        held[entry_id] += -quantity if sell else quantity
+        txs.append(_Tx(
+            entry_id, quantity, Decimal(f"{rng.uniform(10, 1000):.2f}"),
+            TransactionType.sell if sell else TransactionType.buy,
+        ))
+    prices = {entry_id: rng.uniform(10, 1000) for entry_id in entry_ids}
+    return entry_ids, txs, prices
+
+
+def _entry_rows(entry_ids, amount, avg, prices):
+    """(amount, avg price, invested, current value, P&L) per entry"""
+    rows = []
+    for entry_id in entry_ids:
+        invested = amount[entry_id] * avg[entry_id]
+        value = amount[entry_id] * prices[entry_id]
+        rows.append((amount[entry_id], avg[entry_id], invested, value, value - invested))
+    return rows
+
+
+def _values(**values):
+    return values
+
+
+def run_loop(entry_ids, txs, prices, make=TransactionWithPL):
+    """Per-row loop: float(Decimal) math, one `make(...)` per transaction"""
+    amount = dict.fromkeys(entry_ids, 0.0)
+    avg = dict.fromkeys(entry_ids, 0.0)
+    out = []
+    for tx in txs:
+        current_price = prices[tx.portfolio_entry_id]
+        tx_qty = float(tx.quantity)
+        tx_price = float(tx.price)
+        tx_invested = tx_qty * tx_price
+        held = amount[tx.portfolio_entry_id]
+        if tx.type == TransactionType.buy:
+            avg[tx.portfolio_entry_id] = (held * avg[tx.portfolio_entry_id] + tx_invested) / (held + tx_qty)
+            amount[tx.portfolio_entry_id] = held + tx_qty
+            tx_current_value = tx_qty * current_price
+            tx_pl = tx_current_value - tx_invested
+            tx_pl_pct = (tx_pl / tx_invested * 100) if tx_invested > 0 else 0
+        else:
+            amount[tx.portfolio_entry_id] = max(held - tx_qty, 0.0)
+            tx_current_value = tx_pl = tx_pl_pct = None
+        out.append(make(
+            id=tx.id, date=tx.date, type=tx.type.value, quantity=tx_qty, price=tx_price,
+            current_price=current_price, invested=tx_invested, current_value=tx_current_value,
+            profit_loss=tx_pl, profit_loss_percentage=tx_pl_pct,
+        ))
+    return out, _entry_rows(entry_ids, amount, avg, prices)
+
+
+def run_engine_math(entry_ids, txs, prices):
+    """Arrays in, arrays out: no per-row objects"""
+    arrays = pnl_engine.from_rows(
+        ((tx.portfolio_entry_id, tx.quantity, tx.price, tx.type) for tx in txs), entry_ids
+    )
+    entry_prices = pnl_engine.prices_for_entries(entry_ids, prices)
+    return arrays, pnl_engine.transaction_pnl(arrays, entry_prices), pnl_engine.entry_pnl(arrays, entry_prices)
+
+
+def run_loop_math(entry_ids, txs, prices):
+    """The loop's arithmetic, each row's values kept in a dict"""
+    return run_loop(entry_ids, txs, prices, make=_values)
+
+
+def run_engine(entry_ids, txs, prices):
+    arrays, pnl, entries = run_engine_math(entry_ids, txs, prices)
+
+    none_if_nan = pnl_engine.none_if_nan
+    columns = zip(
+        arrays.quantity.tolist(), arrays.price.tolist(), pnl.current_price.tolist(), pnl.invested.tolist(),
+        pnl.current_value.tolist(), pnl.profit_loss.tolist(), pnl.profit_loss_percentage.tolist(),
+    )
+    out = [
+        TransactionWithPL(
+            id=tx.id, date=tx.date, type=tx.type.value, quantity=quantity, price=price,
+            current_price=none_if_nan(current_price), invested=invested,
+            current_value=none_if_nan(current_value), profit_loss=none_if_nan(profit_loss),
+            profit_loss_percentage=none_if_nan(pct),
+        )
+        for tx, (quantity, price, current_price, invested, current_value, profit_loss, pct) in zip(txs, columns)
+    ]
+    return out, list(zip(
+        entries.amount.tolist(), entries.avg_price.tolist(), entries.invested.tolist(),
+        entries.current_value.tolist(), entries.profit_loss.tolist(),
+    ))
+
+
+def _best(fn, repeat: int, *args) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main(sizes, repeat):
+    print(f"{'':>12}  {'response objects':^30}  {'arithmetic only':^30}")
+    print(f"{'transactions':>12}" + f"  {'loop':>9} {'engine':>9} {'speed-up':>9}" * 2)
+    for n in sizes:
+        entry_ids, txs, prices = _make(n)
+        timings = [
+            _best(fn, repeat, entry_ids, txs, prices)
+            for fn in (run_loop, run_engine, run_loop_math, run_engine_math)
+        ]
+        print(f"{n:>12}" + "".join(
+            f"  {loop_ms:>7.1f}ms {engine_ms:>7.1f}ms {loop_ms / engine_ms:>8.1f}x"
+            for loop_ms, engine_ms in (timings[:2], timings[2:])
+        ))
+    print("\nresponse objects: both build every TransactionWithPL and each entry's position / P&L")
+    print("arithmetic only: Decimal rows in, per-row values (loop) or arrays (engine) out")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    main(args.sizes, args.repeat)
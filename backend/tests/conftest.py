@@ -1,5 +1,10 @@
+import os
 import pytest
 import asyncio
+
+# Cheapest bcrypt cost for tests (read when app.utils is imported)
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+
 from httpx import AsyncClient, ASGITransport
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
@@ -22,6 +27,33 @@ def disable_rate_limiting():
     limiter.enabled = True
 
 
+@pytest.fixture(autouse=True)
+def reset_negative_price_cache():
+    """Failed lookups recorded by one test must not suppress symbols in the next"""
+    from app.price_service import negative_cache
+    negative_cache._memory.clear()
+    yield
+    negative_cache._memory.clear()
+
+
+@pytest.fixture(autouse=True)
+def reset_user_cache():
+    """Every test starts with an empty authenticated-user cache"""
+    from app.user_cache import user_cache
+    user_cache.clear()
+    yield
+    user_cache.clear()
+
+
+@pytest.fixture(autouse=True)
+def reset_provider_governors():
+    """Fresh rate budgets and closed circuits for every test"""
+    from app import price_service
+    from app.provider_governor import create_governors
+    price_service.governors.update(create_governors(lambda: price_service.cache._redis))
+    yield
+
+
 @pytest.fixture(scope="session")
 def event_loop():
     """Create a single event loop for all tests"""
@@ -42,6 +74,43 @@ async def db_engine():
     await engine.dispose()
 
 
+@pytest.fixture
+async def migrated_engine(tmp_path, monkeypatch):
+    """Empty SQLite file database that alembic's env.py also connects to"""
+    import app.db
+
+    url = f"sqlite+aiosqlite:///{tmp_path / 'migrated.db'}"
+    monkeypatch.setattr(app.db, "DATABASE_URL", url)
+    engine = create_async_engine(url, echo=False)
+    yield engine
+    await engine.dispose()
+
+
+@pytest.fixture
+def count_queries(db_engine):
+    """Count SQL statements run on the test engine: `with count_queries() as n: ...; n.value`"""
+    from contextlib import contextmanager
+    from sqlalchemy import event
+
+    class Counter:
+        value = 0
+
+    @contextmanager
+    def counting():
+        counter = Counter()
+
+        def on_execute(*args, **kwargs):
+            counter.value += 1
+
+        event.listen(db_engine.sync_engine, "before_cursor_execute", on_execute)
+        try:
+            yield counter
+        finally:
+            event.remove(db_engine.sync_engine, "before_cursor_execute", on_execute)
+
+    return counting
+
+
 @pytest.fixture(scope="function")
 async def db_session(db_engine):
     """Get a database session for each test"""
@@ -92,3 +161,104 @@ async def auth_tokens(client, registered_user):
         "password": "SecurePass123!"
     })
     return resp.json()
+
+
+@pytest.fixture
+def age_cached_price():
+    """Make an in-memory price cache entry look `seconds` older"""
+    from app.price_service import cache
+
+    def age(key: str, seconds: float):
+        data = cache._memory_cache._data
+        entry = data[key]
+        price, fetched_at, fetched_mono = entry.value
+        data[key] = entry._replace(
+            value=(price, fetched_at - seconds, fetched_mono - seconds),
+            expires_at=entry.expires_at - seconds,
+        )
+
+    return age
+
+
+class FakeRedis:
+    """Minimal in-memory stand-in for redis.asyncio (GET/MGET/SETEX/pipelines)"""
+
+    def __init__(self):
+        self.store = {}
+        self.ttls = {}
+        self.round_trips = 0
+        self.fail = False
+
+    def _check(self):
+        self.round_trips += 1
+        if self.fail:
+            raise ConnectionError("redis down")
+
+    async def get(self, key):
+        self._check()
+        return self.store.get(key)
+
+    async def mget(self, keys):
+        self._check()
+        return [self.store.get(k) for k in keys]
+
+    async def setex(self, key, ttl, value):
+        self._check()
+        self.store[key] = value
+        self.ttls[key] = ttl
+
+    async def delete(self, *keys):
+        self._check()
+        for k in keys:
+            self.store.pop(k, None)
+
+    async def keys(self, pattern):
+        self._check()
+        prefix = pattern.rstrip("*")
+        return [k for k in self.store if k.startswith(prefix)]
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self._redis = redis
+        self._ops = []
+
+    def setex(self, key, ttl, value):
+        self._ops.append(("setex", key, ttl, value))
+        return self
+
+    def set(self, key, value, nx=False, px=None):
+        self._ops.append(("set", key, value, nx))
+        return self
+
+    async def execute(self):
+        self._redis._check()
+        results = []
+        for op in self._ops:
+            if op[0] == "setex":
+                _, key, ttl, value = op
+                self._redis.store[key] = value
+                self._redis.ttls[key] = ttl
+                results.append(True)
+            else:
+                _, key, value, nx = op
+                if nx and key in self._redis.store:
+                    results.append(None)
+                else:
+                    self._redis.store[key] = value
+                    results.append(True)
+        return results
+
+
+@pytest.fixture
+def fake_redis():
+    """Plug a FakeRedis into the shared price cache as its L2"""
+    from app.price_service import cache
+    redis = FakeRedis()
+    original = cache._redis
+    cache._redis = redis
+    yield redis
+    cache._redis = original
@@ -1,5 +1,14 @@
 """Integration tests for auth API endpoints — register, login, refresh, /me"""
+import asyncio
+import hashlib
+import time
 import pytest
+from unittest.mock import patch
+
+from sqlalchemy import select
+
+from app import utils
+from app.models import User
 
 
 class TestRegister:
@@ -64,6 +73,62 @@ class TestLogin:
         })
         assert resp.status_code == 401
 
+    async def test_unknown_email_still_checks_a_hash(self, client):
+        with patch("app.routes_auth.verify_password_async", wraps=utils.verify_password_async) as verify:
+            resp = await client.post("/login", data={
+                "username": "nobody@example.com",
+                "password": "Pass123!"
+            })
+        assert resp.status_code == 401
+        verify.assert_awaited_once()
+        assert verify.await_args.args[1].startswith("$2b$")
+
+    async def test_legacy_hash_upgraded_on_login(self, client, db_session):
+        salt = "abcd" * 8
+        legacy = f"{salt}${hashlib.sha256((salt + 'OldPass123!').encode()).hexdigest()}"
+        db_session.add(User(email="old@example.com", hashed_password=legacy))
+        await db_session.commit()
+
+        resp = await client.post("/login", data={"username": "old@example.com", "password": "OldPass123!"})
+        assert resp.status_code == 200
+
+        user = (await db_session.execute(select(User).where(User.email == "old@example.com"))).scalars().one()
+        assert user.hashed_password.startswith("$2b$")
+        resp = await client.post("/login", data={"username": "old@example.com", "password": "OldPass123!"})
+        assert resp.status_code == 200
+
+    async def test_busy_hashing_pool(self, client, registered_user):
+        with patch("app.utils.PASSWORD_HASH_QUEUE_MAX", 0), patch("app.utils._in_flight", utils.PASSWORD_HASH_WORKERS):
+            resp = await client.post("/login", data={
+                "username": "test@example.com",
+                "password": "SecurePass123!"
+            })
+        assert resp.status_code == 503
+        assert resp.headers["retry-after"] == "1"
+
+    async def test_logins_do_not_block_the_event_loop(self, client, registered_user):
+        """Password checks run on the hashing pool while /health keeps answering"""
+        def slow_verify(plain, hashed):
+            time.sleep(0.2)  # like bcrypt: blocks its thread, not the GIL
+            return True
+
+        with patch("app.utils.verify_password", slow_verify):
+            logins = asyncio.gather(*(
+                client.post("/login", data={"username": "test@example.com", "password": "SecurePass123!"})
+                for _ in range(10)
+            ))
+            latencies = []
+            while not logins.done():
+                start = time.perf_counter()
+                assert (await client.get("/health")).status_code == 200
+                latencies.append(time.perf_counter() - start)
+            results = await logins
+
+        assert all(r.status_code == 200 for r in results)
+        # 10 checks on PASSWORD_HASH_WORKERS threads take ~1s; /health never waits for one
+        assert len(latencies) > 5
+        assert max(latencies) < 0.2
+
 
 class TestRefresh:
     """POST /refresh"""
@@ -128,3 +193,45 @@ class TestHealthCheck:
         assert resp.status_code == 200
         data = resp.json()
         assert "DILFwallet" in data["message"]
+
+
+class TestAdmin:
+    """Admin-only endpoints"""
+
+    async def test_suppressed_symbols_requires_admin(self, client, auth_headers):
+        resp = await client.get("/admin/prices/suppressed", headers=auth_headers)
+        assert resp.status_code == 403
+
+    async def test_price_stats_requires_admin(self, client, auth_headers):
+        assert (await client.get("/admin/prices/stats")).status_code == 401
+        assert (await client.get("/admin/prices/stats", headers=auth_headers)).status_code == 403
+
+    async def test_price_stats_for_admin(self, client, auth_headers, monkeypatch):
+        from app import dependencies
+        monkeypatch.setattr(dependencies, "ADMIN_EMAILS", {"test@example.com"})
+
+        resp = await client.get("/admin/prices/stats", headers=auth_headers)
+
+        assert resp.status_code == 200
+        fetches = resp.json()["fetches"]
+        assert {"requested", "fetched", "coalesced", "coalesced_remote", "in_flight"} <= fetches.keys()
+        l1 = resp.json()["cache"]["l1"]
+        assert {"hits", "misses", "evictions", "entries", "bytes"} <= l1.keys()
+        assert resp.json()["cache"]["l2"]["enabled"] is False
+
+    async def test_suppressed_symbols_listed_for_admin(self, client, auth_headers, monkeypatch):
+        import time
+        from app import dependencies
+        from app.price_service import negative_cache, NegativeRecord
+        monkeypatch.setattr(dependencies, "ADMIN_EMAILS", {"test@example.com"})
+        negative_cache._memory.set(
+            "crypto_FAKE_usd",
+            NegativeRecord("coingecko", "FAKE", "crypto_FAKE_usd", 3, time.time() + 120),
+            240,
+        )
+
+        resp = await client.get("/admin/prices/suppressed", headers=auth_headers)
+
+        assert resp.status_code == 200
+        assert resp.json()[0]["symbol"] == "FAKE"
+        assert resp.json()[0]["failures"] == 3
@@ -1,5 +1,18 @@
 """Integration tests for portfolio API endpoints"""
+import asyncio
+import uuid
 import pytest
+from unittest.mock import patch
+
+from httpx import AsyncClient, ASGITransport
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from app.auth import create_access_token
+from app.db import get_db
+from app.main import app
+from app.models import Base
 
 
 class TestPortfolioCRUD:
@@ -72,3 +85,318 @@ class TestPortfolioIsolation:
         resp = await client.get("/portfolios", headers=headers_a)
         assert len(resp.json()) == 1
         assert resp.json()[0]["name"] == "Secret Portfolio"
+
+    async def test_foreign_portfolio_is_not_found(self, client, auth_headers):
+        await client.post("/register", json={"email": "a@test.com", "password": "Pass123!A"})
+        resp_a = await client.post("/login", data={"username": "a@test.com", "password": "Pass123!A"})
+        headers_a = {"Authorization": f"Bearer {resp_a.json()['access_token']}"}
+        pf = (await client.post("/portfolios", json={"name": "A", "type": "crypto"}, headers=headers_a)).json()
+
+        for method, path in [("GET", "entries"), ("GET", "summary"), ("GET", "realized"), ("DELETE", "")]:
+            resp = await client.request(method, f"/portfolios/{pf['id']}/{path}".rstrip("/"), headers=auth_headers)
+            assert resp.status_code == 404
+        assert (await client.get("/portfolios", headers=headers_a)).json()[0]["id"] == pf["id"]
+
+    async def test_ownership_checked_with_the_user_lookup(self, client, auth_headers, count_queries):
+        pf = (await client.post("/portfolios", json={"name": "P", "type": "crypto"}, headers=auth_headers)).json()
+        await client.post(f"/portfolios/{pf['id']}/entries", json={
+            "symbol": "BTC", "amount": 1, "purchase_price": 100
+        }, headers=auth_headers)
+
+        # user + portfolio in one query, then the endpoint's own reads
+        with count_queries() as entries:
+            resp = await client.get(f"/portfolios/{pf['id']}/entries", headers=auth_headers)
+        assert resp.status_code == 200 and entries.value == 2
+        with count_queries() as transactions:
+            resp = await client.get(f"/portfolios/{pf['id']}/transactions", headers=auth_headers)
+        assert len(resp.json()) == 1 and transactions.value == 3
+        with count_queries() as missing:
+            resp = await client.get("/portfolios/999/entries", headers=auth_headers)
+        assert resp.status_code == 404 and missing.value == 1
+
+    async def test_unknown_user(self, client):
+        token = create_access_token(uuid.uuid4())
+        resp = await client.get("/portfolios/1/entries", headers={"Authorization": f"Bearer {token}"})
+        assert resp.status_code == 401
+
+
+class TestPortfolioSummary:
+    """GET /portfolios/{id}/summary"""
+
+    async def test_summary_reports_price_freshness(self, client, auth_headers):
+        from app.price_service import cache
+        cache._memory_cache.clear()
+        await cache.set("crypto_BTC_usd", 50000.0, ttl=60)
+
+        pf = (await client.post("/portfolios", json={"name": "C", "type": "crypto"}, headers=auth_headers)).json()
+        await client.post(f"/portfolios/{pf['id']}/entries", json={
+            "symbol": "BTC", "amount": 2, "purchase_price": 40000
+        }, headers=auth_headers)
+
+        resp = await client.get(f"/portfolios/{pf['id']}/summary", headers=auth_headers)
+        assert resp.status_code == 200
+        data = resp.json()
+        item = data["items"][0]
+        assert item["current_price"] == 50000.0
+        assert item["price_as_of"] is not None
+        assert data["prices_as_of"] == item["price_as_of"]
+        assert data["total_invested"] == 80000.0
+        assert data["total_current_value"] == 100000.0
+
+    async def _portfolio_with_buys(self, client, auth_headers, buys: int):
+        from app.price_service import cache
+        await cache.set("crypto_BTC_usd", 50000.0, ttl=60)
+        pf = (await client.post("/portfolios", json={"name": "C", "type": "crypto"}, headers=auth_headers)).json()
+        entry = (await client.post(f"/portfolios/{pf['id']}/entries", json={
+            "symbol": "BTC", "amount": 1, "purchase_price": 40000
+        }, headers=auth_headers)).json()
+        for _ in range(buys):
+            await client.post(f"/portfolios/{pf['id']}/transactions", json={
+                "symbol": "BTC", "quantity": "0.1", "price": "45000", "type": "buy",
+                "portfolio_entry_id": entry["id"]
+            }, headers=auth_headers)
+        return pf["id"]
+
+    async def test_transactions_are_opt_in(self, client, auth_headers):
+        pf_id = await self._portfolio_with_buys(client, auth_headers, 3)
+
+        data = (await client.get(f"/portfolios/{pf_id}/summary", headers=auth_headers)).json()
+
+        item = data["items"][0]
+        assert item["transactions"] == []
+        assert item["transaction_count"] == 4
+        assert item["last_transaction_at"] is not None
+        assert data["transactions_total"] == 4
+
+    async def test_transactions_paginated(self, client, auth_headers):
+        pf_id = await self._portfolio_with_buys(client, auth_headers, 4)
+        url = f"/portfolios/{pf_id}/summary"
+
+        first = (await client.get(url, params={"include_transactions": "true", "limit": 3}, headers=auth_headers)).json()
+        rest = (await client.get(url, params={"include_transactions": "true", "limit": 3, "offset": 3}, headers=auth_headers)).json()
+
+        page1 = first["items"][0]["transactions"]
+        page2 = rest["items"][0]["transactions"]
+        assert len(page1) == 3 and len(page2) == 2
+        assert not {tx["id"] for tx in page1} & {tx["id"] for tx in page2}
+        assert page1[0]["current_price"] == 50000.0
+        assert page1[0]["profit_loss"] == pytest.approx(500.0)
+
+    async def test_query_count_flat_as_history_grows(self, client, auth_headers, count_queries):
+        small = await self._portfolio_with_buys(client, auth_headers, 1)
+        large = await self._portfolio_with_buys(client, auth_headers, 25)
+
+        with count_queries() as few:
+            await client.get(f"/portfolios/{small}/summary", headers=auth_headers)
+        with count_queries() as many:
+            resp = await client.get(f"/portfolios/{large}/summary", headers=auth_headers)
+
+        assert resp.json()["transactions_total"] == 26
+        assert many.value == few.value
+
+    async def test_positions_match_entry_bookkeeping(self, client, auth_headers):
+        pf_id = await self._portfolio_with_buys(client, auth_headers, 0)
+        entry = (await client.get(f"/portfolios/{pf_id}/entries", headers=auth_headers)).json()[0]
+        for tx_type, quantity, price in [("sell", "0.4", "45000"), ("buy", "0.9", "52000"), ("sell", "0.5", "51000")]:
+            await client.post(f"/portfolios/{pf_id}/transactions", json={
+                "symbol": "BTC", "quantity": quantity, "price": price, "type": tx_type,
+                "portfolio_entry_id": entry["id"]
+            }, headers=auth_headers)
+
+        item = (await client.get(f"/portfolios/{pf_id}/summary", headers=auth_headers)).json()["items"][0]
+        stored = (await client.get(f"/portfolios/{pf_id}/entries", headers=auth_headers)).json()[0]
+
+        assert item["amount"] == pytest.approx(float(stored["amount"]))
+        assert item["avg_purchase_price"] == pytest.approx(float(stored["purchase_price"]))
+        assert item["profit_loss"] == pytest.approx(item["amount"] * (50000 - item["avg_purchase_price"]))
+
+    async def test_empty_and_foreign_portfolio(self, client, auth_headers):
+        pf = (await client.post("/portfolios", json={"name": "E", "type": "crypto"}, headers=auth_headers)).json()
+        resp = await client.get(f"/portfolios/{pf['id']}/summary", headers=auth_headers)
+        assert resp.status_code == 200 and resp.json()["items"] == []
+
+        resp = await client.get("/portfolios/999/summary", headers=auth_headers)
+        assert resp.status_code == 404
+
+
+class TestDashboard:
+    """GET /dashboard"""
+
+    async def _add(self, client, auth_headers, name, ptype, entries):
+        pf = (await client.post("/portfolios", json={"name": name, "type": ptype}, headers=auth_headers)).json()
+        for symbol, amount, price in entries:
+            await client.post(f"/portfolios/{pf['id']}/entries", json={
+                "symbol": symbol, "amount": amount, "purchase_price": price
+            }, headers=auth_headers)
+        return pf["id"]
+
+    @pytest.fixture(autouse=True)
+    async def cached_prices(self):
+        from app.price_service import cache
+        cache._memory_cache.clear()
+        await cache.set("crypto_BTC_usd", 50000.0, ttl=60)
+        await cache.set("crypto_ETH_usd", 3000.0, ttl=60)
+        await cache.set("stock_AAPL", 200.0, ttl=300)
+        await cache.set("stock_SPY", 500.0, ttl=300)
+
+    async def test_totals_and_consolidated_symbols(self, client, auth_headers):
+        a = await self._add(client, auth_headers, "A", "crypto", [("BTC", 1, 40000), ("ETH", 2, 2000)])
+        b = await self._add(client, auth_headers, "B", "crypto", [("BTC", 1, 60000)])
+        await self._add(client, auth_headers, "S", "stocks", [("AAPL", 10, 150)])
+
+        resp = await client.get("/dashboard", headers=auth_headers)
+        assert resp.status_code == 200
+        data = resp.json()
+
+        totals = {p["portfolio"]["id"]: p for p in data["portfolios"]}
+        assert totals[a]["total_invested"] == 44000.0
+        assert totals[a]["total_current_value"] == 56000.0
+        assert totals[a]["transaction_count"] == 2
+        assert totals[b]["total_profit_loss"] == -10000.0
+
+        btc = next(h for h in data["holdings"] if h["symbol"] == "BTC")
+        assert btc["amount"] == 2.0
+        assert btc["avg_purchase_price"] == 50000.0
+        assert btc["total_value"] == 100000.0
+        assert sorted(btc["portfolio_ids"]) == sorted([a, b])
+        assert data["total_current_value"] == 100000.0 + 6000.0 + 2000.0
+
+    async def test_sold_out_entries_leave_holdings(self, client, auth_headers):
+        a = await self._add(client, auth_headers, "A", "crypto", [("BTC", 1, 40000), ("ETH", 2, 2000)])
+        eth = next(e for e in (await client.get(f"/portfolios/{a}/entries", headers=auth_headers)).json()
+                   if e["symbol"] == "ETH")
+        await client.post(f"/portfolios/{a}/transactions", json={
+            "symbol": "ETH", "quantity": "2", "price": "2500", "type": "sell", "portfolio_entry_id": eth["id"]
+        }, headers=auth_headers)
+
+        data = (await client.get("/dashboard", headers=auth_headers)).json()
+
+        assert [h["symbol"] for h in data["holdings"]] == ["BTC"]
+        assert data["portfolios"][0]["total_invested"] == 40000.0
+        assert data["portfolios"][0]["transaction_count"] == 3
+
+    async def test_one_price_batch_per_provider(self, client, auth_headers):
+        await self._add(client, auth_headers, "A", "crypto", [("BTC", 1, 1)])
+        await self._add(client, auth_headers, "B", "crypto", [("ETH", 1, 1)])
+        await self._add(client, auth_headers, "S", "stocks", [("AAPL", 1, 1)])
+        await self._add(client, auth_headers, "E", "etf", [("SPY", 1, 1)])
+
+        from app import price_service
+        with patch.object(price_service, "_quotes_for_plan", wraps=price_service._quotes_for_plan) as lookup:
+            resp = await client.get("/dashboard", headers=auth_headers)
+
+        assert resp.status_code == 200
+        # crypto (both portfolios) + stocks/etf merged
+        assert lookup.call_count == 2
+
+    async def test_query_count_is_flat(self, client, auth_headers, count_queries):
+        await self._add(client, auth_headers, "A", "crypto", [("BTC", 1, 1)])
+        with count_queries() as one:
+            await client.get("/dashboard", headers=auth_headers)
+
+        for i in range(4):
+            await self._add(client, auth_headers, f"P{i}", "crypto", [("BTC", 1, 1), ("ETH", 1, 1)])
+        with count_queries() as many:
+            resp = await client.get("/dashboard", headers=auth_headers)
+
+        assert len(resp.json()["portfolios"]) == 5
+        assert many.value == one.value
+
+    async def test_empty(self, client, auth_headers):
+        resp = await client.get("/dashboard", headers=auth_headers)
+        assert resp.json()["portfolios"] == [] and resp.json()["total_invested"] == 0.0
+
+
+class TestWritePaths:
+    """Entry and transaction writes: one commit, no lost updates"""
+
+    @pytest.fixture
+    async def parallel_client(self, tmp_path):
+        """Client on a file database with a session per request, so requests really interleave"""
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'writes.db'}")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        factory = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+        async def override_get_db():
+            async with factory() as session:
+                yield session
+
+        app.dependency_overrides[get_db] = override_get_db
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+            await ac.post("/register", json={"email": "writer@example.com", "password": "SecurePass123!"})
+            token = (await ac.post("/login", data={
+                "username": "writer@example.com", "password": "SecurePass123!"
+            })).json()["access_token"]
+            ac.headers["Authorization"] = f"Bearer {token}"
+            yield ac
+        app.dependency_overrides.clear()
+        await engine.dispose()
+
+    async def _entry(self, client, amount=1, price=100, headers=None):
+        pf = (await client.post("/portfolios", json={"name": "W", "type": "crypto"}, headers=headers)).json()
+        entry = (await client.post(f"/portfolios/{pf['id']}/entries", json={
+            "symbol": "btc", "amount": amount, "purchase_price": price
+        }, headers=headers)).json()
+        return pf["id"], entry
+
+    async def test_one_commit_per_write(self, client, auth_headers, db_engine):
+        pf = (await client.post("/portfolios", json={"name": "W", "type": "crypto"}, headers=auth_headers)).json()
+        commits = []
+
+        def on_commit(conn):
+            commits.append(conn)
+
+        event.listen(db_engine.sync_engine, "commit", on_commit)
+        try:
+            entry = (await client.post(f"/portfolios/{pf['id']}/entries", json={
+                "symbol": "BTC", "amount": 1, "purchase_price": 100
+            }, headers=auth_headers)).json()
+            assert len(commits) == 1
+            await client.post(f"/portfolios/{pf['id']}/entries", json={
+                "symbol": "BTC", "amount": 1, "purchase_price": 200
+            }, headers=auth_headers)
+            resp = await client.post(f"/portfolios/{pf['id']}/transactions", json={
+                "symbol": "BTC", "quantity": 1, "price": 300, "type": "sell", "portfolio_entry_id": entry["id"]
+            }, headers=auth_headers)
+        finally:
+            event.remove(db_engine.sync_engine, "commit", on_commit)
+        assert resp.status_code == 200
+        assert len(commits) == 3
+
+    async def test_parallel_buys_keep_every_fill(self, parallel_client):
+        portfolio_id, entry = await self._entry(parallel_client)
+
+        responses = await asyncio.gather(*(
+            parallel_client.post(f"/portfolios/{portfolio_id}/transactions", json={
+                "symbol": "BTC", "quantity": 1, "price": 200, "type": "buy", "portfolio_entry_id": entry["id"]
+            })
+            for _ in range(20)
+        ))
+
+        assert all(resp.status_code == 200 for resp in responses)
+        pe, = (await parallel_client.get(f"/portfolios/{portfolio_id}/entries")).json()
+        assert pe["amount"] == 21.0
+        assert pe["purchase_price"] == pytest.approx((100 + 20 * 200) / 21)
+
+    async def test_parallel_sells_never_oversell(self, parallel_client):
+        portfolio_id, entry = await self._entry(parallel_client, amount=5)
+
+        responses = await asyncio.gather(*(
+            parallel_client.post(f"/portfolios/{portfolio_id}/transactions", json={
+                "symbol": "BTC", "quantity": 1, "price": 150, "type": "sell", "portfolio_entry_id": entry["id"]
+            })
+            for _ in range(8)
+        ))
+
+        assert sorted(resp.status_code for resp in responses) == [200] * 5 + [400] * 3
+        pe, = (await parallel_client.get(f"/portfolios/{portfolio_id}/entries")).json()
+        assert pe["amount"] == 0.0
+        assert pe["realized_pl"] == pytest.approx(5 * 50.0)
+
+    async def test_unknown_entry(self, client, auth_headers):
+        portfolio_id, _ = await self._entry(client, headers=auth_headers)
+        resp = await client.post(f"/portfolios/{portfolio_id}/transactions", json={
+            "symbol": "BTC", "quantity": 1, "price": 1, "type": "sell", "portfolio_entry_id": 999
+        }, headers=auth_headers)
+        assert resp.status_code == 404
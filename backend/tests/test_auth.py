@@ -31,6 +31,53 @@ class TestPasswordHashing:
         h2 = hash_password("SamePassword")
         assert h1 != h2  # bcrypt salts should differ
 
+    def test_bcrypt_format(self):
+        from app.utils import hash_password, needs_rehash
+        hashed = hash_password("SecurePass123!")
+        assert hashed.startswith("$2b$")
+        assert needs_rehash(hashed) is False
+
+    def test_legacy_sha256_still_verifies(self):
+        import hashlib
+        from app.utils import needs_rehash, verify_password
+        salt = "0123456789abcdef" * 2
+        legacy = f"{salt}${hashlib.sha256((salt + 'OldPass').encode()).hexdigest()}"
+        assert verify_password("OldPass", legacy) is True
+        assert verify_password("WrongPass", legacy) is False
+        assert needs_rehash(legacy) is True
+
+    def test_malformed_hash(self):
+        from app.utils import verify_password
+        assert verify_password("x", "not-a-hash") is False
+        assert verify_password("x", "$2b$04$broken") is False
+
+    async def test_async_helpers(self):
+        from app.utils import hash_password_async, verify_password_async
+        hashed = await hash_password_async("SecurePass123!")
+        assert await verify_password_async("SecurePass123!", hashed) is True
+
+    async def test_cancelled_call_counts_until_the_thread_finishes(self):
+        import asyncio
+        import threading
+        from app import utils
+        release = threading.Event()
+        before = utils._in_flight
+
+        task = asyncio.create_task(utils._run(release.wait))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        # The worker thread is still busy, so the slot stays taken
+        assert utils._in_flight == before + 1
+
+        release.set()
+        for _ in range(100):
+            if utils._in_flight == before:
+                break
+            await asyncio.sleep(0.01)
+        assert utils._in_flight == before
+
 
 class TestJWT:
     """Tests for JWT token creation and verification"""
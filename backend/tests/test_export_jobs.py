@@ -0,0 +1,146 @@
+"""Tests for background full-account export jobs"""
+import csv
+import io
+import uuid
+import zipfile
+import pytest
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from app import export_jobs
+from app.models import ExportJob, ExportStatus
+
+
+@pytest.fixture
+def export_dir(tmp_path):
+    with patch("app.export_jobs.EXPORT_DIR", str(tmp_path)):
+        yield tmp_path
+
+
+@pytest.fixture
+def session_factory(db_engine):
+    return sessionmaker(bind=db_engine, class_=AsyncSession, expire_on_commit=False)
+
+
+async def _account(client, auth_headers):
+    pf = (await client.post("/portfolios", json={"name": "Long / Term", "type": "crypto"}, headers=auth_headers)).json()
+    await client.post(f"/portfolios/{pf['id']}/entries", json={
+        "symbol": "BTC", "amount": 2, "purchase_price": 100
+    }, headers=auth_headers)
+    category = (await client.get("/budget/categories", headers=auth_headers)).json()[0]
+    await client.post("/budget/transactions", json={
+        "category_id": category["id"], "amount": 42, "description": "rent"
+    }, headers=auth_headers)
+    return pf
+
+
+class TestExportJobs:
+    async def test_full_account_archive(self, client, auth_headers, export_dir, session_factory):
+        pf = await _account(client, auth_headers)
+
+        resp = await client.post("/exports", headers=auth_headers)
+        assert resp.status_code == 202
+        job = resp.json()
+        assert job["status"] == "queued" and job["download_url"] is None
+
+        await export_jobs.run_job(uuid.UUID(job["id"]), session_factory)
+
+        status = (await client.get(f"/exports/{job['id']}", headers=auth_headers)).json()
+        assert status["status"] == "done"
+        assert status["size_bytes"] > 0 and status["started_at"] and status["finished_at"]
+        assert status["download_url"] == f"/exports/{job['id']}/download"
+
+        resp = await client.get(status["download_url"], headers=auth_headers)
+        assert resp.status_code == 200
+        assert resp.headers["content-type"] == "application/zip"
+        with zipfile.ZipFile(io.BytesIO(resp.content)) as archive:
+            names = archive.namelist()
+            assert names == [f"portfolios/{pf['id']}_Long_Term.csv", "budget.csv"]
+            portfolio = list(csv.reader(io.StringIO(archive.read(names[0]).decode())))
+            budget = list(csv.reader(io.StringIO(archive.read("budget.csv").decode())))
+        assert portfolio[0] == ["Portfolio Export", "Long / Term"]
+        assert budget[1][4] == "rent"
+        assert not list(export_dir.glob("*.part"))
+
+    async def test_one_active_export_per_user(self, client, auth_headers, export_dir):
+        assert (await client.post("/exports", headers=auth_headers)).status_code == 202
+        resp = await client.post("/exports", headers=auth_headers)
+        assert resp.status_code == 429
+
+    async def test_full_queue(self, client, auth_headers):
+        with patch("app.export_jobs.queue_full", return_value=True):
+            resp = await client.post("/exports", headers=auth_headers)
+        assert resp.status_code == 503
+
+    async def test_queue_filled_after_insert_fails_job(self, client, auth_headers, db_session):
+        with patch("app.export_jobs.queue_full", side_effect=[False, True]), \
+                patch("app.export_jobs.enqueue", return_value=False):
+            resp = await client.post("/exports", headers=auth_headers)
+        assert resp.status_code == 503
+
+        job = (await db_session.execute(select(ExportJob))).scalars().one()
+        assert job.status == ExportStatus.failed and job.finished_at
+        # the failed job doesn't count against the user's limit
+        assert (await client.post("/exports", headers=auth_headers)).status_code == 202
+
+    async def test_active_limit_counted_in_the_insert(self, db_session, registered_user):
+        user_id = registered_user["id"]
+        with patch("app.export_jobs.EXPORT_MAX_ACTIVE_PER_USER", 2):
+            first = await export_jobs.create_job(db_session, user_id)
+            second = await export_jobs.create_job(db_session, user_id)
+            third = await export_jobs.create_job(db_session, user_id)
+
+        assert first.status == ExportStatus.queued and first.created_at
+        assert second.id != first.id
+        assert third is None
+        assert len((await db_session.execute(select(ExportJob))).scalars().all()) == 2
+
+    async def test_claimed_once(self, client, auth_headers, export_dir, session_factory):
+        job_id = uuid.UUID((await client.post("/exports", headers=auth_headers)).json()["id"])
+
+        await export_jobs.run_job(job_id, session_factory)
+        with patch("app.export_jobs._build") as build:
+            await export_jobs.run_job(job_id, session_factory)
+        build.assert_not_called()
+
+    async def test_failure_is_recorded(self, client, auth_headers, export_dir, session_factory):
+        job_id = (await client.post("/exports", headers=auth_headers)).json()["id"]
+
+        with patch("app.export_jobs._build", side_effect=OSError("disk full")):
+            await export_jobs.run_job(uuid.UUID(job_id), session_factory)
+
+        status = (await client.get(f"/exports/{job_id}", headers=auth_headers)).json()
+        assert status["status"] == "failed" and status["error"] == "disk full"
+        resp = await client.get(f"/exports/{job_id}/download", headers=auth_headers)
+        assert resp.status_code == 409
+        # a failed job no longer blocks a new export
+        assert (await client.post("/exports", headers=auth_headers)).status_code == 202
+
+    async def test_foreign_job(self, client, auth_headers):
+        resp = await client.get(f"/exports/{uuid.uuid4()}", headers=auth_headers)
+        assert resp.status_code == 404
+
+
+class TestCleanup:
+    async def test_expires_old_archives_and_stale_runs(self, db_session, registered_user, export_dir):
+        now = datetime.utcnow()
+        old = ExportJob(user_id=registered_user["id"], status=ExportStatus.done, finished_at=now - timedelta(days=2))
+        fresh = ExportJob(user_id=registered_user["id"], status=ExportStatus.done, finished_at=now)
+        stale = ExportJob(user_id=registered_user["id"], status=ExportStatus.running, started_at=now - timedelta(hours=2))
+        db_session.add_all([old, fresh, stale])
+        await db_session.commit()
+        for job in (old, fresh):
+            open(export_jobs.archive_path(job.id), "wb").close()
+
+        assert await export_jobs.cleanup(db_session) == 2
+
+        for job in (old, fresh, stale):
+            await db_session.refresh(job)
+        assert old.status == ExportStatus.expired
+        assert fresh.status == ExportStatus.done
+        assert stale.status == ExportStatus.failed
+        assert [p.name for p in export_dir.iterdir()] == [f"{fresh.id}.zip"]
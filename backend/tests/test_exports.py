@@ -0,0 +1,212 @@
+"""Tests for the streamed CSV / JSON exports"""
+import csv
+import io
+import json
+import pytest
+from unittest.mock import patch
+
+from httpx import AsyncClient, ASGITransport
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from app import exports
+from app.db import get_db
+from app.main import app
+from app.models import Base, Transaction
+
+
+async def _portfolio_with_fills(client, auth_headers, buys: int):
+    pf = (await client.post("/portfolios", json={"name": "My Coins", "type": "crypto"}, headers=auth_headers)).json()
+    entry = (await client.post(f"/portfolios/{pf['id']}/entries", json={
+        "symbol": "BTC", "amount": 1, "purchase_price": 100
+    }, headers=auth_headers)).json()
+    for i in range(buys):
+        await client.post(f"/portfolios/{pf['id']}/transactions", json={
+            "symbol": "BTC", "quantity": 1, "price": 100 + i, "type": "buy",
+            "portfolio_entry_id": entry["id"]
+        }, headers=auth_headers)
+    return pf["id"]
+
+
+class TestPortfolioExport:
+    async def test_csv(self, client, auth_headers):
+        portfolio_id = await _portfolio_with_fills(client, auth_headers, 2)
+
+        resp = await client.get(f"/portfolios/{portfolio_id}/export/csv", headers=auth_headers)
+
+        assert resp.status_code == 200
+        assert resp.headers["content-type"].startswith("text/csv")
+        assert "portfolio_My_Coins_" in resp.headers["content-disposition"]
+        rows = list(csv.reader(io.StringIO(resp.text)))
+        assert rows[0] == ["Portfolio Export", "My Coins"]
+        assert rows[6][0] == "BTC" and float(rows[6][1]) == 3.0
+        header = rows.index(["Date", "Symbol", "Type", "Quantity", "Price", "Total"])
+        assert len(rows[header + 1:]) == 3
+        assert rows[header + 1][2] == "BUY"
+
+    async def test_json(self, client, auth_headers):
+        portfolio_id = await _portfolio_with_fills(client, auth_headers, 2)
+
+        resp = await client.get(f"/portfolios/{portfolio_id}/export/json", headers=auth_headers)
+
+        data = resp.json()
+        assert data["portfolio"]["name"] == "My Coins"
+        holding, = data["holdings"]
+        assert holding["symbol"] == "BTC" and holding["amount"] == 3.0
+        assert holding["total_invested"] == pytest.approx(301.0)
+        assert len(data["transactions"]) == 3
+        assert {tx["price"] for tx in data["transactions"]} == {100.0, 101.0}
+
+    async def test_empty_portfolio_is_valid_json(self, client, auth_headers):
+        pf = (await client.post("/portfolios", json={"name": "E", "type": "crypto"}, headers=auth_headers)).json()
+        resp = await client.get(f"/portfolios/{pf['id']}/export/json", headers=auth_headers)
+        assert resp.json()["holdings"] == [] and resp.json()["transactions"] == []
+
+    async def test_foreign_portfolio(self, client, auth_headers):
+        resp = await client.get("/portfolios/999/export/csv", headers=auth_headers)
+        assert resp.status_code == 404
+
+
+class TestBudgetExport:
+    async def _add(self, client, auth_headers, count):
+        category = (await client.get("/budget/categories", headers=auth_headers)).json()[0]
+        for i in range(count):
+            await client.post("/budget/transactions", json={
+                "category_id": category["id"], "amount": 10.5 + i, "description": f"tx {i}"
+            }, headers=auth_headers)
+        return category
+
+    async def test_csv(self, client, auth_headers):
+        category = await self._add(client, auth_headers, 2)
+        resp = await client.get("/budget/export/csv", params={"period": "all"}, headers=auth_headers)
+
+        rows = list(csv.reader(io.StringIO(resp.text)))
+        assert rows[0] == ["Date", "Category", "Type", "Amount", "Description"]
+        assert len(rows) == 3
+        assert rows[1][1] == category["name"] and rows[1][2] == category["type"]
+
+    async def test_json(self, client, auth_headers):
+        await self._add(client, auth_headers, 3)
+        resp = await client.get("/budget/export/json", headers=auth_headers)
+
+        data = resp.json()
+        assert data["period"] == "month"
+        assert sorted(tx["amount"] for tx in data["transactions"]) == [10.5, 11.5, 12.5]
+
+
+class TestStreaming:
+    async def test_rows_arrive_in_chunks(self, client, auth_headers, db_session):
+        portfolio_id = await _portfolio_with_fills(client, auth_headers, 9)
+        query = select(Transaction.id, Transaction.price)
+
+        with patch("app.exports.EXPORT_CHUNK_SIZE", 3):
+            csv_chunks = [chunk async for chunk in exports.csv_stream(
+                db_session, [[["id", "price"]], exports.Rows(query, lambda row: [row.id, row.price])]
+            )]
+            json_chunks = [chunk async for chunk in exports.json_stream(
+                db_session, {"rows": exports.Rows(query, lambda row: {"price": row.price})}
+            )]
+
+        # header + 10 rows in partitions of 3
+        assert len(csv_chunks) == 1 + 4
+        assert len(json.loads("".join(json_chunks))["rows"]) == 10
+        assert max(len(chunk) for chunk in json_chunks) < len("".join(json_chunks)) / 2
+
+
+class TestStreamSession:
+    """Response bodies read through their own session and return its connection"""
+
+    @pytest.fixture
+    async def session_per_request(self, tmp_path):
+        """Client on a file database with a session per request, closed when the handler returns"""
+        # A queue pool, as on PostgreSQL, so checked-out connections are counted
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'exports.db'}", poolclass=AsyncAdaptedQueuePool)
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        factory = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+        async def override_get_db():
+            async with factory() as session:
+                yield session
+
+        app.dependency_overrides[get_db] = override_get_db
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+            await ac.post("/register", json={"email": "exporter@example.com", "password": "SecurePass123!"})
+            token = (await ac.post("/login", data={
+                "username": "exporter@example.com", "password": "SecurePass123!"
+            })).json()["access_token"]
+            yield ac, {"Authorization": f"Bearer {token}"}, engine
+        app.dependency_overrides.clear()
+        await engine.dispose()
+
+    @pytest.mark.parametrize("path", [
+        "/portfolios/{id}/export/csv",
+        "/portfolios/{id}/export/json",
+        "/budget/export/csv",
+        "/budget/export/json",
+        "/portfolios/{id}/export/parquet",
+        "/portfolios/{id}/export/arrow",
+        "/budget/export/parquet",
+    ])
+    async def test_connection_checked_back_in(self, session_per_request, path):
+        client, auth_headers, engine = session_per_request
+        portfolio_id = await _portfolio_with_fills(client, auth_headers, 3)
+
+        resp = await client.get(path.format(id=portfolio_id), headers=auth_headers)
+
+        assert resp.status_code == 200
+        assert engine.pool.checkedout() == 0
+
+
+class TestColumnarExport:
+    @pytest.fixture(autouse=True)
+    def _pyarrow(self):
+        pytest.importorskip("pyarrow")
+
+    def _read(self, resp, fmt):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        if fmt == "parquet":
+            return pq.read_table(io.BytesIO(resp.content))
+        return pa.ipc.open_stream(resp.content).read_all()
+
+    @pytest.mark.parametrize("fmt", ["parquet", "arrow"])
+    async def test_portfolio_transactions(self, client, auth_headers, fmt):
+        import pyarrow as pa
+        portfolio_id = await _portfolio_with_fills(client, auth_headers, 2)
+
+        with patch("app.exports.EXPORT_RECORD_BATCH_SIZE", 2):
+            resp = await client.get(f"/portfolios/{portfolio_id}/export/{fmt}", headers=auth_headers)
+
+        assert resp.status_code == 200
+        assert resp.headers["content-disposition"].endswith(f".{fmt}")
+        table = self._read(resp, fmt)
+        assert table.num_rows == 3
+        assert pa.types.is_dictionary(table.schema.field("symbol").type)
+        assert pa.types.is_decimal(table.schema.field("price").type)
+        assert pa.types.is_timestamp(table.schema.field("date").type)
+        assert sorted(float(p) for p in table.column("price").to_pylist()) == [100.0, 100.0, 101.0]
+        assert set(table.column("type").to_pylist()) == {"buy"}
+
+    async def test_budget_transactions(self, client, auth_headers):
+        category = (await client.get("/budget/categories", headers=auth_headers)).json()[0]
+        await client.post("/budget/transactions", json={
+            "category_id": category["id"], "amount": 12.34, "description": "lunch"
+        }, headers=auth_headers)
+
+        resp = await client.get("/budget/export/parquet", params={"period": "all"}, headers=auth_headers)
+
+        row, = self._read(resp, "parquet").to_pylist()
+        assert str(row["amount"]) == "12.34"
+        assert row["category"] == category["name"] and row["description"] == "lunch"
+
+    async def test_unknown_format(self, client, auth_headers):
+        resp = await client.get("/budget/export/xlsx", headers=auth_headers)
+        assert resp.status_code == 422
+
+    async def test_without_pyarrow(self, client, auth_headers):
+        with patch("app.exports.load_pyarrow", return_value=None):
+            resp = await client.get("/budget/export/arrow", headers=auth_headers)
+        assert resp.status_code == 501
@@ -0,0 +1,121 @@
+"""Tests for the vectorized P&L engine"""
+import math
+from decimal import Decimal
+
+import numpy as np
+import pytest
+
+from app import pnl_engine
+from app.models import TransactionType
+
+BUY, SELL = TransactionType.buy, TransactionType.sell
+
+
+def _arrays():
+    # entry 10: buy 1 @ 100, buy 1 @ 200, sell 0.5 @ 300; entry 20: buy 2 @ 50
+    return pnl_engine.from_rows([
+        (10, Decimal("1"), Decimal("100"), BUY),
+        (20, Decimal("2"), Decimal("50"), BUY),
+        (10, Decimal("1"), Decimal("200"), BUY),
+        (10, Decimal("0.5"), Decimal("300"), SELL),
+    ], [10, 20, 30])
+
+
+class TestTransactionPnL:
+    def test_buys_valued_sells_not(self):
+        tx = _arrays()
+        pnl = pnl_engine.transaction_pnl(tx, np.array([250.0, 40.0, np.nan]))
+
+        assert pnl.invested.tolist() == [100.0, 100.0, 200.0, 150.0]
+        assert pnl.current_value[:3].tolist() == [250.0, 80.0, 250.0]
+        assert pnl.profit_loss[:3].tolist() == [150.0, -20.0, 50.0]
+        assert pnl.profit_loss_percentage[0] == pytest.approx(150.0)
+        assert math.isnan(pnl.current_value[3]) and math.isnan(pnl.profit_loss_percentage[3])
+        assert pnl.current_price[3] == 250.0
+
+    def test_unknown_price(self):
+        pnl = pnl_engine.transaction_pnl(_arrays(), np.array([np.nan, 40.0, np.nan]))
+        assert math.isnan(pnl.current_value[0])
+        assert pnl_engine.none_if_nan(pnl.profit_loss[0]) is None
+
+    def test_empty(self):
+        tx = pnl_engine.from_rows([], [1])
+        pnl = pnl_engine.transaction_pnl(tx, np.array([1.0]))
+        assert len(pnl.invested) == 0
+
+
+class TestEntryPnL:
+    def test_grouped_average_cost_position(self):
+        pnl = pnl_engine.entry_pnl(_arrays(), np.array([250.0, 40.0, np.nan]))
+
+        assert pnl.amount.tolist() == [1.5, 2.0, 0.0]
+        assert pnl.avg_price.tolist() == [150.0, 50.0, 0.0]
+        assert pnl.invested.tolist() == [225.0, 100.0, 0.0]
+        assert pnl.current_value.tolist() == [375.0, 80.0, 0.0]
+        assert pnl.profit_loss[:2].tolist() == [150.0, -20.0]
+        assert math.isnan(pnl.profit_loss[2])
+
+    def test_matches_entry_bookkeeping(self):
+        """Same amount / purchase_price the write path keeps on PortfolioEntry"""
+        rng = np.random.default_rng(7)
+        rows, amount, avg = [], 0.0, 0.0
+        for _ in range(200):
+            qty, price = float(rng.uniform(0.1, 2)), float(rng.uniform(10, 100))
+            if amount > qty and rng.random() < 0.3:
+                rows.append((1, qty, price, SELL))
+                amount -= qty
+            else:
+                rows.append((1, qty, price, BUY))
+                avg = (amount * avg + qty * price) / (amount + qty)
+                amount += qty
+
+        pnl = pnl_engine.entry_pnl(pnl_engine.from_rows(rows, [1]), np.array([50.0]))
+
+        assert pnl.amount[0] == pytest.approx(amount)
+        assert pnl.avg_price[0] == pytest.approx(avg)
+
+    def test_sell_between_buys_and_full_exit(self):
+        tx = pnl_engine.from_rows([
+            (1, 1, 100, BUY), (1, 0.5, 120, SELL), (1, 1, 200, BUY),   # avg (50 + 200) / 1.5
+            (2, 1, 100, BUY), (2, 1, 150, SELL), (2, 2, 30, BUY),      # full exit, then fresh
+        ], [1, 2])
+        pnl = pnl_engine.entry_pnl(tx, np.array([np.nan, np.nan]))
+
+        assert pnl.avg_price[0] == pytest.approx(250 / 1.5)
+        assert pnl.avg_price[1] == pytest.approx(30.0)
+        assert pnl.invested.tolist() == pytest.approx([250.0, 60.0])
+
+    def test_group_totals(self):
+        invested, value = pnl_engine.group_totals(
+            np.array([0, 1, 0]), 3, np.array([1.0, 2.0, 3.0]), np.array([10.0, 20.0, 30.0])
+        )
+        assert invested.tolist() == [4.0, 2.0, 0.0]
+        assert value.tolist() == [40.0, 20.0, 0.0]
+
+
+class TestLoad:
+    async def test_load_transactions_column_wise(self, db_session):
+        from app.models import User, Portfolio, PortfolioEntry, Transaction, PortfolioType
+        user = User(email="p@example.com", hashed_password="x")
+        db_session.add(user)
+        await db_session.flush()
+        portfolio = Portfolio(user_id=user.id, name="P", type=PortfolioType.crypto)
+        db_session.add(portfolio)
+        await db_session.flush()
+        btc = PortfolioEntry(portfolio_id=portfolio.id, symbol="BTC", amount=1, purchase_price=1)
+        eth = PortfolioEntry(portfolio_id=portfolio.id, symbol="ETH", amount=1, purchase_price=1)
+        db_session.add_all([btc, eth])
+        await db_session.flush()
+        db_session.add_all([
+            Transaction(portfolio_entry_id=btc.id, symbol="BTC", quantity=1, price=10, type=BUY),
+            Transaction(portfolio_entry_id=eth.id, symbol="ETH", quantity=3, price=5, type=BUY),
+            Transaction(portfolio_entry_id=eth.id, symbol="ETH", quantity=1, price=6, type=SELL),
+        ])
+        await db_session.commit()
+
+        tx = await pnl_engine.load_transactions(db_session, [portfolio.id], [btc.id, eth.id])
+
+        assert tx.entry_ids.tolist() == [btc.id, eth.id]
+        assert sorted(tx.quantity.tolist()) == [1.0, 1.0, 3.0]
+        pnl = pnl_engine.entry_pnl(tx, np.array([20.0, 8.0]))
+        assert pnl.amount.tolist() == [1.0, 2.0]
@@ -0,0 +1,178 @@
+"""Tests for daily portfolio snapshots and /portfolios/{id}/history"""
+import pytest
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch, AsyncMock
+
+from sqlalchemy import select, func, update
+
+from app.models import (
+    User, Portfolio, PortfolioEntry, PortfolioSnapshot, Transaction,
+    TransactionType, PortfolioType
+)
+from app import portfolio_snapshots
+
+YESTERDAY = datetime.now(timezone.utc).date() - timedelta(days=1)
+
+
+def _at(days_ago: int) -> datetime:
+    """Naive UTC datetime at noon `days_ago` days before yesterday"""
+    return datetime.combine(YESTERDAY - timedelta(days=days_ago), datetime.min.time()) + timedelta(hours=12)
+
+
+def _flat_closes(price: float):
+    async def fetch(symbol, ptype, start, end):
+        return {start + timedelta(days=i): price for i in range((end - start).days + 1)}
+    return AsyncMock(side_effect=fetch)
+
+
+async def _seed(db_session, fills):
+    """Crypto portfolio with one BTC entry and (days_ago, type, qty, price) fills"""
+    user = User(email="s@example.com", hashed_password="x")
+    db_session.add(user)
+    await db_session.flush()
+    portfolio = Portfolio(user_id=user.id, name="C", type=PortfolioType.crypto)
+    db_session.add(portfolio)
+    await db_session.flush()
+    entry = PortfolioEntry(portfolio_id=portfolio.id, symbol="BTC", amount=0, purchase_price=0)
+    db_session.add(entry)
+    await db_session.flush()
+    for days_ago, tx_type, quantity, price in fills:
+        db_session.add(Transaction(
+            portfolio_entry_id=entry.id, symbol="BTC", quantity=quantity, price=price,
+            type=tx_type, date=_at(days_ago),
+        ))
+    await db_session.commit()
+    return portfolio
+
+
+class TestFillSnapshots:
+    async def test_fills_from_first_transaction_to_yesterday(self, db_session):
+        portfolio = await _seed(db_session, [(4, TransactionType.buy, 2, 100)])
+
+        with patch("app.price_service.fetch_history", _flat_closes(150.0)):
+            written = await portfolio_snapshots.fill_snapshots(db_session, portfolio)
+
+        assert written == 5
+        last = (await db_session.execute(
+            select(PortfolioSnapshot).order_by(PortfolioSnapshot.date.desc())
+        )).scalars().first()
+        assert last.date == YESTERDAY
+        assert float(last.invested) == 200.0
+        assert float(last.market_value) == 300.0
+        assert last.holdings["BTC"]["value"] == 300.0
+
+    async def test_sell_reduces_cost_at_average_price(self, db_session):
+        portfolio = await _seed(db_session, [
+            (3, TransactionType.buy, 1, 100),
+            (2, TransactionType.buy, 1, 200),
+            (1, TransactionType.sell, 1, 500),
+        ])
+
+        with patch("app.price_service.fetch_history", _flat_closes(300.0)):
+            await portfolio_snapshots.fill_snapshots(db_session, portfolio)
+
+        snapshots = (await db_session.execute(
+            select(PortfolioSnapshot).order_by(PortfolioSnapshot.date)
+        )).scalars().all()
+        assert [float(s.invested) for s in snapshots] == [100.0, 300.0, 150.0, 150.0]
+        assert float(snapshots[-1].market_value) == 300.0
+
+    async def test_incremental_fill_only_reads_new_days(self, db_session):
+        portfolio = await _seed(db_session, [(10, TransactionType.buy, 1, 100)])
+
+        fetch = _flat_closes(120.0)
+        with patch("app.price_service.fetch_history", fetch):
+            first = await portfolio_snapshots.fill_snapshots(db_session, portfolio, until=YESTERDAY - timedelta(days=3))
+            second = await portfolio_snapshots.fill_snapshots(db_session, portfolio)
+            third = await portfolio_snapshots.fill_snapshots(db_session, portfolio)
+
+        assert (first, second, third) == (8, 3, 0)
+        _, _, _, fetch_end = fetch.call_args_list[-1].args
+        assert fetch_end == YESTERDAY
+        count = await db_session.scalar(select(func.count()).select_from(PortfolioSnapshot))
+        assert count == 11
+        # Holdings carried over from the stored snapshot
+        last = (await db_session.execute(
+            select(PortfolioSnapshot).order_by(PortfolioSnapshot.date.desc())
+        )).scalars().first()
+        assert float(last.market_value) == 120.0
+
+    async def test_no_transactions_no_snapshots(self, db_session):
+        portfolio = await _seed(db_session, [])
+        assert await portfolio_snapshots.fill_snapshots(db_session, portfolio) == 0
+
+
+class TestHistoryEndpoint:
+    async def _portfolio_with_history(self, client, auth_headers, db_session):
+        resp = await client.post("/portfolios", json={"name": "Crypto", "type": "crypto"}, headers=auth_headers)
+        portfolio_id = resp.json()["id"]
+        await client.post(f"/portfolios/{portfolio_id}/entries", json={
+            "symbol": "BTC", "amount": 1, "purchase_price": 100
+        }, headers=auth_headers)
+        # Back-date the initial buy by ~40 days
+        await db_session.execute(update(Transaction).values(date=_at(40)))
+        await db_session.commit()
+        return portfolio_id
+
+    async def test_daily_history(self, client, auth_headers, db_session):
+        portfolio_id = await self._portfolio_with_history(client, auth_headers, db_session)
+
+        with patch("app.price_service.fetch_history", _flat_closes(110.0)):
+            resp = await client.get(
+                f"/portfolios/{portfolio_id}/history",
+                params={"from": str(YESTERDAY - timedelta(days=2))},
+                headers=auth_headers,
+            )
+
+        assert resp.status_code == 200
+        points = resp.json()["points"]
+        assert len(points) == 3
+        assert points[-1] == {
+            "date": str(YESTERDAY), "invested": 100.0, "market_value": 110.0,
+            "profit_loss": 10.0, "holdings": {"BTC": 110.0},
+        }
+
+    async def test_deleted_entry_leaves_history(self, client, auth_headers, db_session):
+        portfolio_id = await self._portfolio_with_history(client, auth_headers, db_session)
+        eth = (await client.post(f"/portfolios/{portfolio_id}/entries", json={
+            "symbol": "ETH", "amount": 2, "purchase_price": 50
+        }, headers=auth_headers)).json()
+        await db_session.execute(update(Transaction).values(date=_at(40)))
+        await db_session.commit()
+        url = f"/portfolios/{portfolio_id}/history"
+
+        with patch("app.price_service.fetch_history", _flat_closes(110.0)):
+            before = (await client.get(url, headers=auth_headers)).json()["points"]
+            await client.delete(f"/portfolios/{portfolio_id}/entries/{eth['id']}", headers=auth_headers)
+            after = (await client.get(url, headers=auth_headers)).json()["points"]
+
+        assert set(before[-1]["holdings"]) == {"BTC", "ETH"}
+        assert len(after) == len(before)
+        assert all(set(point["holdings"]) == {"BTC"} for point in after)
+        assert after[-1]["invested"] == 100.0
+
+    async def test_monthly_granularity_keeps_period_ends(self, client, auth_headers, db_session):
+        portfolio_id = await self._portfolio_with_history(client, auth_headers, db_session)
+
+        with patch("app.price_service.fetch_history", _flat_closes(110.0)):
+            resp = await client.get(
+                f"/portfolios/{portfolio_id}/history",
+                params={"granularity": "month"},
+                headers=auth_headers,
+            )
+
+        dates = [p["date"] for p in resp.json()["points"]]
+        months = {d[:7] for d in dates}
+        assert len(dates) == len(months)
+        assert dates[-1] == str(YESTERDAY)
+
+    async def test_invalid_granularity(self, client, auth_headers, db_session):
+        portfolio_id = await self._portfolio_with_history(client, auth_headers, db_session)
+        resp = await client.get(
+            f"/portfolios/{portfolio_id}/history", params={"granularity": "hour"}, headers=auth_headers
+        )
+        assert resp.status_code == 422
+
+    async def test_other_users_portfolio_not_found(self, client, auth_headers):
+        resp = await client.get("/portfolios/999/history", headers=auth_headers)
+        assert resp.status_code == 404
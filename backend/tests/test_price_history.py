@@ -0,0 +1,109 @@
+"""Tests for the persistent daily close history"""
+import pytest
+from datetime import date, datetime, timedelta, timezone
+from unittest.mock import patch, AsyncMock, MagicMock
+
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from app.models import PriceHistory
+from app import price_history
+from app.price_service import fetch_crypto_history, get_historical_price
+
+START = date(2026, 3, 2)   # Monday
+
+
+def _closes(start: date, days: int, base: float = 100.0) -> dict:
+    return {start + timedelta(days=i): base + i for i in range(days)}
+
+
+class TestGetCloses:
+    async def test_first_lookup_fetches_one_range_and_stores_it(self, db_session):
+        fetch = AsyncMock(side_effect=lambda symbol, ptype, start, end: _closes(START, 10))
+        with patch("app.price_service.fetch_history", fetch):
+            closes = await price_history.get_closes(
+                db_session, ["BTC", "ETH"], "crypto", START, START + timedelta(days=9)
+            )
+
+        assert fetch.call_count == 2          # one range request per symbol
+        assert closes["BTC"][START] == 100.0
+        assert len(closes["ETH"]) == 10
+        stored = await db_session.scalar(select(func.count()).select_from(PriceHistory))
+        assert stored == 20
+
+    async def test_repeat_lookup_is_served_from_db(self, db_session):
+        fetch = AsyncMock(side_effect=lambda symbol, ptype, start, end: _closes(START, 10))
+        with patch("app.price_service.fetch_history", fetch):
+            await price_history.get_closes(db_session, ["BTC"], "crypto", START, START + timedelta(days=9))
+            closes = await price_history.get_closes(
+                db_session, ["btc"], "crypto", START + timedelta(days=2), START + timedelta(days=5)
+            )
+
+        assert fetch.call_count == 1
+        assert list(closes["btc"].values()) == [102.0, 103.0, 104.0, 105.0]
+
+    async def test_only_missing_days_are_fetched(self, db_session):
+        fetch = AsyncMock(side_effect=lambda symbol, ptype, start, end: _closes(START, 20))
+        with patch("app.price_service.fetch_history", fetch):
+            await price_history.get_closes(db_session, ["BTC"], "crypto", START, START + timedelta(days=9))
+            closes = await price_history.get_closes(db_session, ["BTC"], "crypto", START, START + timedelta(days=14))
+
+        _, _, fetch_start, fetch_end = fetch.call_args_list[1].args
+        assert fetch_end == START + timedelta(days=14)
+        assert fetch_start == START + timedelta(days=10) - timedelta(days=price_history.HISTORY_LOOKBACK_DAYS)
+        assert len(closes["BTC"]) == 15
+
+    async def test_weekends_carry_previous_close(self, db_session):
+        # Trading days only: Mon–Fri
+        trading = {START + timedelta(days=i): 190.0 + i for i in range(5)}
+        fetch = AsyncMock(return_value=trading)
+        with patch("app.price_service.fetch_history", fetch):
+            closes = await price_history.get_closes(db_session, ["AAPL"], "stocks", START, START + timedelta(days=6))
+            await price_history.get_closes(db_session, ["AAPL"], "stocks", START, START + timedelta(days=6))
+
+        assert closes["AAPL"][START + timedelta(days=5)] == 194.0   # Saturday = Friday's close
+        assert closes["AAPL"][START + timedelta(days=6)] == 194.0
+        assert fetch.call_count == 1
+
+    async def test_today_is_not_stored(self, db_session):
+        today = datetime.now(timezone.utc).date()
+        fetch = AsyncMock(return_value={today - timedelta(days=1): 1.0, today: 2.0})
+        with patch("app.price_service.fetch_history", fetch):
+            closes = await price_history.get_closes(db_session, ["BTC"], "crypto", today - timedelta(days=1), today)
+
+        assert closes["BTC"] == {today - timedelta(days=1): 1.0}
+
+    async def test_historical_price_reads_the_table(self, db_engine):
+        fetch = AsyncMock(side_effect=lambda symbol, ptype, start, end: _closes(START, 10))
+        sessions = sessionmaker(db_engine, class_=AsyncSession, expire_on_commit=False)
+        with patch("app.price_service.fetch_history", fetch), \
+                patch("app.price_service.AsyncSessionLocal", sessions):
+            first = await get_historical_price("BTC", datetime(2026, 3, 4, 15))
+            second = await get_historical_price("BTC", datetime(2026, 3, 4))
+
+        assert first == second == 102.0
+        assert fetch.call_count == 1
+
+
+class TestCoinGeckoRange:
+    async def test_market_chart_range_reduced_to_daily_closes(self):
+        day = datetime(2026, 3, 2, tzinfo=timezone.utc)
+        ms = lambda dt: dt.timestamp() * 1000
+        response = MagicMock(status_code=200, headers={})
+        response.json.return_value = {"prices": [
+            [ms(day + timedelta(hours=1)), 41000.0],
+            [ms(day + timedelta(hours=23)), 42000.0],
+            [ms(day + timedelta(days=1, hours=12)), 43000.0],
+        ]}
+
+        with patch("app.price_service.get_client") as get_client:
+            get_client.return_value.get = AsyncMock(return_value=response)
+            closes = await fetch_crypto_history("BTC", day.date(), day.date() + timedelta(days=1))
+
+            url = get_client.return_value.get.call_args.args[0]
+            params = get_client.return_value.get.call_args.kwargs["params"]
+
+        assert url.endswith("/coins/bitcoin/market_chart/range")
+        assert params["from"] == int(day.timestamp())
+        assert closes == {day.date(): 42000.0, day.date() + timedelta(days=1): 43000.0}
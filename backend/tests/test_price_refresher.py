@@ -0,0 +1,83 @@
+"""Tests for the background price refresher"""
+import pytest
+from unittest.mock import patch, AsyncMock
+
+from app.models import User, Portfolio, PortfolioEntry, PortfolioType
+from app.price_service import cache, PriceQuote, refresh_due_prices
+from app import price_refresher
+
+
+@pytest.fixture(autouse=True)
+async def clear_price_cache():
+    cache._memory_cache.clear()
+
+
+async def _seed(db_session):
+    user = User(email="r@example.com", hashed_password="x")
+    db_session.add(user)
+    await db_session.flush()
+    crypto = Portfolio(user_id=user.id, name="C", type=PortfolioType.crypto)
+    crypto2 = Portfolio(user_id=user.id, name="C2", type=PortfolioType.crypto)
+    stocks = Portfolio(user_id=user.id, name="S", type=PortfolioType.stocks)
+    db_session.add_all([crypto, crypto2, stocks])
+    await db_session.flush()
+    db_session.add_all([
+        PortfolioEntry(portfolio_id=crypto.id, symbol="BTC", amount=1, purchase_price=1),
+        PortfolioEntry(portfolio_id=crypto2.id, symbol="BTC", amount=2, purchase_price=1),
+        PortfolioEntry(portfolio_id=crypto.id, symbol="ETH", amount=0, purchase_price=1),
+        PortfolioEntry(portfolio_id=stocks.id, symbol="AAPL", amount=3, purchase_price=1),
+    ])
+    await db_session.commit()
+
+
+class TestHeldSymbols:
+
+    async def test_distinct_held_pairs(self, db_session):
+        await _seed(db_session)
+        held = await price_refresher.get_held_symbols(db_session)
+        # ETH has amount 0 — not held
+        assert held == {"crypto": {"BTC"}, "stocks": {"AAPL"}}
+
+    async def test_refresh_once_refreshes_every_type(self, db_session):
+        await _seed(db_session)
+        with patch("app.price_service.refresh_due_prices", AsyncMock(return_value=1)) as refresh:
+            assert await price_refresher.refresh_once(db_session) == 2
+
+        calls = {c.args[1]: c.args[0] for c in refresh.call_args_list}
+        assert calls == {"crypto": ["BTC"], "stocks": ["AAPL"]}
+
+
+class TestRefreshDuePrices:
+
+    async def test_only_expiring_entries_are_fetched(self, age_cached_price):
+        await cache.set("crypto_BTC_usd", 42000.0, ttl=60)  # fresh
+        await cache.set("crypto_ETH_usd", 2500.0, ttl=60)
+        age_cached_price("crypto_ETH_usd", 55)  # expires in 5s
+
+        with patch("app.price_service._fetch_crypto_chunk", AsyncMock(return_value={
+            "ethereum": 2600.0, "solana": 100.0,
+        })) as fetch:
+            refreshed = await refresh_due_prices(["BTC", "ETH", "SOL"], "crypto", lead_seconds=10)
+
+        assert refreshed == 2
+        assert fetch.call_count == 1
+        assert sorted(fetch.call_args.args[1]) == ["ethereum", "solana"]
+        assert await cache.get("crypto_ETH_usd", ttl_seconds=60) == 2600.0
+
+    async def test_yahoo_refresh_is_batched_by_executor_size(self):
+        from app.price_service import YFINANCE_WORKERS
+        symbols = [f"T{i}" for i in range(YFINANCE_WORKERS * 2 + 1)]
+
+        with patch("app.price_service._singleflight.do_many", AsyncMock(
+            side_effect=lambda keys, fetch, ttl: {k: PriceQuote(1.0, None) for k in keys}
+        )) as do_many:
+            assert await refresh_due_prices(symbols, "stocks") == len(symbols)
+
+        assert [len(c.args[0]) for c in do_many.call_args_list] == [YFINANCE_WORKERS, YFINANCE_WORKERS, 1]
+
+
+class TestLease:
+
+    async def test_lease_without_redis_is_always_granted(self):
+        assert await cache.acquire_lease("job", "worker-a", 1000) is True
+        assert await cache.acquire_lease("job", "worker-b", 1000) is True
@@ -1,7 +1,10 @@
 """Tests for price service — mocked external APIs"""
 import pytest
+import asyncio
+import time
+from datetime import datetime, timezone
 from unittest.mock import patch, AsyncMock, MagicMock
-from app.price_service import get_crypto_price, cache
+from app.price_service import get_crypto_price, get_crypto_prices, get_multiple_prices, cache
 
 
 class TestCryptoPrice:
@@ -13,53 +16,49 @@ class TestCryptoPrice:
         cache._memory_cache.clear()
 
     async def test_get_bitcoin_price(self):
-        mock_response = MagicMock()
+        mock_response = MagicMock(status_code=200, headers={})
         mock_response.json.return_value = {"bitcoin": {"usd": 42000.0}}
         mock_response.raise_for_status = MagicMock()
 
-        with patch("app.price_service.httpx.AsyncClient") as MockClient:
+        with patch("app.price_service.get_client") as get_client:
             instance = AsyncMock()
             instance.get.return_value = mock_response
-            MockClient.return_value.__aenter__ = AsyncMock(return_value=instance)
-            MockClient.return_value.__aexit__ = AsyncMock(return_value=False)
+            get_client.return_value = instance
 
             price = await get_crypto_price("BTC")
             assert price == 42000.0
 
     async def test_get_ethereum_price(self):
-        mock_response = MagicMock()
+        mock_response = MagicMock(status_code=200, headers={})
         mock_response.json.return_value = {"ethereum": {"usd": 2500.0}}
         mock_response.raise_for_status = MagicMock()
 
-        with patch("app.price_service.httpx.AsyncClient") as MockClient:
+        with patch("app.price_service.get_client") as get_client:
             instance = AsyncMock()
             instance.get.return_value = mock_response
-            MockClient.return_value.__aenter__ = AsyncMock(return_value=instance)
-            MockClient.return_value.__aexit__ = AsyncMock(return_value=False)
+            get_client.return_value = instance
 
             price = await get_crypto_price("ETH")
             assert price == 2500.0
 
     async def test_network_error_returns_none(self):
-        with patch("app.price_service.httpx.AsyncClient") as MockClient:
+        with patch("app.price_service.get_client") as get_client:
             instance = AsyncMock()
             instance.get.side_effect = Exception("Network error")
-            MockClient.return_value.__aenter__ = AsyncMock(return_value=instance)
-            MockClient.return_value.__aexit__ = AsyncMock(return_value=False)
+            get_client.return_value = instance
 
             price = await get_crypto_price("BTC")
             assert price is None
 
     async def test_unknown_coin_returns_none(self):
-        mock_response = MagicMock()
+        mock_response = MagicMock(status_code=200, headers={})
         mock_response.json.return_value = {}
         mock_response.raise_for_status = MagicMock()
 
-        with patch("app.price_service.httpx.AsyncClient") as MockClient:
+        with patch("app.price_service.get_client") as get_client:
             instance = AsyncMock()
             instance.get.return_value = mock_response
-            MockClient.return_value.__aenter__ = AsyncMock(return_value=instance)
-            MockClient.return_value.__aexit__ = AsyncMock(return_value=False)
+            get_client.return_value = instance
 
             price = await get_crypto_price("FAKECOIN999")
             assert price is None
@@ -74,6 +73,84 @@ class TestCryptoPrice:
         assert price == 42000.0
 
 
+class TestCryptoBatch:
+    """Test batched CoinGecko /simple/price lookups"""
+
+    @pytest.fixture(autouse=True)
+    async def clear_price_cache(self):
+        cache._memory_cache.clear()
+
+    @staticmethod
+    def _mock_client(get_client, payload):
+        mock_response = MagicMock(status_code=200, headers={})
+        mock_response.json.return_value = payload
+        mock_response.raise_for_status = MagicMock()
+        instance = AsyncMock()
+        instance.get.return_value = mock_response
+        get_client.return_value = instance
+        return instance
+
+    async def test_single_request_for_many_symbols(self):
+        with patch("app.price_service.get_client") as get_client:
+            instance = self._mock_client(get_client, {
+                "bitcoin": {"usd": 42000.0},
+                "ethereum": {"usd": 2500.0},
+                "solana": {"usd": 100.0},
+            })
+
+            prices = await get_crypto_prices(["BTC", "ETH", "SOL", "FAKECOIN999"])
+
+            assert prices == {"BTC": 42000.0, "ETH": 2500.0, "SOL": 100.0, "FAKECOIN999": None}
+            assert instance.get.call_count == 1
+            params = instance.get.call_args.kwargs["params"]
+            assert params["ids"].split(",") == ["bitcoin", "ethereum", "solana", "fakecoin999"]
+            assert params["vs_currencies"] == "usd"
+
+    async def test_only_cache_misses_are_fetched(self):
+        await cache.set("crypto_BTC_usd", 42000.0, ttl=60)
+
+        with patch("app.price_service.get_client") as get_client:
+            instance = self._mock_client(get_client, {"ethereum": {"usd": 2500.0}})
+
+            prices = await get_crypto_prices(["BTC", "ETH"])
+
+            assert prices == {"BTC": 42000.0, "ETH": 2500.0}
+            assert instance.get.call_args.kwargs["params"]["ids"] == "ethereum"
+
+        # Results were written back to cache
+        assert await cache.get("crypto_ETH_usd", ttl_seconds=60) == 2500.0
+
+    async def test_all_cached_makes_no_request(self):
+        await cache.set("crypto_BTC_usd", 42000.0, ttl=60)
+
+        with patch("app.price_service.get_client") as get_client:
+            prices = await get_crypto_prices(["BTC"])
+            assert prices == {"BTC": 42000.0}
+            get_client.return_value.get.assert_not_called()
+
+    async def test_long_id_lists_are_chunked(self):
+        from app.price_service import _chunk_coin_ids, COINGECKO_MAX_URL_LENGTH
+        coin_ids = [f"coin-{i:04d}-{'x' * 40}" for i in range(200)]
+        chunks = _chunk_coin_ids(coin_ids, "usd")
+
+        assert len(chunks) > 1
+        assert [cid for chunk in chunks for cid in chunk] == coin_ids
+        for chunk in chunks:
+            assert len(",".join(chunk)) + len(chunk) * 2 < COINGECKO_MAX_URL_LENGTH
+
+    async def test_legacy_get_multiple_prices_uses_batch(self):
+        with patch("app.price_service.get_client") as get_client:
+            instance = self._mock_client(get_client, {
+                "bitcoin": {"eur": 39000.0},
+                "ethereum": {"eur": 2300.0},
+            })
+
+            prices = await get_multiple_prices(["BTC", "ETH"], vs_currency="eur")
+
+            assert prices == {"BTC": 39000.0, "ETH": 2300.0}
+            assert instance.get.call_count == 1
+
+
 class TestPriceCache:
     """Test the PriceCache class directly"""
 
@@ -94,3 +171,394 @@ class TestPriceCache:
         await cache.clear()
         assert await cache.get("k1", ttl_seconds=60) is None
         assert await cache.get("k2", ttl_seconds=60) is None
+
+
+class TestHTTPClients:
+    """Test the shared provider client registry"""
+
+    async def test_client_is_reused(self):
+        from app import http_clients
+        c1 = http_clients.get_client("coingecko")
+        c2 = http_clients.get_client("coingecko")
+        assert c1 is c2
+        await http_clients.shutdown()
+        assert c1.is_closed
+
+    async def test_client_recreated_after_shutdown(self):
+        from app import http_clients
+        await http_clients.startup()
+        c1 = http_clients.get_client("coingecko")
+        await http_clients.shutdown()
+        c2 = http_clients.get_client("coingecko")
+        assert c2 is not c1
+        assert not c2.is_closed
+        await http_clients.shutdown()
+
+    def test_yahoo_session_is_pooled(self):
+        from app import http_clients
+        session = http_clients.get_session("yahoo")
+        assert session is http_clients.get_session("yahoo")
+        assert session.get_adapter("https://query1.finance.yahoo.com")._pool_maxsize == 5
+
+
+class TestSingleFlight:
+    """Concurrent misses on one key share a single upstream fetch"""
+
+    @pytest.fixture(autouse=True)
+    async def clear_price_cache(self):
+        cache._memory_cache.clear()
+
+    async def test_concurrent_misses_make_one_request(self):
+        from app.price_service import get_fetch_stats
+
+        async def slow_get(*args, **kwargs):
+            await asyncio.sleep(0.05)
+            response = MagicMock(status_code=200, headers={})
+            response.json.return_value = {"bitcoin": {"usd": 42000.0}}
+            return response
+
+        before = get_fetch_stats()
+        with patch("app.price_service.get_client") as get_client:
+            get_client.return_value.get = AsyncMock(side_effect=slow_get)
+
+            prices = await asyncio.gather(*(get_crypto_price("BTC") for _ in range(20)))
+
+            assert prices == [42000.0] * 20
+            assert get_client.return_value.get.call_count == 1
+
+        after = get_fetch_stats()
+        assert after["fetched"] - before["fetched"] == 1
+        assert after["coalesced"] - before["coalesced"] == 19
+        assert after["in_flight"] == 0
+
+    async def test_overlapping_batches_only_fetch_new_keys(self):
+        calls = []
+
+        async def slow_get(url, params):
+            calls.append(params["ids"])
+            await asyncio.sleep(0.05)
+            response = MagicMock(status_code=200, headers={})
+            response.json.return_value = {
+                "bitcoin": {"usd": 42000.0},
+                "ethereum": {"usd": 2500.0},
+            }
+            return response
+
+        with patch("app.price_service.get_client") as get_client:
+            get_client.return_value.get = AsyncMock(side_effect=slow_get)
+
+            first, second = await asyncio.gather(
+                get_crypto_prices(["BTC"]),
+                get_crypto_prices(["BTC", "ETH"]),
+            )
+
+        assert first == {"BTC": 42000.0}
+        assert second == {"BTC": 42000.0, "ETH": 2500.0}
+        assert calls == ["bitcoin", "ethereum"]
+
+    async def test_failed_fetch_is_not_kept_in_flight(self):
+        from app.price_service import _singleflight
+
+        async def failing(keys):
+            raise RuntimeError("upstream down")
+
+        with pytest.raises(RuntimeError):
+            await _singleflight.do("k", failing, 60)
+        assert "k" not in _singleflight._inflight
+
+    async def test_waits_for_fetch_in_other_worker(self):
+        """Keys locked by another worker are read from the shared cache"""
+        from app.price_service import SingleFlight, PriceQuote
+
+        class LockedElsewhere:
+            has_redis = True
+
+            def __init__(self):
+                self.values = {}
+
+            async def acquire_locks(self, keys, ttl_ms):
+                return set()
+
+            async def release_locks(self, keys):
+                pass
+
+            async def get_many(self, keys, ttl_seconds=60):
+                now = datetime.now(timezone.utc)
+                return {key: PriceQuote(self.values[key], now) for key in keys if key in self.values}
+
+        shared = LockedElsewhere()
+        flight = SingleFlight(shared)
+        fetch = AsyncMock(return_value={"crypto_BTC_usd": 1.0})
+
+        async def other_worker():
+            await asyncio.sleep(0.05)
+            shared.values["crypto_BTC_usd"] = 42000.0
+
+        price, _ = await asyncio.gather(
+            flight.do("crypto_BTC_usd", fetch, 60),
+            other_worker(),
+        )
+
+        assert price.price == 42000.0
+        fetch.assert_not_called()
+        assert flight.stats()["coalesced_remote"] == 1
+
+
+class TestStaleWhileRevalidate:
+    """Soft/hard TTL: stale prices are served at once and refreshed once"""
+
+    @pytest.fixture(autouse=True)
+    async def clear_price_cache(self):
+        cache._memory_cache.clear()
+
+    async def test_fresh_entry_has_as_of(self):
+        from app.price_service import get_crypto_quotes
+        await cache.set("crypto_BTC_usd", 42000.0, ttl=60)
+
+        quotes = await get_crypto_quotes(["BTC"])
+
+        assert quotes["BTC"].price == 42000.0
+        assert quotes["BTC"].stale is False
+        assert (datetime.now(timezone.utc) - quotes["BTC"].as_of).total_seconds() < 5
+
+    async def test_stale_entry_served_and_refreshed_once(self, age_cached_price):
+        from app.price_service import get_crypto_quotes, _singleflight
+        await cache.set("crypto_BTC_usd", 41000.0, ttl=60)
+        age_cached_price("crypto_BTC_usd", 120)  # past soft TTL (60s), within hard TTL
+
+        refreshed = asyncio.Event()
+
+        async def slow_get(*args, **kwargs):
+            await refreshed.wait()
+            response = MagicMock(status_code=200, headers={})
+            response.json.return_value = {"bitcoin": {"usd": 42000.0}}
+            return response
+
+        with patch("app.price_service.get_client") as get_client:
+            get_client.return_value.get = AsyncMock(side_effect=slow_get)
+
+            results = await asyncio.gather(*(get_crypto_quotes(["BTC"]) for _ in range(5)))
+
+            # Every caller got the stale price immediately
+            assert all(r["BTC"].price == 41000.0 and r["BTC"].stale for r in results)
+            assert _singleflight.in_flight("crypto_BTC_usd")
+
+            refreshed.set()
+            while _singleflight.in_flight("crypto_BTC_usd"):
+                await asyncio.sleep(0.01)
+
+            assert get_client.return_value.get.call_count == 1
+
+        assert await cache.get("crypto_BTC_usd", ttl_seconds=60) == 42000.0
+
+    async def test_entry_past_hard_ttl_is_a_miss(self, age_cached_price):
+        from app.price_service import CACHE_HARD_TTL_FACTOR
+        await cache.set("stock_AAPL", 190.0, ttl=300)
+        age_cached_price("stock_AAPL", 300 * CACHE_HARD_TTL_FACTOR + 1)
+
+        assert await cache.get_entry("stock_AAPL", ttl_seconds=300) is None
+        assert "stock_AAPL" not in cache._memory_cache
+
+    def test_redis_entry_roundtrip(self):
+        from app.price_service import _encode_entry, _decode_entry
+        assert _decode_entry(_encode_entry(42000.0, 1700000000.0)) == (42000.0, 1700000000.0)
+        # Values written before as_of was stored are read as just fetched
+        price, fetched_at = _decode_entry("42000.0")
+        assert price == 42000.0
+
+
+class TestBoundedTTLCache:
+    """In-memory LRU/TTL tier used when Redis is missing or down"""
+
+    @staticmethod
+    def _cache(**kwargs):
+        from app.memory_cache import BoundedTTLCache
+        clock = [1000.0]
+        return BoundedTTLCache(clock=lambda: clock[0], **kwargs), clock
+
+    def test_hit_and_miss_counters(self):
+        c, _ = self._cache()
+        c.set("a", 1.0, ttl_seconds=10)
+        assert c.get("a") == 1.0
+        assert c.get("b") is None
+        stats = c.stats()
+        assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 1)
+
+    def test_expires_on_monotonic_clock(self):
+        c, clock = self._cache()
+        c.set("a", 1.0, ttl_seconds=10)
+        clock[0] += 10
+        assert c.get("a") is None
+        assert c.stats()["expirations"] == 1
+        assert len(c) == 0
+
+    def test_lru_eviction_by_entry_budget(self):
+        c, _ = self._cache(max_entries=2)
+        c.set("a", 1.0, ttl_seconds=10)
+        c.set("b", 2.0, ttl_seconds=10)
+        c.get("a")  # b is now least recently used
+        c.set("c", 3.0, ttl_seconds=10)
+        assert "b" not in c
+        assert "a" in c and "c" in c
+        assert c.stats()["evictions"] == 1
+
+    def test_byte_budget(self):
+        c, _ = self._cache(max_bytes=1000)
+        for i in range(100):
+            c.set(f"key-{i}", (float(i), 0.0, 0.0), ttl_seconds=10)
+        stats = c.stats()
+        assert stats["bytes"] <= 1000
+        assert stats["evictions"] > 0
+        assert f"key-99" in c
+
+    def test_expired_entries_swept_on_write(self):
+        c, clock = self._cache()
+        for i in range(5):
+            c.set(f"old-{i}", 1.0, ttl_seconds=1)
+        clock[0] += 5
+        c.set("new", 1.0, ttl_seconds=10)
+        assert len(c) == 1
+
+    def test_items_skip_expired_entries(self):
+        c, clock = self._cache()
+        c.set("short", 1.0, ttl_seconds=1)
+        c.set("long", 2.0, ttl_seconds=10)
+        clock[0] += 5
+        assert c.items() == [("long", 2.0)]
+        assert c.stats()["hits"] == 0
+
+    def test_shared_between_threads(self):
+        from concurrent.futures import ThreadPoolExecutor
+        c, _ = self._cache(max_entries=50)
+
+        def worker(n):
+            for i in range(500):
+                c.set(f"{n}-{i}", float(i), ttl_seconds=10)
+                c.get(f"{n}-{i - 1}")
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(worker, range(8)))
+
+        stats = c.stats()
+        assert stats["entries"] == 50
+        assert stats["bytes"] == sum(e.size for e in c._data.values())
+
+
+class TestTwoTierCache:
+    """L1 (per-process) in front of Redis L2"""
+
+    @pytest.fixture(autouse=True)
+    async def clear_price_cache(self):
+        cache._memory_cache.clear()
+
+    async def test_get_many_is_one_round_trip(self, fake_redis):
+        fake_redis.store["price:crypto_BTC_usd"] = '{"price": 42000.0, "as_of": %f}' % time.time()
+
+        found = await cache.get_many(["crypto_BTC_usd", "crypto_ETH_usd", "crypto_SOL_usd"], 60)
+
+        assert list(found) == ["crypto_BTC_usd"]
+        assert found["crypto_BTC_usd"].price == 42000.0
+        assert fake_redis.round_trips == 1
+
+    async def test_l1_hit_skips_redis(self, fake_redis):
+        from app.price_service import CACHE_HARD_TTL_FACTOR
+        await cache.set_many({"crypto_BTC_usd": 42000.0, "crypto_ETH_usd": 2500.0}, 60)
+        assert fake_redis.round_trips == 1  # one pipelined SETEX
+        assert fake_redis.ttls["price:crypto_BTC_usd"] == 60 * CACHE_HARD_TTL_FACTOR
+
+        found = await cache.get_many(["crypto_BTC_usd", "crypto_ETH_usd"], 60)
+
+        assert {k: q.price for k, q in found.items()} == {"crypto_BTC_usd": 42000.0, "crypto_ETH_usd": 2500.0}
+        assert fake_redis.round_trips == 1
+
+    async def test_l2_value_is_copied_to_l1(self, fake_redis):
+        fake_redis.store["price:stock_AAPL"] = '{"price": 190.0, "as_of": %f}' % time.time()
+
+        await cache.get_many(["stock_AAPL"], 300)
+        await cache.get_many(["stock_AAPL"], 300)
+
+        assert fake_redis.round_trips == 1
+
+    async def test_summary_lookup_needs_at_most_one_round_trip(self, fake_redis):
+        from app.price_service import get_crypto_quotes
+        await cache.set_many({f"crypto_C{i}_usd": float(i) for i in range(30)}, 60)
+        cache._memory_cache.clear()  # cold L1, warm L2
+        fake_redis.round_trips = 0
+
+        quotes = await get_crypto_quotes([f"C{i}" for i in range(30)])
+
+        assert all(quotes[f"C{i}"].price == float(i) for i in range(30))
+        assert fake_redis.round_trips == 1
+
+    async def test_redis_failure_falls_back_to_l1(self, fake_redis):
+        fake_redis.fail = True
+        await cache.set("crypto_BTC_usd", 42000.0, ttl=60)
+        assert await cache.get("crypto_BTC_usd", ttl_seconds=60) == 42000.0
+        assert cache.stats()["l2"]["errors"] >= 1
+
+
+class TestNegativeCache:
+    """Failed lookups are suppressed with exponential backoff"""
+
+    @pytest.fixture(autouse=True)
+    async def clear_price_cache(self):
+        cache._memory_cache.clear()
+
+    def test_backoff_doubles_and_caps(self):
+        from app.price_service import negative_backoff, NEGATIVE_TTL_BASE, NEGATIVE_TTL_MAX
+        assert negative_backoff(1) == NEGATIVE_TTL_BASE
+        assert negative_backoff(2) == NEGATIVE_TTL_BASE * 2
+        assert negative_backoff(3) == NEGATIVE_TTL_BASE * 4
+        assert negative_backoff(50) == NEGATIVE_TTL_MAX
+
+    async def test_unknown_symbol_is_not_refetched(self):
+        from app.price_service import negative_cache
+        mock_response = MagicMock(status_code=200, headers={})
+        mock_response.json.return_value = {}
+
+        with patch("app.price_service.get_client") as get_client:
+            get_client.return_value.get = AsyncMock(return_value=mock_response)
+
+            assert await get_crypto_price("FAKECOIN999") is None
+            assert await get_crypto_price("FAKECOIN999") is None
+
+            assert get_client.return_value.get.call_count == 1
+
+        records = await negative_cache.list()
+        assert [(r.provider, r.symbol, r.failures) for r in records] == [("coingecko", "FAKECOIN999", 1)]
+        assert negative_cache.suppressed_hits >= 1
+
+    async def test_failures_escalate_after_backoff(self):
+        from app.price_service import negative_cache, NEGATIVE_TTL_BASE
+
+        with patch("app.price_service.get_client") as get_client:
+            get_client.return_value.get = AsyncMock(side_effect=Exception("timeout"))
+            await get_crypto_price("BTC")
+
+            # Backoff elapsed — next lookup retries and escalates
+            record = negative_cache._memory.get("crypto_BTC_usd")
+            negative_cache._memory.set("crypto_BTC_usd", record._replace(retry_at=0), 60)
+            await get_crypto_price("BTC")
+
+            assert get_client.return_value.get.call_count == 2
+
+        record = negative_cache._memory.get("crypto_BTC_usd")
+        assert record.failures == 2
+        assert record.retry_at - time.time() == pytest.approx(NEGATIVE_TTL_BASE * 2, abs=2)
+
+    async def test_success_clears_record(self):
+        from app.price_service import negative_cache
+        with patch("app.price_service.get_client") as get_client:
+            get_client.return_value.get = AsyncMock(side_effect=Exception("timeout"))
+            await get_crypto_price("BTC")
+
+        record = negative_cache._memory.get("crypto_BTC_usd")
+        negative_cache._memory.set("crypto_BTC_usd", record._replace(retry_at=0), 60)
+
+        mock_response = MagicMock(status_code=200, headers={})
+        mock_response.json.return_value = {"bitcoin": {"usd": 42000.0}}
+        with patch("app.price_service.get_client") as get_client:
+            get_client.return_value.get = AsyncMock(return_value=mock_response)
+            assert await get_crypto_price("BTC") == 42000.0
+
+        assert await negative_cache.list() == []
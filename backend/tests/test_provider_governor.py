@@ -0,0 +1,235 @@
+"""Tests for the upstream rate-limit governor and circuit breaker"""
+import pytest
+import asyncio
+import time
+from email.utils import formatdate
+from unittest.mock import patch
+
+import httpx
+
+from app import price_service
+from app.price_service import cache, negative_cache, get_crypto_quotes
+from app.provider_governor import ProviderGovernor, ProviderUnavailable, parse_retry_after
+
+
+class FakeCoinGecko:
+    """Local HTTP/1.1 stub for /simple/price that can answer 429 or hang"""
+
+    def __init__(self):
+        self.mode = "ok"          # ok | 429 | hang
+        self.retry_after = "30"
+        self.requests = 0
+        self.server = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                await reader.readuntil(b"\r\n\r\n")
+                self.requests += 1
+                if self.mode == "hang":
+                    await asyncio.sleep(5)
+                    break
+                if self.mode == "429":
+                    body = b'{"status": {"error_code": 429}}'
+                    head = b"HTTP/1.1 429 Too Many Requests\r\nRetry-After: " + self.retry_after.encode() + b"\r\n"
+                else:
+                    body = b'{"bitcoin": {"usd": 42000.0}}'
+                    head = b"HTTP/1.1 200 OK\r\n"
+                writer.write(
+                    head + b"Content-Type: application/json\r\n"
+                    b"Content-Length: " + str(len(body)).encode() + b"\r\n\r\n" + body
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionResetError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self) -> str:
+        self.server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        return f"http://127.0.0.1:{self.server.sockets[0].getsockname()[1]}/api/v3"
+
+    async def stop(self):
+        self.server.close()
+
+
+@pytest.fixture
+async def coingecko_stub():
+    """Point the price service at a local CoinGecko stub with a short client timeout"""
+    stub = FakeCoinGecko()
+    url = await stub.start()
+    client = httpx.AsyncClient(timeout=0.2)
+    cache._memory_cache.clear()
+    with patch.object(price_service, "COINGECKO_API_URL", url), \
+            patch("app.price_service.get_client", return_value=client):
+        yield stub
+    await client.aclose()
+    await stub.stop()
+
+
+class TestRetryAfter:
+    def test_delta_seconds(self):
+        assert parse_retry_after("120") == 120.0
+
+    def test_http_date(self):
+        seconds = parse_retry_after(formatdate(time.time() + 60, usegmt=True))
+        assert 55 <= seconds <= 61
+
+    def test_missing_or_garbage(self):
+        assert parse_retry_after(None) is None
+        assert parse_retry_after("soon") is None
+
+
+class TestTokenBucket:
+    async def test_burst_then_budget_exhausted(self):
+        governor = ProviderGovernor("test", rate_per_minute=60, burst=2, max_wait=0)
+
+        await governor.acquire()
+        await governor.acquire()
+        with pytest.raises(ProviderUnavailable, match="budget"):
+            await governor.acquire()
+        assert governor.stats()["allowed"] == 2
+        assert governor.stats()["rejected"] == 1
+
+    async def test_short_waits_are_slept_off(self):
+        governor = ProviderGovernor("test", rate_per_minute=600, burst=1, max_wait=1)
+
+        start = time.monotonic()
+        await governor.acquire()
+        await governor.acquire()   # next token in 0.1s
+
+        assert time.monotonic() - start >= 0.09
+        assert governor.stats()["allowed"] == 2
+
+    async def test_redis_errors_fall_back_to_local_bucket(self, fake_redis):
+        # FakeRedis has no EVAL
+        governor = ProviderGovernor("test", rate_per_minute=60, burst=1, max_wait=0,
+                                    redis_getter=lambda: fake_redis)
+        await governor.acquire()
+        with pytest.raises(ProviderUnavailable):
+            await governor.acquire()
+
+
+class TestCircuitBreaker:
+    async def test_opens_after_threshold_and_half_opens(self):
+        governor = ProviderGovernor("test", rate_per_minute=6000, burst=10,
+                                    failure_threshold=2, reset_timeout=0.05)
+        governor.record_failure()
+        governor.record_failure()
+        assert governor.state == "open"
+
+        with pytest.raises(ProviderUnavailable, match="circuit open"):
+            await governor.acquire()
+
+        await asyncio.sleep(0.06)
+        await governor.acquire()          # the probe
+        with pytest.raises(ProviderUnavailable, match="half-open"):
+            await governor.acquire()      # everyone else still fails fast
+
+        governor.record_success()
+        assert governor.state == "closed"
+        await governor.acquire()
+
+    async def test_failed_probe_reopens(self):
+        governor = ProviderGovernor("test", rate_per_minute=6000, burst=10,
+                                    failure_threshold=1, reset_timeout=0.05)
+        governor.record_failure()
+        await asyncio.sleep(0.06)
+        await governor.acquire()
+        governor.record_failure()
+
+        assert governor.state == "open"
+        with pytest.raises(ProviderUnavailable):
+            await governor.acquire()
+
+    async def test_probe_rejected_by_budget_then_recovers(self):
+        governor = ProviderGovernor("test", rate_per_minute=600, burst=1,
+                                    failure_threshold=1, reset_timeout=0.05, max_wait=0)
+        await governor.acquire()          # spends the only token
+        governor.record_failure()
+        await asyncio.sleep(0.06)
+
+        with pytest.raises(ProviderUnavailable, match="rate budget"):
+            await governor.acquire()      # probe turned away by the budget
+
+        await asyncio.sleep(0.11)         # a token refills
+        await governor.acquire()          # the next call gets to probe
+        governor.record_success()
+        assert governor.state == "closed"
+
+
+class TestCoinGeckoGovernor:
+    """End to end against a local stub answering 429s and timing out"""
+
+    async def test_429_blocks_provider_for_retry_after(self, coingecko_stub):
+        coingecko_stub.mode = "429"
+
+        first = await get_crypto_quotes(["BTC"])
+        second = await get_crypto_quotes(["BTC"])
+
+        assert first["BTC"] is None and second["BTC"] is None
+        assert coingecko_stub.requests == 1          # second lookup failed fast
+        stats = price_service.get_provider_stats()["coingecko"]
+        assert stats["rate_limited"] == 1
+        assert 25 < stats["blocked_for"] <= 30
+        # A throttled provider is not the symbol's fault
+        assert await negative_cache.list() == []
+
+    async def test_timeouts_open_circuit(self, coingecko_stub):
+        coingecko_stub.mode = "hang"
+        price_service.governors["coingecko"].failure_threshold = 2
+
+        await get_crypto_quotes(["BTC"])
+        await negative_cache.clear()
+        await get_crypto_quotes(["BTC"])
+        await negative_cache.clear()
+        assert price_service.governors["coingecko"].state == "open"
+
+        start = time.monotonic()
+        quotes = await get_crypto_quotes(["BTC"])
+
+        assert quotes["BTC"] is None
+        assert time.monotonic() - start < 0.1
+        assert coingecko_stub.requests == 2
+
+    async def test_open_circuit_serves_stale_price(self, coingecko_stub, age_cached_price):
+        await cache.set("crypto_BTC_usd", 41000.0, ttl=60)
+        age_cached_price("crypto_BTC_usd", 120)
+        price_service.governors["coingecko"].failure_threshold = 1
+        price_service.governors["coingecko"].record_failure()
+
+        quotes = await get_crypto_quotes(["BTC"])
+        await asyncio.sleep(0.05)   # let the background refresh fail fast
+
+        assert quotes["BTC"].price == 41000.0 and quotes["BTC"].stale
+        assert coingecko_stub.requests == 0
+
+    async def test_recovers_after_block(self, coingecko_stub):
+        price_service.governors["coingecko"].record_rate_limited(0.05)
+        assert (await get_crypto_quotes(["BTC"]))["BTC"] is None
+
+        await asyncio.sleep(0.06)
+        quotes = await get_crypto_quotes(["BTC"])
+
+        assert quotes["BTC"].price == 42000.0
+        assert coingecko_stub.requests == 1
+
+    async def test_cancelled_probe_lets_next_call_probe(self, coingecko_stub):
+        governor = price_service.governors["coingecko"]
+        governor.reset_timeout = 0.05
+        governor.failure_threshold = 1
+        governor.record_failure()
+        await asyncio.sleep(0.06)
+        client = price_service.get_client()
+        params = {"ids": "bitcoin", "vs_currencies": "usd"}
+
+        coingecko_stub.mode = "hang"
+        probe = asyncio.create_task(price_service._coingecko_get(client, "/simple/price", params))
+        await asyncio.sleep(0.05)
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+
+        coingecko_stub.mode = "ok"
+        assert await price_service._coingecko_get(client, "/simple/price", params) == {"bitcoin": {"usd": 42000.0}}
+        assert governor.state == "closed"
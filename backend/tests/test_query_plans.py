@@ -0,0 +1,255 @@
+"""
+Query-plan regression tests for the hot routes.
+
+Each route runs against a seeded dataset while the SELECT / UPDATE / DELETE
+statements it sends are captured; every statement is then EXPLAINed on the
+same database. A full table scan, or a sort the indexes should have made
+unnecessary, fails the test:
+
+- SQLite (always): "SCAN <table>" or "USE TEMP B-TREE"
+- Postgres, when TEST_POSTGRES_URL points at a scratch database (e.g.
+  postgresql+asyncpg://localhost/dilfwallet_test): "Seq Scan" or "Sort"
+  nodes. Planned with enable_seqscan / enable_sort off, so a scan or sort
+  only shows up when no index can replace it — on a small seeded table a
+  scan would otherwise simply be the cheaper plan.
+
+Sorts no index can avoid are listed in UNAVOIDABLE_SORTS with the reason.
+"""
+import json
+import os
+import re
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from httpx import AsyncClient, ASGITransport
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from app.auth import create_access_token
+from app.db import get_db
+from app.main import app
+from app.models import (
+    Base, User, Portfolio, PortfolioEntry, Transaction, TaxLot, BudgetCategory,
+    BudgetTransaction, PortfolioType, TransactionType, BudgetType
+)
+
+TEST_POSTGRES_URL = os.getenv("TEST_POSTGRES_URL")
+
+SYMBOLS = {"BTC": 50000.0, "ETH": 3000.0, "SOL": 150.0, "ADA": 0.5}
+
+# Statement fragment -> why its sort stays
+UNAVOIDABLE_SORTS = {
+    "ORDER BY transactions.date":
+        "a portfolio's transactions by date: each entry's come off ix_transactions_entry_date "
+        "in date order, but they are merged across the portfolio's entries",
+    "ORDER BY portfolio_entries.symbol":
+        "realized report by symbol: one row per entry of the portfolio",
+}
+
+ROUTES = [
+    ("GET", "/portfolios", None),
+    ("GET", "/dashboard", None),
+    ("GET", "/portfolios/{portfolio}/entries", None),
+    ("GET", "/portfolios/{portfolio}/summary?include_transactions=true", None),
+    ("GET", "/portfolios/{portfolio}/transactions", None),
+    ("GET", "/portfolios/{portfolio}/realized", None),
+    ("GET", "/portfolios/{portfolio}/history", None),
+    ("GET", "/portfolios/{portfolio}/export/csv", None),
+    ("POST", "/portfolios/{portfolio}/entries", {"symbol": "BTC", "amount": 1, "purchase_price": 40000}),
+    ("POST", "/portfolios/{portfolio}/transactions", {
+        "symbol": "BTC", "quantity": "0.5", "price": "45000", "type": "sell", "portfolio_entry_id": "{entry}"
+    }),
+    ("DELETE", "/portfolios/{portfolio}/entries/{entry}", None),
+    ("GET", "/budget/categories", None),
+    ("GET", "/budget/transactions", None),
+    ("GET", "/budget/transactions?type=expense", None),
+    ("GET", "/budget/summary?period=month", None),
+    ("GET", "/budget/chart-data?period=month", None),
+    ("GET", "/budget/export/csv?period=month", None),
+    ("DELETE", "/budget/transactions/{budget_tx}", None),
+]
+
+
+@pytest.fixture(params=["sqlite", "postgres"])
+async def plan_engine(request, db_engine):
+    """The usual in-memory SQLite engine, or a scratch Postgres database"""
+    if request.param == "sqlite":
+        yield db_engine
+        return
+    if not TEST_POSTGRES_URL:
+        pytest.skip("TEST_POSTGRES_URL not set")
+    engine = create_async_engine(TEST_POSTGRES_URL)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    yield engine
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+    await engine.dispose()
+
+
+async def _seed(session) -> dict:
+    """Two users, each with 3 portfolios x 4 entries x 10 buys and a year of budget rows"""
+    ids = {}
+    now = datetime.utcnow()
+    for n in range(2):
+        user = User(email=f"plans{n}@example.com", hashed_password="x")
+        session.add(user)
+        await session.flush()
+        for p in range(3):
+            portfolio = Portfolio(user_id=user.id, name=f"P{p}", type=PortfolioType.crypto,
+                                  created_at=now - timedelta(days=30 - p))
+            session.add(portfolio)
+            await session.flush()
+            for symbol in SYMBOLS:
+                entry = PortfolioEntry(portfolio_id=portfolio.id, symbol=symbol, amount=10, purchase_price=100)
+                session.add(entry)
+                await session.flush()
+                for day in range(10):
+                    tx = Transaction(
+                        portfolio_entry_id=entry.id, symbol=symbol, quantity=1, price=100,
+                        type=TransactionType.buy, date=now - timedelta(days=20 - day),
+                    )
+                    session.add(tx)
+                    await session.flush()
+                    session.add(TaxLot(
+                        portfolio_entry_id=entry.id, transaction_id=tx.id, acquired_at=tx.date,
+                        quantity=1, remaining=1, cost_per_unit=100,
+                    ))
+                ids.setdefault("entry", entry.id)
+            ids.setdefault("portfolio", portfolio.id)
+
+        categories = [
+            BudgetCategory(user_id=user.id, name=name, type=budget_type)
+            for name, budget_type in [("Salary", BudgetType.income), ("Food", BudgetType.expense), ("Rent", BudgetType.expense)]
+        ]
+        session.add_all(categories)
+        await session.flush()
+        # Older than the routes' period windows
+        budget_transactions = [
+            BudgetTransaction(
+                user_id=user.id, category_id=categories[day % 3].id, amount=25,
+                date=now - timedelta(days=60 + day * 5),
+            )
+            for day in range(60)
+        ]
+        session.add_all(budget_transactions)
+        await session.flush()
+        ids.setdefault("budget_tx", budget_transactions[0].id)
+        ids.setdefault("user", user.id)
+    await session.commit()
+    return ids
+
+
+async def _capture(engine, method: str, path: str, body) -> list[tuple]:
+    """Run one request against the seeded database; the statements it sent"""
+    factory = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    async with factory() as session:
+        ids = await _seed(session)
+
+    async def override_get_db():
+        async with factory() as session:
+            yield session
+
+    statements = []
+
+    def on_execute(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().split(None, 1)[0].upper() in ("SELECT", "UPDATE", "DELETE"):
+            statements.append((statement, parameters))
+
+    headers = {"Authorization": f"Bearer {create_access_token(ids['user'])}"}
+    path = path.format(**ids)
+    if body is not None:
+        body = {k: (v.format(**ids) if isinstance(v, str) else v) for k, v in body.items()}
+
+    from app.price_service import cache
+    for symbol, price in SYMBOLS.items():
+        await cache.set(f"crypto_{symbol}_usd", price, ttl=60)
+
+    async def flat_closes(symbol, ptype, start, end):
+        return {start + timedelta(days=i): SYMBOLS[symbol] for i in range((end - start).days + 1)}
+
+    app.dependency_overrides[get_db] = override_get_db
+    event.listen(engine.sync_engine, "before_cursor_execute", on_execute)
+    try:
+        with patch("app.price_service.fetch_history", AsyncMock(side_effect=flat_closes)):
+            async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+                resp = await client.request(method, path, json=body, headers=headers)
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", on_execute)
+        app.dependency_overrides.clear()
+
+    assert resp.status_code < 400, resp.text
+    return statements
+
+
+def _unavoidable_sort(statement: str) -> bool:
+    normalized = " ".join(statement.split())
+    return any(re.search(re.escape(fragment) + r"(?![\w.,])", normalized) for fragment in UNAVOIDABLE_SORTS)
+
+
+async def _sqlite_problems(conn, statement: str, parameters) -> list[str]:
+    rows = (await conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)).all()
+    problems = []
+    for row in rows:
+        detail = row[-1]
+        scan = re.match(r"SCAN (\w+)", detail)
+        # anon_N: a materialized subquery, built by the steps above it
+        if scan and scan.group(1) != "CONSTANT" and not scan.group(1).startswith("anon_"):
+            problems.append(detail)
+        elif "USE TEMP B-TREE" in detail and not _unavoidable_sort(statement):
+            problems.append(detail)
+    return problems
+
+
+async def _postgres_problems(conn, statement: str, parameters) -> list[str]:
+    await conn.exec_driver_sql("SET enable_seqscan = off")
+    await conn.exec_driver_sql("SET enable_sort = off")
+    plan = (await conn.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {statement}", parameters)).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+
+    problems = []
+    nodes = [plan[0]["Plan"]]
+    while nodes:
+        node = nodes.pop()
+        nodes.extend(node.get("Plans", []))
+        if node["Node Type"] == "Seq Scan":
+            problems.append(f"Seq Scan on {node['Relation Name']}")
+        elif node["Node Type"] == "Sort" and not _unavoidable_sort(statement):
+            problems.append(f"Sort by {', '.join(node['Sort Key'])}")
+    return problems
+
+
+class TestQueryPlans:
+    """Hot route statements use indexes: no table scans, no avoidable sorts"""
+
+    @pytest.mark.parametrize("method,path,body", ROUTES, ids=[f"{m} {p}" for m, p, _ in ROUTES])
+    async def test_route_queries_use_indexes(self, plan_engine, method, path, body):
+        statements = await _capture(plan_engine, method, path, body)
+        assert statements
+
+        explain = _sqlite_problems if plan_engine.dialect.name == "sqlite" else _postgres_problems
+        failures = []
+        async with plan_engine.connect() as conn:
+            for statement, parameters in statements:
+                problems = await explain(conn, statement, parameters)
+                if problems:
+                    failures.append(f"{' '.join(statement.split())}\n    -> {'; '.join(problems)}")
+        assert not failures, "\n".join(failures)
+
+    async def test_detects_table_scan(self, db_engine):
+        async with db_engine.connect() as conn:
+            problems = await _sqlite_problems(
+                conn, "SELECT * FROM transactions WHERE transactions.symbol = ?", ("BTC",)
+            )
+        assert problems and problems[0].startswith("SCAN transactions")
+
+    async def test_detects_avoidable_sort(self, db_engine):
+        async with db_engine.connect() as conn:
+            problems = await _sqlite_problems(
+                conn, "SELECT * FROM portfolios WHERE portfolios.user_id = ? ORDER BY portfolios.name", ("x",)
+            )
+        assert problems == ["USE TEMP B-TREE FOR ORDER BY"]
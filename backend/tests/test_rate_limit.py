@@ -0,0 +1,100 @@
+"""Tests for the per-user, cost-weighted sliding window limiter"""
+import pytest
+from unittest.mock import AsyncMock, patch
+
+from app.limiter import COST_PRICED, SlidingWindowLimiter, limiter, retry_after
+
+
+@pytest.fixture
+def limited():
+    """Turn the shared limiter on with a 20-point budget"""
+    limiter.reset()
+    limiter.enabled = True
+    with patch.object(limiter, "points", 20):
+        yield limiter
+    limiter.reset()
+
+
+async def _second_user(client):
+    await client.post("/register", json={"email": "b@test.com", "password": "Pass123!B"})
+    resp = await client.post("/login", data={"username": "b@test.com", "password": "Pass123!B"})
+    return {"Authorization": f"Bearer {resp.json()['access_token']}"}
+
+
+class TestRoutes:
+    async def test_priced_endpoints_cost_more(self, client, auth_headers, limited):
+        assert COST_PRICED == 10
+        for _ in range(2):
+            assert (await client.get("/dashboard", headers=auth_headers)).status_code == 200
+
+        resp = await client.get("/dashboard", headers=auth_headers)
+        assert resp.status_code == 429
+        assert int(resp.headers["retry-after"]) >= 1
+        # a cheap list call doesn't fit either: the budget is spent
+        assert (await client.get("/portfolios", headers=auth_headers)).status_code == 429
+
+    async def test_list_endpoints_are_cheap(self, client, auth_headers, limited):
+        for _ in range(20):
+            assert (await client.get("/portfolios", headers=auth_headers)).status_code == 200
+        assert (await client.get("/portfolios", headers=auth_headers)).status_code == 429
+
+    async def test_budget_is_per_user(self, client, auth_headers, limited):
+        other = await _second_user(client)
+        limited.points = 60  # two exports
+        for _ in range(2):
+            await client.get("/budget/export/csv", headers=auth_headers)
+        assert (await client.get("/budget/export/csv", headers=auth_headers)).status_code == 429
+        assert (await client.get("/budget/export/csv", headers=other)).status_code == 200
+
+    async def test_unauthenticated_is_401(self, client, limited):
+        assert (await client.get("/dashboard")).status_code == 401
+
+
+class TestSlidingWindow:
+    def _at(self, seconds):
+        return patch("app.limiter.time.time", return_value=seconds)
+
+    async def test_previous_window_decays(self):
+        rl = SlidingWindowLimiter(points=10, window=60)
+        with self._at(59):
+            for _ in range(10):
+                assert await rl.hit("u", 1) is None
+            assert await rl.hit("u", 1) == pytest.approx(1 / 10 * 60 + 1, abs=1)
+        # just after the boundary nearly all of the previous window still counts
+        with self._at(61):
+            assert await rl.hit("u", 1) is not None
+        # half way through, half of it does
+        with self._at(90):
+            for _ in range(5):
+                assert await rl.hit("u", 1) is None
+            assert await rl.hit("u", 1) is not None
+        # two windows later it's all gone
+        with self._at(180):
+            for _ in range(10):
+                assert await rl.hit("u", 1) is None
+
+    def test_retry_after(self):
+        # previous window full, 30s into the current one: 5 points carried
+        assert retry_after(10, 0, 30, 1, 10, 60) == 0
+        assert retry_after(10, 5, 30, 1, 10, 60) == pytest.approx(6.0)
+        # nothing carried: wait for the window to roll over and decay
+        assert retry_after(0, 10, 30, 5, 10, 60) == pytest.approx(30 + 30)
+        assert retry_after(0, 0, 0, 50, 10, 60) == 120
+
+    async def test_redis_counts_shared(self):
+        redis = AsyncMock()
+        redis.eval.return_value = [0, "10", "5", "30"]
+        rl = SlidingWindowLimiter(points=10, window=60, redis_getter=lambda: redis)
+
+        assert await rl.hit("u", 1) == pytest.approx(6.0)
+        args = redis.eval.call_args.args
+        assert args[1:] == (1, "rl:u", 60, 10, 1)
+
+    async def test_redis_errors_fall_back_to_local(self):
+        redis = AsyncMock()
+        redis.eval.side_effect = ConnectionError("redis down")
+        rl = SlidingWindowLimiter(points=2, window=60, redis_getter=lambda: redis)
+
+        assert await rl.hit("u", 1) is None
+        assert await rl.hit("u", 1) is None
+        assert await rl.hit("u", 1) is not None
@@ -0,0 +1,51 @@
+"""Tests for startup migrations (app/schema.py)"""
+import asyncio
+
+from alembic import command
+from alembic.script import ScriptDirectory
+from sqlalchemy import inspect, text
+
+from app import schema
+from app.models import Base
+
+
+def _head() -> str:
+    return ScriptDirectory.from_config(schema._config()).get_current_head()
+
+
+async def _version(engine) -> str:
+    async with engine.connect() as conn:
+        return (await conn.execute(text("SELECT version_num FROM alembic_version"))).scalar_one()
+
+
+async def _tables(engine) -> set:
+    async with engine.connect() as conn:
+        return set(await conn.run_sync(lambda sync_conn: inspect(sync_conn).get_table_names()))
+
+
+class TestUpgrade:
+    async def test_empty_database_gets_every_table(self, migrated_engine):
+        await schema.upgrade(migrated_engine)
+
+        assert await _version(migrated_engine) == _head()
+        assert set(Base.metadata.tables) <= await _tables(migrated_engine)
+
+    async def test_adopts_create_all_database(self, migrated_engine):
+        async with migrated_engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+        await schema.upgrade(migrated_engine)
+        await schema.upgrade(migrated_engine)
+
+        assert await _version(migrated_engine) == _head()
+
+    async def test_adopts_database_from_before_migrations(self, migrated_engine):
+        # What create_all made on deploys that never ran alembic
+        await asyncio.to_thread(command.upgrade, schema._config(), schema.INITIAL_REVISION)
+        async with migrated_engine.begin() as conn:
+            await conn.execute(text("DROP TABLE alembic_version"))
+
+        await schema.upgrade(migrated_engine)
+
+        assert await _version(migrated_engine) == _head()
+        assert {"tax_lots", "realized_gains", "export_jobs"} <= await _tables(migrated_engine)
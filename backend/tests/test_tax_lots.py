@@ -0,0 +1,161 @@
+"""Tests for tax lots, realized P&L and /portfolios/{id}/realized"""
+import asyncio
+import importlib.util
+import pytest
+from datetime import datetime
+from pathlib import Path
+
+from alembic import command
+from sqlalchemy import select, text, update
+
+from app.models import PortfolioEntry, TaxLot, RealizedGain
+from app import schema
+
+
+async def _portfolio(client, auth_headers, method="fifo"):
+    resp = await client.post("/portfolios", json={
+        "name": "Lots", "type": "crypto", "cost_basis_method": method
+    }, headers=auth_headers)
+    assert resp.status_code == 200
+    return resp.json()["id"]
+
+
+async def _fills(client, auth_headers, portfolio_id, fills):
+    """(type, quantity, price) fills of one BTC entry, the first one a buy"""
+    _, quantity, price = fills[0]
+    entry = (await client.post(f"/portfolios/{portfolio_id}/entries", json={
+        "symbol": "BTC", "amount": quantity, "purchase_price": price
+    }, headers=auth_headers)).json()
+    for tx_type, quantity, price in fills[1:]:
+        resp = await client.post(f"/portfolios/{portfolio_id}/transactions", json={
+            "symbol": "BTC", "quantity": quantity, "price": price,
+            "type": tx_type, "portfolio_entry_id": entry["id"]
+        }, headers=auth_headers)
+        assert resp.status_code == 200
+    return entry["id"]
+
+
+class TestCostBasisMethods:
+    @pytest.mark.parametrize("method,expected", [
+        ("fifo", 200.0),      # sells the 100 lot
+        ("lifo", 100.0),      # sells the 200 lot
+        ("average", 150.0),   # sells at the 150 average
+    ])
+    async def test_realized_by_method(self, client, auth_headers, method, expected):
+        portfolio_id = await _portfolio(client, auth_headers, method)
+        await _fills(client, auth_headers, portfolio_id, [
+            ("buy", 1, 100), ("buy", 1, 200), ("sell", 1, 300),
+        ])
+
+        resp = await client.get(f"/portfolios/{portfolio_id}/realized", headers=auth_headers)
+
+        assert resp.status_code == 200
+        report = resp.json()
+        assert report["cost_basis_method"] == method
+        assert report["total_realized_pl"] == pytest.approx(expected)
+        assert report["items"][0]["realized_pl_total"] == pytest.approx(expected)
+
+    async def test_sell_spans_lots_and_updates_remaining(self, client, auth_headers, db_session):
+        portfolio_id = await _portfolio(client, auth_headers, "fifo")
+        entry_id = await _fills(client, auth_headers, portfolio_id, [
+            ("buy", 1, 100), ("buy", 2, 200), ("sell", 2, 250),
+        ])
+
+        lots = (await db_session.execute(
+            select(TaxLot).where(TaxLot.portfolio_entry_id == entry_id).order_by(TaxLot.id)
+        )).scalars().all()
+        assert [float(lot.remaining) for lot in lots] == [0.0, 1.0]
+
+        gain = (await db_session.execute(select(RealizedGain))).scalars().one()
+        assert float(gain.cost_basis) == 300.0
+        assert float(gain.realized_pl) == 200.0
+
+        entry = (await client.get(f"/portfolios/{portfolio_id}/entries", headers=auth_headers)).json()[0]
+        assert entry["realized_pl"] == 200.0
+
+    async def test_invalid_method(self, client, auth_headers):
+        resp = await client.post("/portfolios", json={
+            "name": "X", "type": "crypto", "cost_basis_method": "hifo"
+        }, headers=auth_headers)
+        assert resp.status_code == 400
+
+
+class TestRealizedReport:
+    async def test_year_filter(self, client, auth_headers, db_session):
+        portfolio_id = await _portfolio(client, auth_headers)
+        await _fills(client, auth_headers, portfolio_id, [("buy", 2, 100), ("sell", 1, 150)])
+        await db_session.execute(update(RealizedGain).values(date=datetime(2024, 6, 1)))
+        await db_session.commit()
+
+        in_year = (await client.get(
+            f"/portfolios/{portfolio_id}/realized", params={"year": 2024}, headers=auth_headers
+        )).json()
+        other_year = (await client.get(
+            f"/portfolios/{portfolio_id}/realized", params={"year": 2025}, headers=auth_headers
+        )).json()
+
+        assert in_year["items"][0]["proceeds"] == 150.0
+        assert in_year["total_realized_pl"] == 50.0
+        assert other_year["items"] == [] and other_year["total_realized_pl"] == 0.0
+
+    async def test_query_count_flat_as_sells_grow(self, client, auth_headers, count_queries):
+        few = await _portfolio(client, auth_headers)
+        await _fills(client, auth_headers, few, [("buy", 10, 100), ("sell", 1, 110)])
+        many = await _portfolio(client, auth_headers)
+        await _fills(client, auth_headers, many, [("buy", 10, 100)] + [("sell", 0.5, 110)] * 15)
+
+        with count_queries() as one:
+            await client.get(f"/portfolios/{few}/realized", headers=auth_headers)
+        with count_queries() as lots:
+            resp = await client.get(f"/portfolios/{many}/realized", headers=auth_headers)
+
+        assert resp.json()["total_realized_pl"] == pytest.approx(75.0)
+        assert lots.value == one.value
+
+    async def test_other_users_portfolio_not_found(self, client, auth_headers):
+        resp = await client.get("/portfolios/999/realized", headers=auth_headers)
+        assert resp.status_code == 404
+
+
+def _migration(name: str):
+    """Load a module of alembic/versions"""
+    path = Path(__file__).resolve().parents[1] / "alembic" / "versions" / f"{name}.py"
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class TestBackfill:
+    """Migration 004 builds lots for transactions recorded before tax_lots existed"""
+
+    async def test_builds_fifo_lots_for_existing_transactions(self, migrated_engine):
+        await asyncio.to_thread(command.upgrade, schema._config(), "003_portfolio_snapshots")
+        async with migrated_engine.begin() as conn:
+            await conn.execute(text("INSERT INTO users (id, email, hashed_password) VALUES ('u1', 'old@example.com', 'x')"))
+            await conn.execute(text("INSERT INTO portfolios (id, user_id, name, type) VALUES (1, 'u1', 'Old', 'crypto')"))
+            await conn.execute(text(
+                "INSERT INTO portfolio_entries (id, portfolio_id, symbol, amount, purchase_price) "
+                "VALUES (1, 1, 'ETH', 1, 150)"
+            ))
+            await conn.execute(text(
+                "INSERT INTO transactions (id, portfolio_entry_id, symbol, quantity, price, type, date) VALUES "
+                "('t1', 1, 'ETH', 1, 100, 'buy', '2026-01-01 00:00:00'), "
+                "('t2', 1, 'ETH', 1, 200, 'buy', '2026-01-02 00:00:00'), "
+                "('t3', 1, 'ETH', 1, 250, 'sell', '2026-01-03 00:00:00')"
+            ))
+
+        await schema.upgrade(migrated_engine)
+        # Running the data step again adds nothing
+        async with migrated_engine.begin() as conn:
+            for statement in _migration("004_tax_lots").backfill_statements():
+                await conn.execute(statement)
+
+        async with migrated_engine.connect() as conn:
+            lots = (await conn.execute(select(TaxLot.remaining).order_by(TaxLot.acquired_at))).scalars().all()
+            gains = (await conn.execute(select(RealizedGain.cost_basis, RealizedGain.realized_pl))).all()
+            entry_realized = (await conn.execute(select(PortfolioEntry.realized_pl))).scalar_one()
+
+        assert [float(remaining) for remaining in lots] == [0.0, 1.0]
+        assert [(float(cost), float(realized)) for cost, realized in gains] == [(100.0, 150.0)]
+        assert float(entry_realized) == 150.0
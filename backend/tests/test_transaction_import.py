@@ -0,0 +1,136 @@
+"""Tests for POST /portfolios/{id}/transactions/import"""
+import json
+import pytest
+from unittest.mock import patch
+
+from sqlalchemy import select, func
+
+from app.models import Transaction, RealizedGain
+
+
+async def _portfolio(client, auth_headers, method="fifo"):
+    resp = await client.post("/portfolios", json={
+        "name": "Import", "type": "crypto", "cost_basis_method": method
+    }, headers=auth_headers)
+    return resp.json()["id"]
+
+
+async def _upload(client, auth_headers, portfolio_id, content: str, filename="trades.csv", **params):
+    return await client.post(
+        f"/portfolios/{portfolio_id}/transactions/import",
+        files={"file": (filename, content.encode(), "text/plain")},
+        params=params,
+        headers=auth_headers,
+    )
+
+
+class TestCsvImport:
+    async def test_imports_rows_and_updates_entries(self, client, auth_headers, db_session):
+        portfolio_id = await _portfolio(client, auth_headers)
+        content = (
+            "Symbol,Type,Quantity,Price,Date\n"
+            "btc,buy,1,100,2026-01-01T10:00:00\n"
+            "BTC,buy,1,200,2026-01-02T10:00:00Z\n"
+            "ETH,buy,10,5,2026-01-02\n"
+            "BTC,sell,0.5,300,2026-01-03\n"
+        )
+
+        resp = await _upload(client, auth_headers, portfolio_id, content)
+
+        assert resp.status_code == 200
+        assert resp.json() == {"imported": 4, "failed": 0, "entries_updated": 2, "errors": []}
+        entries = {e["symbol"]: e for e in (await client.get(
+            f"/portfolios/{portfolio_id}/entries", headers=auth_headers
+        )).json()}
+        assert entries["BTC"]["amount"] == 1.5
+        assert entries["BTC"]["purchase_price"] == 150.0
+        assert entries["ETH"]["amount"] == 10.0
+        # Lots rebuilt: FIFO sells half of the 100 lot
+        gain = (await db_session.execute(select(RealizedGain))).scalars().one()
+        assert float(gain.realized_pl) == 100.0
+
+    async def test_bad_rows_are_reported_and_skipped(self, client, auth_headers, db_session):
+        portfolio_id = await _portfolio(client, auth_headers)
+        content = (
+            "symbol,type,quantity,price\n"
+            "BTC,buy,1,100\n"
+            "BTC,hold,1,100\n"
+            "BTC,buy,abc,100\n"
+            "BTC,sell,5,100\n"
+            "SOL,sell,1,10\n"
+            "BTC,buy,-1,100\n"
+        )
+
+        body = (await _upload(client, auth_headers, portfolio_id, content)).json()
+
+        assert body["imported"] == 1 and body["failed"] == 5
+        assert [e["line"] for e in body["errors"]] == [3, 4, 5, 6, 7]
+        assert "Insufficient balance" in body["errors"][2]["error"]
+        count = await db_session.scalar(select(func.count()).select_from(Transaction))
+        assert count == 1
+
+    async def test_oversized_field_is_a_row_error(self, client, auth_headers):
+        portfolio_id = await _portfolio(client, auth_headers)
+        content = (
+            "symbol,type,quantity,price\n"
+            "BTC,buy,1,100\n"
+            f"BTC,buy,1,{'9' * 200_000}\n"
+            "BTC,buy,1,200\n"
+        )
+
+        resp = await _upload(client, auth_headers, portfolio_id, content)
+
+        assert resp.status_code == 200
+        body = resp.json()
+        assert body["imported"] == 2 and body["failed"] == 1
+        assert body["errors"][0]["line"] == 3
+        assert "field larger than field limit" in body["errors"][0]["error"]
+
+    async def test_missing_columns(self, client, auth_headers):
+        portfolio_id = await _portfolio(client, auth_headers)
+        resp = await _upload(client, auth_headers, portfolio_id, "symbol,quantity\nBTC,1\n")
+        assert resp.status_code == 400
+        assert "price" in resp.json()["detail"]
+
+    async def test_written_in_batches_with_one_commit(self, client, auth_headers, db_session, count_queries):
+        portfolio_id = await _portfolio(client, auth_headers)
+        rows = "".join(f"BTC,buy,1,{100 + i}\n" for i in range(25))
+
+        with patch("app.transaction_import.IMPORT_BATCH_SIZE", 10), \
+                patch.object(db_session, "commit", wraps=db_session.commit) as commit:
+            resp = await _upload(client, auth_headers, portfolio_id, "symbol,type,quantity,price\n" + rows)
+
+        assert resp.json()["imported"] == 25
+        assert commit.call_count == 1
+
+        with patch("app.transaction_import.IMPORT_BATCH_SIZE", 10), count_queries() as queries:
+            await _upload(client, auth_headers, portfolio_id, "symbol,type,quantity,price\n" + rows * 4)
+        # 3 batches vs 10 batches: statements grow with batches, not rows
+        assert queries.value < 100
+
+    async def test_foreign_portfolio(self, client, auth_headers):
+        resp = await _upload(client, auth_headers, 999, "symbol,type,quantity,price\n")
+        assert resp.status_code == 404
+
+
+class TestNdjsonImport:
+    async def test_detected_from_extension(self, client, auth_headers):
+        portfolio_id = await _portfolio(client, auth_headers)
+        content = "\n".join([
+            json.dumps({"symbol": "BTC", "type": "buy", "quantity": "2", "price": 100}),
+            "",
+            "{not json",
+            json.dumps(["BTC"]),
+            json.dumps({"symbol": "BTC", "type": "sell", "quantity": 1, "price": 120}),
+        ])
+
+        body = (await _upload(client, auth_headers, portfolio_id, content, filename="trades.ndjson")).json()
+
+        assert body["imported"] == 2
+        assert [e["line"] for e in body["errors"]] == [3, 4]
+
+    async def test_explicit_format(self, client, auth_headers):
+        portfolio_id = await _portfolio(client, auth_headers)
+        content = json.dumps({"symbol": "ETH", "type": "buy", "quantity": 1, "price": 10})
+        resp = await _upload(client, auth_headers, portfolio_id, content, filename="upload.txt", format="ndjson")
+        assert resp.json()["imported"] == 1
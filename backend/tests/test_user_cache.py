@@ -0,0 +1,70 @@
+"""Tests for the authenticated-user cache"""
+import uuid
+import pytest
+
+from sqlalchemy import select
+
+from app.models import User
+from app.user_cache import Principal, user_cache
+
+
+class TestPrincipal:
+    async def test_cached_user_skips_the_users_query(self, client, auth_headers, count_queries):
+        missing = f"/exports/{uuid.uuid4()}"
+        user_cache.clear()
+        hits = user_cache.stats()["hits"]
+
+        with count_queries() as cold:
+            assert (await client.get(missing, headers=auth_headers)).status_code == 404
+        with count_queries() as warm:
+            assert (await client.get(missing, headers=auth_headers)).status_code == 404
+
+        assert cold.value == 2 and warm.value == 1
+        assert user_cache.stats()["hits"] == hits + 1
+
+    async def test_me_still_reads_the_row(self, client, auth_headers, registered_user):
+        resp = await client.get("/me", headers=auth_headers)
+        assert resp.json()["email"] == registered_user["email"]
+        assert await user_cache.get(registered_user["id"]) == Principal(
+            uuid.UUID(registered_user["id"]), registered_user["email"]
+        )
+
+    async def test_deleted_user_is_rejected(self, client, auth_headers, db_session):
+        assert (await client.get("/portfolios", headers=auth_headers)).status_code == 200
+
+        user = (await db_session.execute(select(User))).scalars().one()
+        await db_session.delete(user)
+        await db_session.commit()
+
+        assert (await client.get("/portfolios", headers=auth_headers)).status_code == 401
+
+    async def test_changed_user_is_reloaded(self, client, auth_headers, db_session, registered_user):
+        await client.get("/portfolios", headers=auth_headers)
+        user = (await db_session.execute(select(User))).scalars().one()
+        user.email = "renamed@example.com"
+        await db_session.commit()
+
+        assert await user_cache.get(registered_user["id"]) is None
+        await client.get("/portfolios", headers=auth_headers)
+        assert (await user_cache.get(registered_user["id"])).email == "renamed@example.com"
+
+
+class TestRedisTier:
+    async def test_shared_through_redis(self, fake_redis):
+        principal = Principal(uuid.uuid4(), "a@example.com")
+        await user_cache.set(principal)
+        key = f"user:{principal.id}"
+        assert key in fake_redis.store
+
+        user_cache.clear()  # another worker: cold L1, warm Redis
+        assert await user_cache.get(str(principal.id)) == principal
+
+        await user_cache.invalidate(principal.id)
+        assert key not in fake_redis.store
+        assert await user_cache.get(str(principal.id)) is None
+
+    async def test_redis_down_falls_back_to_memory(self, fake_redis):
+        fake_redis.fail = True
+        principal = Principal(uuid.uuid4(), "a@example.com")
+        await user_cache.set(principal)
+        assert await user_cache.get(str(principal.id)) == principal
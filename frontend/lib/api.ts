@@ -91,6 +91,7 @@ export interface PortfolioItemSummary {
   total_value: number | null;
   profit_loss: number | null;
   profit_loss_percentage: number | null;
+  transaction_count?: number;
   transactions: TransactionWithPL[];
 }
 
@@ -298,7 +299,10 @@ class ApiClient {
   }
 
   async getPortfolioSummary(portfolioId: number): Promise<PortfolioSummary> {
-    const response = await this.client.get(`/portfolios/${portfolioId}/summary`);
+    // Per-transaction rows are opt-in; fetch the latest page for the expandable view
+    const response = await this.client.get(`/portfolios/${portfolioId}/summary`, {
+      params: { include_transactions: true, limit: 500 },
+    });
     return response.data;
   }
 
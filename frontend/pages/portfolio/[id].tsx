@@ -352,7 +352,7 @@ export default function PortfolioDetailPage() {
                                                             <span className="crypto-symbol text-lg">{item.symbol}</span>
                                                             {hasTx && (
                                                                 <span className="ml-2 text-xs" style={{ color: 'var(--foreground-muted)' }}>
-                                                                    ({item.transactions.length} сделок)
+                                                                    ({item.transaction_count ?? item.transactions.length} сделок)
                                                                 </span>
                                                             )}
                                                         </td>
@@ -11,6 +11,7 @@ export interface PortfolioSummary {
   total_current_value: number;
   total_profit_loss: number;
   total_profit_loss_percentage: number;
+  prices_as_of?: string | null;
 }
 
 export interface PortfolioItem {
@@ -18,6 +19,7 @@ export interface PortfolioItem {
   amount: number;
   purchase_price: number;
   current_price: number | null;
+  price_as_of?: string | null;
   total_value: number | null;
   profit_loss: number | null;
   profit_loss_percentage: number | null;